@@ -0,0 +1,10 @@
+# benchmarks/
+#
+# Performance benchmarks for the Wabbit compiler.  These are not part of
+# the test suite.  Run them from the top level directory of the repo,
+# for example:
+#
+#     python3 -m benchmarks.scaling
+#
+# benchmarks/generate.py makes synthetic Wabbit programs of a given
+# shape and size for the benchmarks to work on.
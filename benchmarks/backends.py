@@ -0,0 +1,118 @@
+# benchmarks/backends.py
+#
+# Run the same programs with each way of executing Wabbit: the
+# interpreter (wabbit/interp.py), the C backend through run_c() with a
+# warm cache, the LLVM JIT through run_jit() and the Wasm backend
+# through wabbit/wasmrun.py.  Wasm is run with wasmtime when it is
+# installed and with the pure-Python interpreter in any case.  Reports
+# the best time of each and checks that they all print the same.
+# tests/Func/fib.wb is run with LAST lowered to --last, since its 30
+# recursive fibs take a minute in the interpreters.
+#
+# Usage:
+#
+#     python3 -m benchmarks.backends [-r repeat] [--last n] [--threshold n]
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+from wabbit.c import run_c
+from wabbit.cache import ObjectCache
+from wabbit.interp import interpret_program
+from wabbit.llvm import run_jit
+from wabbit.parse import parse_file, parse_source
+from wabbit.typecheck import check_program
+from wabbit.wasm import encode_module, generate_program, optimize_module
+from wabbit.wasmrun import run_wasm, wasmtime
+
+from .c_structured import MANDEL, MANDEL_LOOP
+
+TESTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests')
+
+def capture_fd(func, *args):
+    # Output of a run that writes to file descriptor 1
+    with tempfile.TemporaryFile() as out:
+        sys.stdout.flush()
+        saved = os.dup(1)
+        os.dup2(out.fileno(), 1)
+        try:
+            func(*args)
+        finally:
+            os.dup2(saved, 1)
+            os.close(saved)
+        out.seek(0)
+        return out.read().decode()
+
+def capture_stdout(func, *args):
+    out = io.StringIO()
+    with redirect_stdout(out):
+        func(*args)
+    return out.getvalue()
+
+def wasm_module(model):
+    mod = generate_program(model)
+    optimize_module(mod.module)
+    return encode_module(mod.module)
+
+def best_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, output
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='benchmarks.backends')
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('--last', type=int, default=20)
+    parser.add_argument('--threshold', type=int, default=100)
+    args = parser.parse_args(argv)
+
+    with open(os.path.join(TESTS_DIR, 'Func', 'fib.wb')) as file:
+        fib_source = file.read()
+    programs = {
+        'Func/fib': parse_source(fib_source.replace('LAST = 30', f'LAST = {args.last}')),
+        'Script/fib': parse_file(os.path.join(TESTS_DIR, 'Script', 'fib.wb')),
+        'mandel_loop': parse_source(MANDEL_LOOP.format(threshold=args.threshold)),
+        'Func/mandel': parse_source(MANDEL.format(threshold=args.threshold)),
+    }
+
+    engines = ['interp', 'c', 'llvm -O2', 'wasm python']
+    if wasmtime is not None:
+        engines.append('wasm wasmtime')
+    print(f'== best of {args.repeat} runs, ms')
+    print(f'  {"program":<14}' + ''.join(f'{engine:>15}' for engine in engines))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = ObjectCache(tmpdir, suffix='.so')
+        for name, model in programs.items():
+            check_program(model)
+            data = wasm_module(model)
+            # Build the shared library before timing
+            capture_fd(run_c, model, cache)
+            runs = {
+                'interp': lambda: capture_stdout(interpret_program, model),
+                'c': lambda: capture_fd(run_c, model, cache),
+                'llvm -O2': lambda: capture_fd(run_jit, model, 2),
+                'wasm python': lambda: capture_stdout(run_wasm, data, 'python'),
+                'wasm wasmtime': lambda: capture_stdout(run_wasm, data, 'wasmtime'),
+            }
+            times, outputs = [], {}
+            for engine in engines:
+                elapsed, output = best_time(runs[engine], args.repeat)
+                times.append(elapsed)
+                # The interpreter and the JIT print with "Out: "
+                outputs[engine] = output.replace('Out: ', '')
+            print(f'  {name:<14}' + ''.join(f'{t*1000:>15.1f}' for t in times), flush=True)
+            if len(set(outputs.values())) != 1:
+                print(f'  output differs for {name}: ' +
+                      ', '.join(f'{engine}: {output[:40]!r}' for engine, output in outputs.items()))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,74 @@
+# benchmarks/c_run.py
+#
+# Cost of running programs through the C backend with run_c() (C
+# compiled by cc into a cached shared library) compared to run_jit()
+# in wabbit/llvm.py.  Reports the time of a first run, which has to
+# compile the C code, and of a second run, which loads the library from
+# the cache without calling the C compiler.  Output of the programs is
+# sent to /dev/null.
+#
+# Usage:
+#
+#     python3 -m benchmarks.c_run [--size n]
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+from wabbit.c import run_c
+from wabbit.cache import ObjectCache
+from wabbit.llvm import run_jit
+from wabbit.parse import parse_file, parse_source
+from wabbit.typecheck import check_program
+
+from .generate import generate_program
+
+FIB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                   'tests', 'Func', 'fib.wb')
+
+@contextmanager
+def quiet():
+    # Send file descriptor 1 (and sys.stdout) to /dev/null
+    sys.stdout.flush()
+    saved = os.dup(1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    try:
+        with open(os.devnull, 'w') as sys.stdout:
+            yield
+    finally:
+        sys.stdout = sys.__stdout__
+        os.dup2(saved, 1)
+        os.close(saved)
+        os.close(devnull)
+
+def timed(func, *args):
+    start = time.perf_counter()
+    with quiet():
+        func(*args)
+    return time.perf_counter() - start
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='benchmarks.c_run')
+    parser.add_argument('--size', type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    programs = {'fib.wb': parse_file(FIB)}
+    for shape in ('statements', 'functions'):
+        programs[f'{shape} {args.size}'] = parse_source(generate_program(shape, args.size))
+
+    print(f'  {"program":<20}{"run_c cold ms":>15}{"run_c cached ms":>17}{"run_jit -O2 ms":>16}')
+    for name, model in programs.items():
+        check_program(model)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = ObjectCache(tmpdir, suffix='.so')
+            cold = timed(run_c, model, cache)
+            warm = timed(run_c, model, cache)
+        jit = timed(run_jit, model, 2)
+        print(f'  {name:<20}{cold*1000:>15.1f}{warm*1000:>17.1f}{jit*1000:>16.1f}')
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,178 @@
+# benchmarks/c_structured.py
+#
+# Speed of programs compiled by the C backend (wabbit/c.py) in the
+# goto-only mode and in the structured mode, which keeps loops and if
+# statements as C while and if blocks.  Each program is compiled with
+# cc -O2 in both modes and the best time of running it is reported,
+# along with the time cc took.
+#
+# The parser doesn't handle parentheses or character literals yet, so
+# tests/Script/mandel_loop.wb and tests/Func/mandel.wb are run in the
+# versions below, which compute the same thing but print the number of
+# points in the set on each row instead of drawing it.
+#
+# Usage:
+#
+#     python3 -m benchmarks.c_structured [-r repeat] [--threshold n]
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from wabbit.c import compile_program
+from wabbit.parse import parse_source
+from wabbit.typecheck import check_program
+
+FUNC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        'tests', 'Func')
+
+CONSTANTS = '''
+const xmin = -2.0;
+const xmax = 1.0;
+const ymin = -1.5;
+const ymax = 1.5;
+const width = 80.0;
+const height = 40.0;
+const threshhold = {threshold};
+'''
+
+MANDEL_LOOP = CONSTANTS + '''
+var dx float = xmax - xmin;
+dx = dx / width;
+var dy float = ymax - ymin;
+dy = dy / height;
+var y float = ymax;
+var x float;
+var _x float;
+var _y float;
+var xtemp float;
+var n int;
+var in_mandel bool;
+var count int;
+while y >= ymin {{
+     x = xmin;
+     count = 0;
+     while x < xmax {{
+         _x = 0.0;
+         _y = 0.0;
+         n = threshhold;
+         in_mandel = 1 == 1;
+         while n > 0 {{
+             xtemp = _x*_x - _y*_y + x;
+             _y = 2.0*_x*_y + y;
+             _x = xtemp;
+             n = n - 1;
+             if _x*_x + _y*_y > 4.0 {{
+                 in_mandel = 1 == 0;
+                 n = 0;
+             }}
+         }}
+         if in_mandel {{
+             count = count + 1;
+         }}
+         x = x + dx;
+     }}
+     print count;
+     y = y - dy;
+}}
+'''
+
+MANDEL = CONSTANTS + '''
+func in_mandelbrot(x0 float, y0 float, n int) bool {{
+    var x float = 0.0;
+    var y float = 0.0;
+    var xtemp float;
+    while n > 0 {{
+        xtemp = x*x - y*y + x0;
+        y = 2.0*x*y + y0;
+        x = xtemp;
+        n = n - 1;
+        if x*x + y*y > 4.0 {{
+            return 1 == 0;
+        }}
+    }}
+    return 1 == 1;
+}}
+
+func mandel() int {{
+     var dx float = xmax - xmin;
+     dx = dx / width;
+     var dy float = ymax - ymin;
+     dy = dy / height;
+     var y float = ymax;
+     var x float;
+     var count int;
+     while y >= ymin {{
+         x = xmin;
+         count = 0;
+         while x < xmax {{
+             if in_mandelbrot(x, y, threshhold) {{
+                count = count + 1;
+             }}
+             x = x + dx;
+         }}
+         print count;
+         y = y - dy;
+     }}
+     return 0;
+}}
+
+func main() int {{
+    return mandel();
+}}
+'''
+
+def build(code, exe):
+    source = exe + '.c'
+    with open(source, 'w') as file:
+        file.write(code)
+    start = time.perf_counter()
+    subprocess.run([os.environ.get('CC', 'cc'), '-O2', '-fwrapv', '-o', exe, source], check=True)
+    return time.perf_counter() - start
+
+def run(exe, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([exe], stdout=subprocess.PIPE, check=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result.stdout
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='benchmarks.c_structured')
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('--threshold', type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    programs = {
+        'mandel_loop': MANDEL_LOOP.format(threshold=args.threshold),
+        'Func/mandel': MANDEL.format(threshold=args.threshold),
+    }
+    for name in ('fib.wb', 'square.wb'):
+        with open(os.path.join(FUNC_DIR, name)) as file:
+            programs[f'Func/{name[:-3]}'] = file.read()
+
+    print(f'== cc -O2, best of {args.repeat} runs')
+    print(f'  {"program":<14}{"mode":<12}{"cc ms":>8}{"run ms":>9}')
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, source in programs.items():
+            model = parse_source(source)
+            check_program(model)
+            outputs = []
+            for mode in ('goto', 'structured'):
+                code = compile_program(model, structured=mode == 'structured')
+                exe = os.path.join(tmpdir, f'{name.replace("/", "-")}-{mode}')
+                cc_elapsed = build(code, exe)
+                elapsed, output = run(exe, args.repeat)
+                outputs.append(output)
+                print(f'  {name:<14}{mode:<12}{cc_elapsed*1000:>8.1f}{elapsed*1000:>9.1f}')
+            if outputs[0] != outputs[1]:
+                raise SystemExit(f'The modes printed different output for {name}')
+    print('  output is identical')
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
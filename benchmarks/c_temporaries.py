@@ -0,0 +1,73 @@
+# benchmarks/c_temporaries.py
+#
+# Effect of reusing dead temporaries in the C backend (wabbit/c.py).
+# For generated programs of each shape, compiles to C with and without
+# reuse and reports the temporaries declared, the time taken by
+# compile_program(), and the time the system C compiler takes on the
+# result at -O0 and -O2 with the total size of the stack frames it
+# makes (from -fstack-usage).
+#
+# Usage:
+#
+#     python3 -m benchmarks.c_temporaries [--size n] [--shapes s,s,...]
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+from wabbit.c import compile_program
+from wabbit.parse import parse_source
+from wabbit.typecheck import check_program
+
+from .generate import generate_program
+
+def cc_time(code, opt_level, tmpdir, repeat=3):
+    # Best time to compile code to an object file, and the size of its
+    # stack frames
+    source = os.path.join(tmpdir, 'out.c')
+    with open(source, 'w') as file:
+        file.write(code)
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([os.environ.get('CC', 'cc'), f'-O{opt_level}', '-fwrapv', '-c',
+                        '-fstack-usage', '-o', os.path.join(tmpdir, 'out.o'),
+                        source], check=True, cwd=tmpdir)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    with open(os.path.join(tmpdir, 'out.su')) as file:
+        stack = sum(int(line.split('\t')[1]) for line in file)
+    return best, stack
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='benchmarks.c_temporaries')
+    parser.add_argument('--size', type=int, default=20000)
+    parser.add_argument('--shapes', default='statements,expression,blocks,functions')
+    args = parser.parse_args(argv)
+    sys.setrecursionlimit(10**5)
+
+    print(f'== programs of about {args.size} nodes')
+    print(f'  {"shape":<12}{"reuse":<7}{"temps":>7}{"gen ms":>9}'
+          f'{"cc -O0 ms":>11}{"stack":>8}{"cc -O2 ms":>11}{"stack":>8}')
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for shape in args.shapes.split(','):
+            model = parse_source(generate_program(shape, args.size))
+            check_program(model)
+            for reuse in (False, True):
+                start = time.perf_counter()
+                code = compile_program(model, reuse_temporaries=reuse)
+                elapsed = time.perf_counter() - start
+                temps = len(re.findall(r'^    \w+ _[a-z]\d+;$', code, re.MULTILINE))
+                row = f'  {shape:<12}{"yes" if reuse else "no":<7}{temps:>7}' \
+                      f'{elapsed*1000:>9.1f}'
+                for opt_level in (0, 2):
+                    cc_elapsed, stack = cc_time(code, opt_level, tmpdir)
+                    row += f'{cc_elapsed*1000:>11.1f}{stack:>8}'
+                print(row)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,91 @@
+# benchmarks/check_cache.py
+#
+# Time to type check generated programs with and without a CheckCache,
+# as when a program is checked again after every edit.  For each shape,
+# reports the best time of:
+#
+#     parse      parse_source_spans(), which both ways pay first
+#     check      check_program() on the new model
+#     cold       check_cached() with an empty cache
+#     reparse    check_cached() on a new parse of the same text
+#     edit       check_cached() on a new parse after changing the first
+#                print statement
+#
+# Only top-level functions are cached, so shapes without functions
+# should take about as long with the cache as without.
+#
+# Usage:
+#
+#     python3 -m benchmarks.check_cache [-r repeat] [--size n] [--shapes shape ...]
+
+import argparse
+import sys
+import time
+
+from wabbit.model import count_nodes
+from wabbit.parse import parse_source_spans
+from wabbit.typecheck import CheckCache, CheckContext, check_cached, check_program
+
+from .generate import SHAPES, generate_program
+
+def best(func, text, repeat, before=None):
+    # func is timed on a new parse of text, after running before
+    times = []
+    for _ in range(repeat):
+        if before:
+            before()
+        model, spans = parse_source_spans(text)
+        start = time.perf_counter()
+        func(model, text, spans)
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+def cached(cache):
+    def run(model, text, spans):
+        ctx = CheckContext()
+        check_cached(model, ctx, cache, text, spans)
+        return ctx
+    return run
+
+def check_text(run, text):
+    model, spans = parse_source_spans(text)
+    return run(model, text, spans)
+
+def benchmark(source, repeat, out=sys.stdout):
+    edited = source.replace('print ', 'print 0 + ', 1)
+    start = time.perf_counter()
+    parse_source_spans(source)
+    rows = [('parse', (time.perf_counter() - start) * 1000)]
+    rows.append(('check', best(lambda model, *_: check_program(model), source, repeat)))
+    rows.append(('cold', best(lambda *args: cached(CheckCache())(*args), source, repeat)))
+
+    cache = CheckCache()
+    check_text(cached(cache), source)
+    rows.append(('reparse', best(cached(cache), source, repeat)))
+    rows.append(('edit', best(cached(cache), edited, repeat,
+                              lambda: check_text(cached(cache), source))))
+
+    # The cache must give the same errors as checking from scratch
+    for text in (source, edited):
+        if (check_text(cached(cache), text)._errors
+                != check_program(parse_source_spans(text)[0])._errors):
+            raise SystemExit('Cached check differs')
+    for name, ms in rows:
+        print(f'  {name:<8}{ms:>10.2f} ms', file=out)
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='benchmarks.check_cache')
+    parser.add_argument('-r', dest='repeat', type=int, default=5)
+    parser.add_argument('--size', type=int, default=20000,
+                        help='approximate number of model nodes')
+    parser.add_argument('--shapes', nargs='+', choices=SHAPES,
+                        default=['statements', 'variables', 'functions'])
+    args = parser.parse_args(argv)
+
+    for shape in args.shapes:
+        source = generate_program(shape, args.size)
+        print(f'== {shape}: {count_nodes(parse_source_spans(source)[0])} nodes')
+        benchmark(source, args.repeat)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
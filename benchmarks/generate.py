@@ -0,0 +1,114 @@
+# benchmarks/generate.py
+#
+# Seeded generator for synthetic Wabbit programs.  A program is made in
+# one of several shapes, each of which stresses a different part of the
+# front end:
+#
+#     statements   : A long list of short statements
+#     expression   : A single very long expression
+#     blocks       : Deeply nested if/else blocks
+#     variables    : Many variables, each defined from the previous one
+#     functions    : Many small functions, all called from main()
+#     guarded      : Statements with debug output behind a const flag
+#
+# The size is given as an approximate number of model nodes.  The same
+# seed always gives the same program.
+#
+# Usage:
+#
+#     python3 -m benchmarks.generate shape size [seed]
+
+import random
+
+SHAPES = ('statements', 'expression', 'blocks', 'variables', 'functions', 'guarded')
+
+_ops = ('+', '-', '*')
+
+def generate_program(shape, size, seed=0):
+    rng = random.Random(seed)
+    try:
+        gen = globals()[f'_gen_{shape}']
+    except KeyError:
+        raise ValueError(f'Unknown program shape {shape!r}') from None
+    return ''.join(gen(rng, size))
+
+def _gen_statements(rng, size):
+    names = [f'v{i}' for i in range(8)]
+    for name in names:
+        yield f'var {name} int = {rng.randrange(100)};\n'
+    # Each statement below is about 5 nodes
+    for _ in range(max(size // 5, 1)):
+        name = rng.choice(names)
+        other = rng.choice(names)
+        if rng.random() < 0.5:
+            yield f'{name} = {other} {rng.choice(_ops)} {rng.randrange(100)};\n'
+        else:
+            yield f'print {other} {rng.choice(_ops)} {rng.randrange(100)};\n'
+
+def _gen_expression(rng, size):
+    # Every operand adds an Integer and a BinOp
+    yield 'print 1'
+    for _ in range(max(size // 2, 1)):
+        yield f' {rng.choice(_ops)} {rng.randrange(1, 100)}'
+    yield ';\n'
+
+def _gen_blocks(rng, size):
+    # Every level adds an IfStatement, its condition and an else branch
+    depth = max(size // 7, 1)
+    for level in range(depth):
+        yield f'if {level} < {rng.randrange(100)} {{\n'
+    yield 'print 0;\n'
+    for level in reversed(range(depth)):
+        yield f'}} else {{\nprint {level};\n}}\n'
+
+def _gen_variables(rng, size):
+    yield 'var v0 int = 0;\n'
+    for i in range(1, max(size // 4, 2)):
+        yield f'var v{i} int = v{i-1} {rng.choice(_ops)} {rng.randrange(1, 100)};\n'
+
+def _gen_functions(rng, size):
+    # Every function is about 40 nodes, plus a call from main()
+    count = max(size // 40, 1)
+    for i in range(count):
+        yield f'func f{i}(x int, y int) int {{\n'
+        yield f'var a int = x {rng.choice(_ops)} {rng.randrange(1, 100)};\n'
+        yield 'while a < y {\n'
+        yield f'a = a + {rng.randrange(1, 10)};\n'
+        yield 'print a;\n'
+        yield '}\n'
+        yield f'return a * {rng.randrange(100)} - y;\n'
+        yield '}\n'
+    yield 'func main() int {\n'
+    for i in range(count):
+        yield f'print f{i}({rng.randrange(100)}, {rng.randrange(100, 200)});\n'
+    yield 'return 0;\n'
+    yield '}\n'
+
+def _gen_guarded(rng, size):
+    # Like statements, but every other one is followed by a block that
+    # only runs with DEBUG on, which is about 14 nodes
+    yield 'const DEBUG = 1 == 0;\n'
+    names = [f'v{i}' for i in range(8)]
+    for name in names:
+        yield f'var {name} int = {rng.randrange(100)};\n'
+    for n in range(max(size // 12, 1)):
+        name = rng.choice(names)
+        other = rng.choice(names)
+        yield f'{name} = {other} {rng.choice(_ops)} {rng.randrange(100)};\n'
+        if n % 2:
+            yield 'if DEBUG {\n'
+            yield f'var check int = {name} * {rng.randrange(1, 10)};\n'
+            yield f'print check - {other};\n'
+            yield '}\n'
+        else:
+            yield f'print {name};\n'
+
+def main(argv):
+    if len(argv) not in (3, 4):
+        raise SystemExit('Usage: benchmarks.generate shape size [seed]')
+    seed = int(argv[3]) if len(argv) == 4 else 0
+    print(generate_program(argv[1], int(argv[2]), seed), end='')
+
+if __name__ == '__main__':
+    import sys
+    main(sys.argv)
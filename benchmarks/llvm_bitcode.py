@@ -0,0 +1,75 @@
+# benchmarks/llvm_bitcode.py
+#
+# Cost of handing a compiled module to another tool as textual IR and
+# as bitcode.  For generated programs of growing size, reports the time
+# to write each format (str() or as_bitcode() plus the file write), the
+# time to read it back (parse_assembly() or parse_bitcode()) and the
+# file size.
+#
+# Usage:
+#
+#     python3 -m benchmarks.llvm_bitcode [-O level] [--sizes n,n,...]
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import llvmlite.binding as llvm
+
+from wabbit.llvm import compile_module, write_bitcode
+from wabbit.parse import parse_source
+from wabbit.typecheck import check_program
+
+from .generate import generate_program
+
+def best_time(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def write_text(llmod, filename):
+    with open(filename, 'w') as file:
+        file.write(str(llmod))
+
+def benchmark(size, opt_level, tmpdir, out=sys.stdout):
+    model = parse_source(generate_program('functions', size))
+    check_program(model)
+    llmod = compile_module(model, opt_level)
+    ll = os.path.join(tmpdir, 'out.ll')
+    bc = os.path.join(tmpdir, 'out.bc')
+
+    write_ll = best_time(lambda: write_text(llmod, ll))
+    write_bc = best_time(lambda: write_bitcode(llmod, bc))
+    with open(ll) as file:
+        text = file.read()
+    with open(bc, 'rb') as file:
+        bitcode = file.read()
+    read_ll = best_time(lambda: llvm.parse_assembly(text))
+    read_bc = best_time(lambda: llvm.parse_bitcode(bitcode))
+    for name, write, read, nbytes in (('ll', write_ll, read_ll, len(text)),
+                                      ('bc', write_bc, read_bc, len(bitcode))):
+        print(f'  {size:>8}  {name:<4}{write*1000:>10.1f}{read*1000:>10.1f}'
+              f'{nbytes/1024:>10.0f}', file=out)
+    print(f'  {"":>8}  {"":<4}{write_ll/write_bc:>9.1f}x{read_ll/read_bc:>9.1f}x'
+          f'{len(text)/len(bitcode):>9.1f}x', file=out)
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='benchmarks.llvm_bitcode')
+    parser.add_argument('-O', dest='opt_level', type=int, default=0, choices=range(4))
+    parser.add_argument('--sizes', default='10000,40000,160000',
+                        help='comma separated program sizes in model nodes')
+    args = parser.parse_args(argv)
+
+    print(f'  {"nodes":>8}  {"fmt":<4}{"write ms":>10}{"read ms":>10}{"KiB":>10}')
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for size in map(int, args.sizes.split(',')):
+            benchmark(size, args.opt_level, tmpdir)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
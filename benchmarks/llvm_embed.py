@@ -0,0 +1,71 @@
+# benchmarks/llvm_embed.py
+#
+# Cost of calling compiled Wabbit functions from Python through
+# WabbitLibrary.  Times calls of a trivial function, to measure the
+# per-call overhead of ctypes, and of recursive fib, next to the same
+# functions written in Python.
+#
+# Usage:
+#
+#     python3 -m benchmarks.llvm_embed [-n calls]
+
+import argparse
+import sys
+import timeit
+
+from wabbit.llvm import WabbitLibrary
+from wabbit.parse import parse_source
+from wabbit.typecheck import check_program
+
+source = '''
+func square(x int) int {
+    return x * x;
+}
+
+func scale(x float, y float) float {
+    return x * y;
+}
+
+func fib(n int) int {
+    if n < 2 {
+        return 1;
+    }
+    return fib(n - 1) + fib(n - 2);
+}
+'''
+
+def square(x):
+    return x * x
+
+def scale(x, y):
+    return x * y
+
+def fib(n):
+    if n < 2:
+        return 1
+    return fib(n - 1) + fib(n - 2)
+
+def per_call(func, args, number):
+    best = min(timeit.repeat(lambda: func(*args), number=number, repeat=5))
+    return best / number
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='benchmarks.llvm_embed')
+    parser.add_argument('-n', type=int, default=200000)
+    args = parser.parse_args(argv)
+
+    model = parse_source(source)
+    check_program(model)
+    lib = WabbitLibrary(model)
+
+    print(f'  {"call":<16}{"wabbit ns":>12}{"python ns":>12}{"ratio":>8}')
+    for name, call_args, number in (('square(7)', (7,), args.n),
+                                    ('scale(1.5, 2.0)', (1.5, 2.0), args.n),
+                                    ('fib(20)', (20,), max(args.n // 10000, 5))):
+        func = name.split('(')[0]
+        wabbit = per_call(getattr(lib, func), call_args, number)
+        python = per_call(globals()[func], call_args, number)
+        print(f'  {name:<16}{wabbit*1e9:>12.0f}{python*1e9:>12.0f}{python/wabbit:>8.2f}')
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,81 @@
+# benchmarks/llvm_lazy.py
+#
+# Time to first output and total run time of a program with many
+# functions, compiled all at once (compile_module) and one function at
+# a time as they are called (LazyJIT).  main() calls the first --calls
+# functions of the program.
+#
+# Usage:
+#
+#     python3 -m benchmarks.llvm_lazy [-O level] [--size nodes] [--calls n]
+
+import argparse
+import io
+import sys
+import time
+from contextlib import redirect_stdout
+
+from wabbit.llvm import (LazyJIT, compile_module, create_engine,
+                         function_definitions, run_main_block)
+from wabbit.parse import parse_source
+from wabbit.typecheck import check_program
+
+from .generate import generate_program
+
+class FirstOutput(io.StringIO):
+    # Notes when something is first printed
+    def __init__(self):
+        super().__init__()
+        self.time = None
+
+    def write(self, text):
+        if self.time is None:
+            self.time = time.perf_counter()
+        return super().write(text)
+
+def timed(run):
+    out = FirstOutput()
+    start = time.perf_counter()
+    with redirect_stdout(out):
+        result = run()
+    end = time.perf_counter()
+    return out.time - start, end - start, out.getvalue(), result
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='benchmarks.llvm_lazy')
+    parser.add_argument('-O', dest='opt_level', type=int, default=2, choices=range(4))
+    parser.add_argument('--size', type=int, default=40000,
+                        help='approximate number of model nodes')
+    parser.add_argument('--calls', type=int, default=10,
+                        help='number of functions called by main()')
+    args = parser.parse_args(argv)
+
+    model = parse_source(generate_program('functions', args.size))
+    main_func = model[-1]
+    main_func.body[:] = main_func.body[:args.calls] + main_func.body[-1:]
+    check_program(model)
+
+    def eager():
+        run_main_block(create_engine(compile_module(model, args.opt_level)))
+
+    def lazy():
+        jit = LazyJIT(model, args.opt_level)
+        jit.run()
+        return jit
+
+    functions = len(function_definitions(model))
+    print(f'== {functions} functions, {args.calls} called from main(), -O{args.opt_level}')
+    print(f'  {"mode":<8}{"first output ms":>16}{"total ms":>10}{"compiled":>10}')
+    first, total, eager_out, _ = timed(eager)
+    print(f'  {"eager":<8}{first*1000:>16.1f}{total*1000:>10.1f}{functions:>10}')
+    first, total, lazy_out, jit = timed(lazy)
+    print(f'  {"lazy":<8}{first*1000:>16.1f}{total*1000:>10.1f}'
+          f'{len(jit.compile_times):>10}')
+    if lazy_out != eager_out:
+        raise SystemExit('Lazy compilation changed the output')
+    slowest = max(jit.compile_times, key=jit.compile_times.get)
+    print(f'  slowest lazy compile: {slowest} '
+          f'({jit.compile_times[slowest]*1000:.2f} ms)')
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
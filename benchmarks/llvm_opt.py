@@ -0,0 +1,51 @@
+# benchmarks/llvm_opt.py
+#
+# Effect of the LLVM optimization level on generated code.  For each
+# program, report the number of IR instructions, the compile time and
+# the run time (under run_jit) at -O0 through -O3.  Program output is
+# discarded.
+#
+# Usage:
+#
+#     python3 -m benchmarks.llvm_opt [prog.wb ...]
+#
+# With no arguments a generated program is used.
+
+import contextlib
+import os
+import sys
+import time
+
+from wabbit.llvm import (compile_module, count_instructions, create_engine,
+                         run_main_block)
+from wabbit.parse import parse_file, parse_source
+from wabbit.typecheck import check_program
+
+from .generate import generate_program
+
+def benchmark(name, model, out=sys.stdout):
+    check_program(model)
+    print(f'== {name}', file=out)
+    print(f'  {"level":<6}{"instructions":>14}{"compile ms":>12}{"run ms":>10}', file=out)
+    for opt_level in range(4):
+        start = time.perf_counter()
+        llmod = compile_module(model, opt_level)
+        engine = create_engine(llmod)
+        compiled = time.perf_counter()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            run_main_block(engine)
+        finished = time.perf_counter()
+        print(f'  -O{opt_level:<4}{count_instructions(llmod):>14}'
+              f'{(compiled - start)*1000:>12.1f}{(finished - compiled)*1000:>10.1f}',
+              file=out)
+
+def main(argv):
+    if argv:
+        for filename in argv:
+            benchmark(filename, parse_file(filename))
+    else:
+        benchmark('generated statements (10000 nodes)',
+                  parse_source(generate_program('statements', 10000)))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,58 @@
+# benchmarks/llvm_parallel.py
+#
+# Time to generate and optimize code for a program with many functions
+# using compile_split() with different numbers of worker processes.  The
+# linked module must come out the same for every number of workers.
+# compile_module(), which does the whole program in one module, is timed
+# too for comparison.  Speedups are relative to one worker.
+#
+# Usage:
+#
+#     python3 -m benchmarks.llvm_parallel [-O level] [--size nodes] [--workers n ...]
+
+import argparse
+import os
+import sys
+import time
+
+from wabbit.llvm import compile_module, compile_split, function_definitions
+from wabbit.model import count_nodes
+from wabbit.parse import parse_source
+from wabbit.typecheck import check_program
+
+from .generate import generate_program
+
+def benchmark(model, opt_level, workers_list, out=sys.stdout):
+    print(f'  {"workers":<8}{"compile ms":>12}{"speedup":>9}', file=out)
+    start = time.perf_counter()
+    compile_module(model, opt_level)
+    print(f'  {"module":<8}{(time.perf_counter() - start)*1000:>12.1f}', file=out)
+    serial = reference = None
+    for workers in workers_list:
+        start = time.perf_counter()
+        text = str(compile_split(model, opt_level, workers))
+        elapsed = time.perf_counter() - start
+        if reference is None:
+            serial, reference = elapsed, text
+        elif text != reference:
+            raise SystemExit(f'Output with {workers} workers differs')
+        print(f'  {workers:<8}{elapsed*1000:>12.1f}{serial/elapsed:>9.2f}', file=out)
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='benchmarks.llvm_parallel')
+    parser.add_argument('-O', dest='opt_level', type=int, default=2, choices=range(4))
+    parser.add_argument('--size', type=int, default=40000,
+                        help='approximate number of model nodes')
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    args = parser.parse_args(argv)
+
+    model = parse_source(generate_program('functions', args.size))
+    check_program(model)
+    print(f'== {len(function_definitions(model))} functions, '
+          f'{count_nodes(model)} nodes, -O{args.opt_level}')
+    benchmark(model, args.opt_level, args.workers)
+    print('  output is identical for all numbers of workers')
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,80 @@
+# benchmarks/llvm_pgo.py
+#
+# Effect of profile-guided optimization.  Each program is first run
+# with instrumentation to collect a profile, then compiled at -O2 with
+# and without it.  Reports the number of IR instructions and the best
+# run time (under run_jit) of each build.  Program output is discarded.
+#
+# Usage:
+#
+#     python3 -m benchmarks.llvm_pgo [-r repeat] [prog.wb ...]
+#
+# With no arguments the programs in tests/Func and tests/Script are
+# used.  Programs that don't type check are skipped.
+
+import argparse
+import contextlib
+import glob
+import os
+import sys
+import tempfile
+import time
+
+from wabbit.llvm import (compile_module, count_instructions, create_engine,
+                         read_profile, run_main_block)
+from wabbit.parse import parse_file
+from wabbit.typecheck import check_program
+
+_tests_dir = os.path.join(os.path.dirname(__file__), '..', 'tests')
+
+def run_quietly(engine):
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        run_main_block(engine)
+        return time.perf_counter() - start
+
+def collect_profile(model, filename):
+    os.environ['WABBIT_PROFILE'] = filename
+    try:
+        run_quietly(create_engine(compile_module(model, instrument=True)))
+    finally:
+        del os.environ['WABBIT_PROFILE']
+    return read_profile(filename)
+
+def benchmark(name, model, repeat, profile_file, out=sys.stdout):
+    profile = collect_profile(model, profile_file)
+    times = []
+    for label, options in (('-O2', {}), ('-O2 pgo', {'profile': profile})):
+        llmod = compile_module(model, 2, **options)
+        engine = create_engine(llmod)
+        best = min(run_quietly(engine) for _ in range(repeat))
+        times.append(best)
+        print(f'  {name:<32}{label:<9}{count_instructions(llmod):>8}'
+              f'{best*1000:>10.2f}', file=out)
+    print(f'  {"":<32}{"speedup":<9}{"":>8}{times[0]/times[1]:>10.2f}', file=out)
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='benchmarks.llvm_pgo')
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('files', nargs='*')
+    args = parser.parse_args(argv)
+    files = args.files or sorted(glob.glob(os.path.join(_tests_dir, 'Func', '*.wb')) +
+                                 glob.glob(os.path.join(_tests_dir, 'Script', '*.wb')))
+
+    print(f'  {"program":<32}{"build":<9}{"instrs":>8}{"run ms":>10}')
+    with tempfile.TemporaryDirectory() as tmpdir:
+        profile_file = os.path.join(tmpdir, 'wabbit.profdata')
+        for filename in files:
+            name = os.path.relpath(filename, os.path.join(_tests_dir, '..'))
+            try:
+                model = parse_file(filename)
+                errors = check_program(model)._errors
+            except Exception as err:
+                errors = [err]
+            if errors:
+                print(f'  {name:<32}skipped: {errors[0]}')
+                continue
+            benchmark(name, model, args.repeat, profile_file)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,153 @@
+# benchmarks/runtime_io.py
+#
+# Write system calls made by the buffered runtime in wabbit/runtime.c
+# compared to the stdio runtime it replaced (printf for every print and
+# an fflush after every character).  Each program is linked with both
+# runtimes and a counter that reads the write calls made by the process
+# (syscw in /proc/self/io) at exit, since strace is not always around.
+#
+# The "chars" program prints an 80x40 picture a character at a time,
+# like tests/Script/mandel_loop.wb does.  Wabbit has no character
+# literals, so its main_block is written in C.  The "numbers" program
+# prints ints, floats and bools.
+#
+# Usage:
+#
+#     python3 -m benchmarks.runtime_io [-n prints] [-r repeat]
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from wabbit.llvm import compile_module, host_target_machine
+from wabbit.parse import parse_source
+from wabbit.typecheck import check_program
+
+RUNTIME_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'wabbit')
+
+STDIO_RUNTIME = r'''
+#include <stdio.h>
+
+void _printi(int x) { printf("Out: %i\n", x); }
+void _printf(double x) { printf("Out: %lf\n", x); }
+void _printb(int x) { printf(x ? "Out: true\n" : "Out: false\n"); }
+void _printc(char c) { printf("%c", c); fflush(stdout); }
+void _printu() { printf("Out: ()\n"); }
+void _write_profile(const long long *counters, int n) { }
+'''
+
+# Registered before the first print, so it runs after the runtime's
+# own atexit flush
+SYSCALL_COUNTER = r'''
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+static void report(void) {
+  char line[64];
+  FILE *f;
+  fflush(stdout);
+  f = fopen("/proc/self/io", "r");
+  while (f && fgets(line, sizeof(line), f)) {
+    if (strncmp(line, "syscw:", 6) == 0) {
+      fprintf(stderr, "%s", line + 7);
+    }
+  }
+}
+
+__attribute__((constructor)) static void start(void) {
+  atexit(report);
+}
+'''
+
+CHARS_PROGRAM = r'''
+void _printc(char c);
+
+void main_block(void) {
+  int x, y;
+  for (y = 0; y < 40; y++) {
+    for (x = 0; x < 80; x++) {
+      _printc((x * x + y * y * 4) % 7 ? '.' : '*');
+    }
+    _printc('\n');
+  }
+}
+'''
+
+def numbers_program(n):
+    return f'''
+        var n int = 0;
+        var x float = 0.25;
+        while n < {n} {{
+            print n;
+            print x;
+            print n > 100;
+            x = x + 1.5;
+            n = n + 1;
+        }}
+    '''
+
+def run(exe, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([exe], stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, check=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, int(result.stderr), result.stdout
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='benchmarks.runtime_io')
+    parser.add_argument('-n', type=int, default=100000)
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    model = parse_source(numbers_program(args.n))
+    check_program(model)
+    target_machine = host_target_machine(2, reloc='pic')
+    objcode = target_machine.emit_object(compile_module(
+        model, 2, target_machine=target_machine))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        def write(name, data):
+            path = os.path.join(tmpdir, name)
+            with open(path, 'wb' if isinstance(data, bytes) else 'w') as file:
+                file.write(data)
+            return path
+
+        programs = {
+            'chars': [write('chars.c', CHARS_PROGRAM)],
+            'numbers': [write('numbers.o', objcode)],
+        }
+        runtimes = {
+            'stdio': write('stdio.c', STDIO_RUNTIME),
+            'buffered': os.path.join(RUNTIME_DIR, 'runtime.c'),
+        }
+        counter = write('counter.c', SYSCALL_COUNTER)
+
+        print(f'== {3 * args.n} number prints, 3240 character prints, '
+              'output to a pipe')
+        print(f'  {"program":<10}{"runtime":<10}{"writes":>8}{"run ms":>10}')
+        for program, sources in programs.items():
+            outputs = []
+            for runtime, runtime_source in runtimes.items():
+                exe = os.path.join(tmpdir, f'{program}-{runtime}')
+                subprocess.run([os.environ.get('CC', 'cc'), '-O2', '-o', exe,
+                                *sources, os.path.join(RUNTIME_DIR, 'main.c'),
+                                runtime_source, counter],
+                               check=True)
+                elapsed, writes, output = run(exe, args.repeat)
+                outputs.append(output)
+                print(f'  {program:<10}{runtime:<10}{writes:>8}'
+                      f'{elapsed*1000:>10.1f}')
+            if outputs[0] != outputs[1]:
+                raise SystemExit(f'The runtimes printed different {program}')
+    print('  output is identical')
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,73 @@
+# benchmarks/runtime_ir.py
+#
+# Cost of printing with the runtime in wabbit/runtime.c (an external
+# call per print, stdio buffering) compared to the runtime in
+# wabbit/runtime.ll (linked in and inlined, own output buffer).  Builds
+# a program printing n values at -O2 with each runtime and reports the
+# calls left to runtime functions and the best wall time of running it
+# with output to a pipe.
+#
+# Usage:
+#
+#     python3 -m benchmarks.runtime_ir [-n prints] [-r repeat]
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+from wabbit.llvm import build_executable, compile_module
+from wabbit.parse import parse_source
+from wabbit.typecheck import check_program
+
+def make_program(n):
+    return f'''
+        var n int = 0;
+        var x float = 0.5;
+        while n < {n} {{
+            print n;
+            print x;
+            print n > 100;
+            x = x + 1.0;
+            n = n + 1;
+        }}
+    '''
+
+def run(exe, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([exe], stdout=subprocess.PIPE, check=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result.stdout
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='benchmarks.runtime_ir')
+    parser.add_argument('-n', type=int, default=200000)
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    model = parse_source(make_program(args.n))
+    check_program(model)
+    print(f'== {3 * args.n} prints, -O2')
+    print(f'  {"runtime":<9}{"runtime calls":>14}{"run ms":>10}')
+    outputs = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for runtime in ('c', 'ir'):
+            code = str(compile_module(model, 2, runtime=runtime))
+            calls = len(re.findall(r'call .*@_print', code))
+            exe = build_executable(model, os.path.join(tmpdir, runtime), 2,
+                                   runtime=runtime)
+            elapsed, output = run(exe, args.repeat)
+            outputs.append(output)
+            print(f'  {runtime:<9}{calls:>14}{elapsed*1000:>10.1f}')
+    if outputs[0] != outputs[1]:
+        raise SystemExit('The runtimes printed different output')
+    print('  output is identical')
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,150 @@
+# benchmarks/scaling.py
+#
+# Front end scaling benchmark.  For each program shape made by
+# benchmarks/generate.py, time the tokenizer, parser, type checker and
+# to_source() at increasing program sizes and record the peak memory
+# use of each stage with tracemalloc.  A power law t = c*n**k is then
+# fitted to the measurements.  The run fails if the exponent k of any
+# stage is clearly superlinear, which catches problems such as a
+# reduction that copies a growing list on every step.
+#
+# Usage:
+#
+#     python3 -m benchmarks.scaling [--sizes 1000,10000,...] [--shapes ...]
+
+import argparse
+import gc
+import math
+import sys
+import threading
+import time
+import tracemalloc
+
+from wabbit.model import count_nodes, to_source
+from wabbit.parse import parse_source
+from wabbit.tokenize import tokenize
+from wabbit.typecheck import check_program
+
+from .generate import SHAPES, generate_program
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+
+# Exponent above which a stage is reported as superlinear.  There is
+# some slack for timer noise and allocator effects at small sizes.
+MAX_EXPONENT = 1.25
+
+# Each stage takes the output of the one before it
+STAGES = (
+    ('tokenize', lambda source: list(tokenize(source))),
+    ('parse', parse_source),
+    ('check', lambda model: (check_program(model), model)[1]),
+    ('to_source', to_source),
+)
+
+def run_stages(source, trace_memory=False):
+    # Returns {stage: (seconds, peak bytes)}
+    results = {}
+    for name, func in STAGES:
+        arg = source if name in ('tokenize', 'parse') else model
+        # As with timeit, the garbage collector is kept out of the timings
+        gc.collect()
+        gc.disable()
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        result = func(arg)
+        elapsed = time.perf_counter() - start
+        gc.enable()
+        peak = 0
+        if trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        if name == 'parse':
+            model = result
+        results[name] = (elapsed, peak)
+    return results, model
+
+def fit_exponent(sizes, values):
+    # Least squares slope of log(value) against log(size)
+    points = [(math.log(n), math.log(v)) for n, v in zip(sizes, values) if v > 0]
+    if len(points) < 2:
+        return None
+    mx = sum(x for x, _ in points) / len(points)
+    my = sum(y for _, y in points) / len(points)
+    sxx = sum((x - mx)**2 for x, _ in points)
+    sxy = sum((x - mx)*(y - my) for x, y in points)
+    return sxy / sxx
+
+def _format_exponent(k):
+    # Exponents can't be fitted to fewer than two sizes
+    return '?' if k is None else f'{k:.2f}'
+
+def run_benchmark(shapes, sizes, seed=0, trace_memory=True, out=sys.stdout):
+    failures = []
+    for shape in shapes:
+        print(f'== {shape}', file=out)
+        nodes, times, peaks = [], {}, {}
+        for size in sizes:
+            source = generate_program(shape, size, seed)
+            results, model = run_stages(source)
+            if trace_memory:
+                memory, _ = run_stages(source, trace_memory=True)
+            nodes.append(count_nodes(model))
+            line = [f'{nodes[-1]:>9} nodes']
+            for stage, (elapsed, _) in results.items():
+                peak = memory[stage][1] if trace_memory else 0
+                times.setdefault(stage, []).append(elapsed)
+                peaks.setdefault(stage, []).append(peak)
+                line.append(f'{stage} {elapsed*1000:9.1f} ms {peak/2**20:7.1f} MiB')
+            print('  '.join(line), file=out)
+
+        for stage in times:
+            k = fit_exponent(nodes, times[stage])
+            km = fit_exponent(nodes, peaks[stage]) if trace_memory else None
+            status = 'ok'
+            if k is not None and k > MAX_EXPONENT:
+                status = 'SUPERLINEAR'
+                failures.append((shape, stage, k))
+            print(f'  {stage:<10} time ~ n^{_format_exponent(k)}' +
+                  (f'  memory ~ n^{_format_exponent(km)}' if trace_memory else '') +
+                  f'  {status}', file=out)
+    return failures
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='benchmarks.scaling')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='comma separated program sizes in nodes')
+    parser.add_argument('--shapes', default=','.join(SHAPES),
+                        help='comma separated program shapes')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true',
+                        help='skip the tracemalloc runs')
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(',')]
+    shapes = args.shapes.split(',')
+
+    # Deeply nested programs recurse once per level in the checker and
+    # in to_source(), so run on a thread with a large stack.  An error
+    # on the thread is raised again here, so that the run fails.
+    failures, errors = [], []
+    def run():
+        try:
+            failures.extend(run_benchmark(shapes, sizes, args.seed, not args.no_memory))
+        except BaseException as e:
+            errors.append(e)
+    sys.setrecursionlimit(10**7)
+    threading.stack_size(1 << 30)
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    if errors:
+        raise errors[0]
+
+    for shape, stage, k in failures:
+        print(f'FAIL: {stage} is superlinear on {shape} programs (n^{k:.2f})')
+    if failures:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,100 @@
+# benchmarks/transform.py
+#
+# Effect of wabbit.transform on programs.  For generated programs of
+# each shape and for the mandel programs from benchmarks/c_structured.py,
+# reports the number of model nodes before and after transform(), the
+# time transform() took, and the best time to run the program in the
+# interpreter before and after.  The output of the two runs is compared,
+# except that the interpreter doesn't wrap int overflow the way the
+# compiled code (and constant folding) does, so "expression" programs
+# print differently.
+#
+# INVARIANT below has the kind of loop that hoist_invariants() helps:
+# the inner loop computes 2.0*x*scale and scale*scale, which only
+# change in the outer loop or not at all.  The mandel programs have no
+# such expressions, as everything in their inner loop depends on _x and
+# _y.
+#
+# Usage:
+#
+#     python3 -m benchmarks.transform [-r repeat] [--size n] [--threshold n]
+
+import argparse
+import io
+import sys
+import time
+from contextlib import redirect_stdout
+
+from wabbit.interp import interpret_program
+from wabbit.model import count_nodes
+from wabbit.parse import parse_source
+from wabbit.transform import transform
+from wabbit.typecheck import check_program
+
+from .c_structured import MANDEL, MANDEL_LOOP
+from .generate import SHAPES, generate_program
+
+INVARIANT = '''
+const n = 200;
+var scale float = 0.5;
+var x float = 0.0;
+var total float = 0.0;
+var i int = 0;
+while i < n {
+    var j int = 0;
+    x = x + 0.25;
+    while j < n {
+        total = total + 2.0*x*scale + scale*scale;
+        j = j + 1;
+    }
+    i = i + 1;
+}
+print total;
+'''
+
+def run(model, repeat):
+    best = None
+    for _ in range(repeat):
+        out = io.StringIO()
+        start = time.perf_counter()
+        with redirect_stdout(out):
+            interpret_program(model)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, out.getvalue()
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='benchmarks.transform')
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('--size', type=int, default=5000)
+    parser.add_argument('--threshold', type=int, default=50)
+    args = parser.parse_args(argv)
+    sys.setrecursionlimit(10**6)
+
+    sources = {f'{shape} {args.size}': generate_program(shape, args.size) for shape in SHAPES}
+    sources['mandel_loop'] = MANDEL_LOOP.format(threshold=args.threshold)
+    sources['Func/mandel'] = MANDEL.format(threshold=args.threshold)
+    sources['invariant'] = INVARIANT
+
+    print(f'  {"program":<18}{"nodes":>16}{"transform ms":>14}{"run ms":>20}')
+    for name, source in sources.items():
+        model = parse_source(source)
+        check_program(model)
+        before = count_nodes(model)
+        run_before, output = run(model, args.repeat)
+
+        model = parse_source(source)
+        check_program(model)
+        start = time.perf_counter()
+        model = transform(model)
+        elapsed = time.perf_counter() - start
+        after = count_nodes(model)
+        run_after, new_output = run(model, args.repeat)
+
+        print(f'  {name:<18}{f"{before} -> {after}":>16}{elapsed*1000:>14.1f}'
+              f'{f"{run_before*1000:.1f} -> {run_after*1000:.1f}":>20}')
+        if new_output != output:
+            print(f'  output differs for {name}')
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,130 @@
+# benchmarks/wasm_encode.py
+#
+# Throughput of the Wasm binary encoder in wabbit/wasm.py.  For
+# generated programs of growing size, reports the time to generate the
+# module, the time to encode it and the encoding speed in MB/s and
+# instructions per second.  For comparison, the same module is also
+# encoded the way docs/WebAssembly-Tutorial.md does it, by building and
+# concatenating a byte string for every part.  (Its output differs by a
+# few bytes: it doesn't share function types and its sizes aren't padded
+# to five bytes.)
+#
+# Usage:
+#
+#     python3 -m benchmarks.wasm_encode [--shape shape] [--sizes n,n,...]
+
+import argparse
+import struct
+import sys
+import time
+
+from wabbit.parse import parse_source
+from wabbit.typecheck import check_program
+from wabbit.wasm import _opcodes, encode_module, generate_program, i32
+
+from .generate import generate_program as generate_source
+
+def best_time(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+# ---- Encoding as in the tutorial
+
+def _unsigned(value):
+    parts = []
+    while value:
+        parts.append((value & 0x7f) | 0x80)
+        value >>= 7
+    if not parts:
+        parts.append(0)
+    parts[-1] &= 0x7f
+    return bytes(parts)
+
+def _signed(value):
+    parts = []
+    if value < 0:
+        value = (1 << (value.bit_length() + (7 - value.bit_length() % 7))) + value
+        negative = True
+    else:
+        negative = False
+    while value:
+        parts.append((value & 0x7f) | 0x80)
+        value >>= 7
+    if not parts or (not negative and parts[-1] & 0x40):
+        parts.append(0)
+    parts[-1] &= 0x7f
+    return bytes(parts)
+
+def _vector(items):
+    if isinstance(items, bytes):
+        return _unsigned(len(items)) + items
+    return _unsigned(len(items)) + b''.join(items)
+
+def _section(number, contents):
+    return bytes([number]) + _unsigned(len(contents)) + contents
+
+def _instructions(code):
+    data = b''
+    for ins in code:
+        opcode, kind = _opcodes[ins[0]]
+        data += bytes([opcode])
+        if kind == 'u':
+            data += _unsigned(ins[1])
+        elif kind == 's':
+            data += _signed(ins[1])
+        elif kind == 'f':
+            data += struct.pack('<d', ins[1])
+        elif kind == 'bt':
+            data += bytes([0x40 if ins[1] is None else ins[1]])
+    return data
+
+def encode_module_concat(module):
+    all_funcs = module.imported_functions + module.functions
+    signatures = [b'\x60' + _vector(bytes(f.argtypes)) + _vector(bytes(f.rettypes))
+                  for f in all_funcs]
+    imports = [_vector(f.envname.encode()) + _vector(f.name.encode()) + b'\x00' + _unsigned(f.idx)
+               for f in module.imported_functions]
+    functions = [_unsigned(f.idx) for f in module.functions]
+    globals_ = [bytes([g.type, 1]) + _instructions(
+                    [('i32.const' if g.type == i32 else 'f64.const', g.initializer), ('end',)])
+                for g in module.global_variables]
+    exports = [_vector(f.name.encode()) + b'\x00' + _unsigned(f.idx)
+               for f in module.functions if f.export]
+    bodies = []
+    for f in module.functions:
+        code = _vector([b'\x01' + bytes([t]) for t in f.local_types]) + _instructions(f.code) + b'\x0b'
+        bodies.append(_unsigned(len(code)) + code)
+    return b''.join([b'\x00asm\x01\x00\x00\x00',
+                     _section(1, _vector(signatures)), _section(2, _vector(imports)),
+                     _section(3, _vector(functions)), _section(6, _vector(globals_)),
+                     _section(7, _vector(exports)), _section(10, _vector(bodies))])
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='benchmarks.wasm_encode')
+    parser.add_argument('--shape', default='functions')
+    parser.add_argument('--sizes', default='10000,100000,400000')
+    args = parser.parse_args(argv)
+    sys.setrecursionlimit(10**6)
+
+    print(f'== {args.shape} programs')
+    print(f'  {"nodes":>8}{"instrs":>9}{"bytes":>10}{"gen ms":>9}{"encode ms":>11}'
+          f'{"MB/s":>7}{"Minstr/s":>10}{"concat ms":>11}')
+    for size in (int(s) for s in args.sizes.split(',')):
+        model = parse_source(generate_source(args.shape, size))
+        check_program(model)
+        gen_elapsed, mod = best_time(lambda: generate_program(model), 1)
+        module = mod.module
+        instructions = sum(len(f.code) for f in module.functions)
+        elapsed, data = best_time(lambda: encode_module(module))
+        concat_elapsed, _ = best_time(lambda: encode_module_concat(module))
+        print(f'  {size:>8}{instructions:>9}{len(data):>10}{gen_elapsed*1000:>9.1f}'
+              f'{elapsed*1000:>11.1f}{len(data)/elapsed/1e6:>7.1f}'
+              f'{instructions/elapsed/1e6:>10.2f}{concat_elapsed*1000:>11.1f}')
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
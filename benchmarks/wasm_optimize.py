@@ -0,0 +1,60 @@
+# benchmarks/wasm_optimize.py
+#
+# Effect of optimize_module() in wabbit/wasm.py on the size of the Wasm
+# it produces.  For the programs in tests/Script and tests/Func that
+# parse, and for generated programs of each shape, reports the encoded
+# module size, the number of instructions and the number of locals
+# before and after optimizing, along with the time the optimizer took.
+# The other test programs use syntax the parser doesn't handle yet.
+#
+# Usage:
+#
+#     python3 -m benchmarks.wasm_optimize [--size n]
+
+import argparse
+import os
+import sys
+import time
+
+from wabbit.parse import parse_file, parse_source
+from wabbit.typecheck import check_program
+from wabbit.wasm import encode_module, generate_program, optimize_module
+
+from .generate import SHAPES, generate_program as generate_source
+
+TESTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests')
+
+PROGRAMS = ['Script/cond.wb', 'Script/fact.wb', 'Script/fib.wb', 'Script/floattest.wb',
+            'Script/inttest.wb', 'Func/fib.wb', 'Func/square.wb']
+
+def measure(module):
+    functions = module.functions
+    return (len(encode_module(module)),
+            sum(len(func.code) for func in functions),
+            sum(len(func.local_types) for func in functions))
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='benchmarks.wasm_optimize')
+    parser.add_argument('--size', type=int, default=20000)
+    args = parser.parse_args(argv)
+    sys.setrecursionlimit(10**6)
+
+    programs = {name: parse_file(os.path.join(TESTS_DIR, name)) for name in PROGRAMS}
+    for shape in SHAPES:
+        programs[f'{shape} {args.size}'] = parse_source(generate_source(shape, args.size))
+
+    print(f'  {"program":<22}{"bytes":>18}{"instructions":>19}{"locals":>13}{"opt ms":>9}')
+    for name, model in programs.items():
+        check_program(model)
+        module = generate_program(model).module
+        before = measure(module)
+        start = time.perf_counter()
+        optimize_module(module)
+        elapsed = time.perf_counter() - start
+        after = measure(module)
+        columns = ''.join(f'{f"{b} -> {a}":>{width}}'
+                          for b, a, width in zip(before, after, (18, 19, 13)))
+        print(f'  {name:<22}{columns}{elapsed*1000:>9.1f}')
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -2,9 +2,9 @@
 
 set -e
 
+# Generated LLVM code is run in-process with llvmlite (see run_jit in
+# wabbit/llvm.py). To build an executable with clang instead, use
+#
+#   python3 -m wabbit.llvm prog.wb
+#   clang ./wabbit/main.c ./wabbit/runtime.c ./out.ll
 python3 run_llvm_tests.py
-echo "LLVM program"
-cat ./out.ll
-clang ./wabbit/main.c ./wabbit/runtime.c ./out.ll
-./a.out
-
@@ -6,8 +6,6 @@ if __name__ == '__main__':
     test_vardeclaration()
     test_vardeclaration2()
     test_vardeclaration3()
-
-    # TODO
-    # test_ifstatement()
-    # test_whileloop()
+    test_ifstatement()
+    test_whileloop()
 
@@ -129,64 +129,616 @@
 # problem related to incorrect programs. Assume that all programs
 # are fully correct with respect to their usage of types and names.
 
+
+import ctypes
+import os
+import subprocess
+import sys
+import tempfile
+from collections import ChainMap
+
+from .cache import ObjectCache, default_cache_dir
 from .model import *
 
-counter = 0
-def make_temporary_name():
-    global counter
-    return counter + 1
+# C types of the Wabbit types, and the prefix of the names of their
+# temporaries.  Bools are ints in C and share the int temporaries.
+_ctypes = {'int': 'int', 'float': 'double', 'bool': 'int', 'char': 'char'}
+_temporary_prefixes = {'int': '_i', 'float': '_f', 'bool': '_i', 'char': '_c'}
+_print_formats = {'int': '%i\\n', 'float': '%f\\n', 'char': '%c'}
+
+# Wabbit variables and functions are named w_<name> in the C code, so
+# that they can't clash with C keywords, what <stdio.h> declares or the
+# temporaries and functions made here.
+def _unique_name(name, taken):
+    # A C name for the Wabbit name that isn't in taken (and adds it)
+    base = f'w_{name}'
+    cname, n = base, 1
+    while cname in taken:
+        n += 1
+        cname = f'{base}_{n}'
+    taken.add(cname)
+    return cname
+
+class Temporary:
+    '''
+    A C temporary variable holding the result of one operation.  It is
+    named after all the code of its function is generated, by
+    allocate_temporaries().
+    '''
+    def __init__(self, type):
+        self.type = type
+        self.name = None
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return f'Temporary({self.type}, {self.name})'
+
+# The code of a function is a list of instructions, each one a tuple:
+#
+#     ('code', format, operands, dest)   format.format(*operands); dest is
+#                                        the Temporary it sets (or None)
+#     ('label', name)                    name:
+#     ('goto', name)                     goto name;
+#     ('if', operand, name)              if (operand) goto name;
+#     ('return', operand)                return operand; (return; if None)
+#
+# Code in the structured mode (see compile_program()) uses these instead
+# of labels and gotos:
+#
+#     ('declare', ctype, name)           ctype name;
+#     ('while',)                         while (1) {
+#     ('break_unless', operand)          if (!operand) break;
+#     ('end_while',)                     }
+#     ('begin_if', operand)              if (operand) {
+#     ('else',)                          } else {
+#     ('end_if',)                        }
+#
+# Operands are strings (constants and variable names) or Temporaries.
+
+class WabbitCModule:
+    def __init__(self, structured=False):
+        self.structured = structured
+        self.globals = {}          # declaration -> C name
+        self.global_names = set()  # C names of the global variables
+        self.taken = set()         # C names used at the top level
+        self.env = ChainMap()      # Wabbit name -> C name
+        self.function_names = {}   # Wabbit name -> C name of functions
+        self.functions = []
+        self.labels = 0
+
+    def declare_global(self, node):
+        cname = _unique_name(node.name, self.taken)
+        self.globals[node] = cname
+        self.global_names.add(cname)
+
+    def new_label(self):
+        self.labels += 1
+        return f'L{self.labels}'
+
+class CFunction:
+    def __init__(self, mod, name, type, env):
+        self.mod = mod
+        self.name = name
+        self.type = type
+        self.params = []           # (C type, C name)
+        self.locals = []           # (C type, C name)
+        self.taken = set(mod.taken)
+        self.env = env
+        self.code = []
+        self.temporaries = None    # (C type, name) once allocated
+
+    def declare_local(self, name, type):
+        # Declared at the top of the function, or where it is in the
+        # block in structured mode
+        cname = _unique_name(name, self.taken)
+        if self.mod.structured:
+            self.code.append(('declare', _ctypes[type], cname))
+        else:
+            self.locals.append((_ctypes[type], cname))
+        return cname
+
+    def declare_param(self, name, type):
+        cname = _unique_name(name, self.taken)
+        self.params.append((_ctypes[type], cname))
+        return cname
+
+    def new_temporary(self, type):
+        return Temporary(type)
+
+    def emit(self, format, *operands, dest=None):
+        self.code.append(('code', format, operands, dest))
+
+    def set(self, type, format, *operands):
+        # Emit an operation storing its result in a new temporary
+        dest = self.new_temporary(type)
+        self.emit('{} = ' + format, dest, *operands, dest=dest)
+        return dest
+
+    def label(self, name):
+        self.code.append(('label', name))
+
+    def goto(self, name):
+        self.code.append(('goto', name))
+
+    def goto_if(self, operand, name):
+        self.code.append(('if', operand, name))
+
+    def ret(self, operand=None):
+        self.code.append(('return', operand))
+
+    def pin(self, operand, type):
+        # Copy a global variable into a temporary, for a value that a
+        # function call made before it is used could change
+        if isinstance(operand, str) and operand in self.mod.global_names:
+            return self.set(type, '{};', operand)
+        return operand
+
+    def prototype(self):
+        params = ', '.join(f'{ctype} {cname}' for ctype, cname in self.params)
+        return f'{self.type} {self.name}({params or "void"})'
 
 # Top-level function to handle an entire program.
-def compile_program(model):
-    ...
-
-# Internal function to interpret a node in the environment
-def compile(node, env):
-    # !!! Use interp.py as a template
-
-    # TEMPLATE
-    if isinstance(node, Print):
-	# What is this value?
-        # Problem: value.
-        # "value" is name of a place / literal
-        # Solution: Put the results as a string
-        value = compile(node.expression, env, code)
-
-	# Must generate code to do print
-	value_type = typeof(value) # wishful thinking (what is this?)
-	# Get from type checker!
-
-	if value_type = 'int':
-		stmt = f'printf("%i\\n", {value});\n'
-	if value_type = 'float':
-		stmt = f'printf("%f\\n", {value});\n'
-	if value_type = 'char':
-		stmt = f'printf("%c", {value});\n'
-
-        tempname = make_temporary_name()
-	code.statements.append(code)
-	# Problem: Output code ... maybe like the environment
-	# Issue: where does this code go?
-
-	return tempname # the place where you put the value?
-        # why do we care about this?? (because it will be used in subsequent scripts!)
+def compile_program(model, reuse_temporaries=True, structured=False):
+    '''
+    Compile a type checked model to the source of a C program.  Top-level
+    statements go in main_block(), which calls main() at the end if there
+    is one.  The program's main() calls main_block().
+
+    With reuse_temporaries (the default), temporaries whose values are
+    dead are reused, keeping the number of variables small.
+
+    With structured, loops and if statements are kept as C while and if
+    blocks, with variables declared in the block they belong to, instead
+    of being lowered to gotos.  That shows the C compiler the loops.
+
+    Int arithmetic is meant to wrap around, so the code should be
+    compiled with -fwrapv (see SHARED_FLAGS).
+    '''
+    mod = WabbitCModule(structured)
+    for node in model:
+        if isinstance(node, (DeclareConst, DeclareVar)):
+            mod.declare_global(node)
+        elif isinstance(node, FunctionDefinition):
+            mod.function_names[node.name] = _unique_name(node.name, mod.taken)
+
+    main_block = CFunction(mod, 'main_block', 'void', mod.env)
+    compile(model, main_block)
+    if 'main' in mod.function_names:
+        main_block.emit('{}();', mod.function_names['main'])
+    main_block.ret()
+    mod.functions.append(main_block)
+
+    for func in mod.functions:
+        func.temporaries = allocate_temporaries(func.code, reuse_temporaries)
+
+    lines = ['#include <stdio.h>', '']
+    for node, cname in mod.globals.items():
+        lines.append(f'{_ctypes[node.type]} {cname};')
+    lines.append('')
+    for func in mod.functions:
+        lines.append(func.prototype() + ';')
+    for func in mod.functions:
+        lines.append('')
+        lines.extend(render_function(func))
+    lines.extend(['', 'int main() {', '    main_block();', '    return 0;', '}', ''])
+    return '\n'.join(lines)
+
+def _has_call(node):
+    if isinstance(node, FunctionCall):
+        return True
+    elif isinstance(node, list):
+        return any(_has_call(n) for n in node)
+    elif isinstance(node, (Statement, Expression)):
+        return any(_has_call(value) for value in vars(node).values())
+    return False
+
+def allocate_temporaries(code, reuse=True):
+    '''
+    Give names to the temporaries in code.  Two temporaries can share a
+    name unless one of them is set while the other one is live, which
+    is found by liveness analysis over the instructions and gotos.
+    Without reuse, every temporary gets a name of its own.  Returns the
+    (C type, name) of the variables to declare.
+    '''
+    succs = _successors(code)
+    uses, defs = [], []
+    for ins in code:
+        kind = ins[0]
+        if kind == 'code':
+            operands = ins[2]
+            defs.append(ins[3])
+        else:
+            operands = ins[1:2] if kind in _branch_kinds else ()
+            defs.append(None)
+        uses.append({op for op in operands
+                     if isinstance(op, Temporary) and op is not defs[-1]})
+
+    # Backwards dataflow until nothing changes
+    live_in = [set() for _ in code]
+    live_out = [set() for _ in code]
+    changed = True
+    while changed:
+        changed = False
+        for n in reversed(range(len(code))):
+            out = set()
+            for s in succs[n]:
+                out |= live_in[s]
+            live_out[n] = out
+            if defs[n] is not None:
+                out = out - {defs[n]}
+            new_in = out | uses[n]
+            if new_in != live_in[n]:
+                live_in[n] = new_in
+                changed = True
+
+    # Temporaries interfere when one is set while the other is live
+    order = [dest for dest in defs if dest is not None]
+    interference = {dest: set() for dest in order}
+    for n, dest in enumerate(defs):
+        if dest is not None:
+            for other in live_out[n]:
+                if other is not dest and _temporary_prefixes[other.type] == _temporary_prefixes[dest.type]:
+                    interference[dest].add(other)
+                    interference[other].add(dest)
+
+    counts = {}
+    for temp in order:
+        prefix = _temporary_prefixes[temp.type]
+        if reuse:
+            used = {other.name for other in interference[temp]}
+            number = 1
+            while f'{prefix}{number}' in used:
+                number += 1
+        else:
+            number = counts.get(prefix, 0) + 1
+        counts[prefix] = max(counts.get(prefix, 0), number)
+        temp.name = f'{prefix}{number}'
+
+    ctypes = {prefix: _ctypes[type] for type, prefix in _temporary_prefixes.items()}
+    return [(ctypes[prefix], f'{prefix}{number}')
+            for prefix, count in counts.items() for number in range(1, count + 1)]
+
+# Instructions whose first operand is read
+_branch_kinds = {'if', 'return', 'break_unless', 'begin_if'}
+
+def _successors(code):
+    # Indices of the instructions that can run after each one
+    labels = {ins[1]: n for n, ins in enumerate(code) if ins[0] == 'label'}
+    # Matching ('while',)/('end_while',) and ('begin_if',)/('else',)/
+    # ('end_if',) in structured code
+    blocks, match = [], {}
+    for n, ins in enumerate(code):
+        if ins[0] in ('while', 'begin_if'):
+            blocks.append(n)
+        elif ins[0] == 'else':
+            match[blocks[-1]] = n
+        elif ins[0] in ('end_while', 'end_if'):
+            start = blocks.pop()
+            match[n] = start
+            if ins[0] == 'end_while' or start not in match:
+                match[start] = n
+            else:
+                match[match[start]] = n
+    loops = []
+    succs = []
+    for n, ins in enumerate(code):
+        kind = ins[0]
+        if kind == 'goto':
+            succs.append((labels[ins[1]],))
+        elif kind == 'if':
+            succs.append((n + 1, labels[ins[2]]))
+        elif kind == 'while':
+            loops.append(match[n])
+            succs.append((n + 1,))
+        elif kind == 'break_unless':
+            succs.append((n + 1, loops[-1] + 1))
+        elif kind == 'end_while':
+            loops.pop()
+            succs.append((match[n],))
+        elif kind == 'begin_if':
+            # To the else branch, or past the end
+            succs.append((n + 1, match[n] + (code[match[n]][0] == 'else')))
+        elif kind == 'else':
+            succs.append((match[n],))
+        elif kind == 'return' or n + 1 == len(code):
+            succs.append(())
+        else:
+            succs.append((n + 1,))
+    return succs
+
+def render_function(func):
+    lines = [func.prototype() + ' {']
+    for ctype, cname in func.locals + func.temporaries:
+        lines.append(f'    {ctype} {cname};')
+    indent = '    '
+    for ins in func.code:
+        kind = ins[0]
+        if kind == 'code':
+            lines.append(indent + ins[1].format(*ins[2]))
+        elif kind == 'label':
+            lines.append(f'{ins[1]}:')
+        elif kind == 'goto':
+            lines.append(f'{indent}goto {ins[1]};')
+        elif kind == 'if':
+            lines.append(f'{indent}if ({ins[1]}) goto {ins[2]};')
+        elif kind == 'declare':
+            lines.append(f'{indent}{ins[1]} {ins[2]};')
+        elif kind == 'while':
+            lines.append(f'{indent}while (1) {{')
+            indent += '    '
+        elif kind == 'break_unless':
+            lines.append(f'{indent}if (!{ins[1]}) break;')
+        elif kind == 'begin_if':
+            lines.append(f'{indent}if ({ins[1]}) {{')
+            indent += '    '
+        elif kind == 'else':
+            lines.append(f'{indent[4:]}}} else {{')
+        elif kind in ('end_while', 'end_if'):
+            indent = indent[4:]
+            lines.append(f'{indent}}}')
+        elif ins[1] is None:
+            lines.append(f'{indent}return;')
+        else:
+            lines.append(f'{indent}return {ins[1]};')
+    lines.append('}')
+    return lines
+
+# Internal function to compile a node into func.  Expressions return the
+# operand holding their value.
+def compile(node, func):
+    if isinstance(node, list):
+        for stmt in node:
+            compile(stmt, func)
+        return None
+
+    elif isinstance(node, (Integer, Float)):
+        # Integers are written in decimal, since C reads 010 as octal.
+        # Negative literals come from wabbit.transform.  2147483648 is
+        # too big for an int, so INT_MIN has to be written as an
+        # expression.
+        value = str(int(node.value)) if isinstance(node, Integer) else node.value
+        if value == '-2147483648':
+            return '(-2147483647 - 1)'
+        elif value.startswith('-'):
+            return f'({value})'
+        return value
+
+    elif isinstance(node, UnaryOp):
+        operand = compile(node.operand, func)
+        if node.op == '+':
+            return operand
+        return func.set(node.type, f'{node.op}{{}};', operand)
+
+    elif isinstance(node, BinOp) and node.op in ('&&', '||'):
+        # Short-circuit evaluation.  The result starts out as the left
+        # operand and is only set from the right one if that is needed.
+        result = compile(node.left, func)
+        if not isinstance(result, Temporary):
+            result = func.set('bool', '{};', result)
+        if func.mod.structured:
+            func.code.append(('begin_if', result))
+            if node.op == '||':
+                func.code.append(('else',))
+            func.emit('{} = {};', result, compile(node.right, func), dest=result)
+            func.code.append(('end_if',))
+        else:
+            end_label = func.mod.new_label()
+            if node.op == '&&':
+                right_label = func.mod.new_label()
+                func.goto_if(result, right_label)
+                func.goto(end_label)
+                func.label(right_label)
+            else:
+                func.goto_if(result, end_label)
+            func.emit('{} = {};', result, compile(node.right, func), dest=result)
+            func.label(end_label)
+        return result
+
+    elif isinstance(node, BinOp):
+        left = compile(node.left, func)
+        if _has_call(node.right):
+            left = func.pin(left, node.left.type)
+        right = compile(node.right, func)
+        return func.set(node.type, f'{{}} {node.op} {{}};', left, right)
+
+    elif isinstance(node, Print):
+        value = compile(node.expression, func)
+        value_type = node.expression.type
+        if value_type == 'bool':
+            if_true, end = func.mod.new_label(), func.mod.new_label()
+            func.goto_if(value, if_true)
+            func.emit('printf("false\\n");')
+            func.goto(end)
+            func.label(if_true)
+            func.emit('printf("true\\n");')
+            func.label(end)
+        elif value_type in _print_formats:
+            func.emit(f'printf("{_print_formats[value_type]}", {{}});', value)
+        else:
+            raise RuntimeError(f"Cannot print expression {node}")
+
+    elif isinstance(node, (DeclareConst, DeclareVar)):
+        if node in func.mod.globals:
+            cname = func.mod.globals[node]
+        else:
+            cname = func.declare_local(node.name, node.type)
+        if node.value:
+            value = compile(node.value, func)
+            func.emit('{} = {};', cname, value)
+        else:
+            # Uninitialized variables start out as zero (globals too, in
+            # case main_block() runs more than once)
+            func.emit('{} = 0;', cname)
+        func.env[node.name] = cname
+
+    elif isinstance(node, Load):
+        return func.env[node.location]
+
+    elif isinstance(node, Assignment):
+        value = compile(node.value, func)
+        func.emit('{} = {};', func.env[node.location], value)
+
+    elif isinstance(node, ExprAsStatement):
+        compile(node.expression, func)
+
+    elif isinstance(node, FunctionDefinition):
+        func.env[node.name] = cname = func.mod.function_names[node.name]
+        # Functions see the top-level scope and their parameters
+        body = CFunction(func.mod, cname, _ctypes[node.type],
+                         ChainMap({}, func.env.maps[-1]))
+        for param in node.params:
+            body.env[param.name] = body.declare_param(param.name, param.type)
+        compile(node.body, body)
+        # Falling off the end of a function returns zero
+        body.ret('0')
+        func.mod.functions.append(body)
+
+    elif isinstance(node, Return):
+        func.ret(compile(node.value, func))
+
+    elif isinstance(node, FunctionCall):
+        args = []
+        for n, arg in enumerate(node.arguments):
+            value = compile(arg, func)
+            if _has_call(node.arguments[n + 1:]):
+                value = func.pin(value, arg.type)
+            args.append(value)
+        call = f'{func.env[node.name]}({", ".join("{}" for _ in args)});'
+        return func.set(node.type, call, *args)
+
+    elif isinstance(node, IfStatement) and func.mod.structured:
+        func.code.append(('begin_if', compile(node.condition, func)))
+        func.env = func.env.new_child()
+        compile(node.consequence, func)
+        func.env = func.env.parents
+        if node.alternative:
+            func.code.append(('else',))
+            func.env = func.env.new_child()
+            compile(node.alternative, func)
+            func.env = func.env.parents
+        func.code.append(('end_if',))
+
+    elif isinstance(node, IfStatement):
+        cond = compile(node.condition, func)
+        then_label, end_label = func.mod.new_label(), func.mod.new_label()
+        else_label = func.mod.new_label() if node.alternative else end_label
+        func.goto_if(cond, then_label)
+        func.goto(else_label)
+
+        func.label(then_label)
+        func.env = func.env.new_child()
+        compile(node.consequence, func)
+        func.env = func.env.parents
+
+        if node.alternative:
+            func.goto(end_label)
+            func.label(else_label)
+            func.env = func.env.new_child()
+            compile(node.alternative, func)
+            func.env = func.env.parents
+        func.label(end_label)
+
+    elif isinstance(node, WhileLoop) and func.mod.structured:
+        # The condition may take several operations, so it is tested
+        # inside the loop
+        func.code.append(('while',))
+        func.code.append(('break_unless', compile(node.condition, func)))
+        func.env = func.env.new_child()
+        compile(node.body, func)
+        func.env = func.env.parents
+        func.code.append(('end_while',))
+
+    elif isinstance(node, WhileLoop):
+        test_label = func.mod.new_label()
+        body_label = func.mod.new_label()
+        end_label = func.mod.new_label()
+        func.label(test_label)
+        cond = compile(node.condition, func)
+        func.goto_if(cond, body_label)
+        func.goto(end_label)
+
+        func.label(body_label)
+        func.env = func.env.new_child()
+        compile(node.body, func)
+        func.env = func.env.parents
+        func.goto(test_label)
+        func.label(end_label)
 
     else:
-        raise RuntimeError(f"Can't interpret {node}")
+        raise RuntimeError(f"Can't compile {node}")
+
+# The C library this process uses, for flushing its stdout
+_libc = ctypes.CDLL(None)
+
+# Flags for compiling the C code of a program into a shared library.
+# Signed overflow is undefined in C, but Wabbit's ints wrap around (as
+# they do with LLVM and Wasm), so the code needs -fwrapv.
+SHARED_FLAGS = ('-O2', '-fwrapv', '-shared', '-fPIC')
+
+def default_cache():
+    return ObjectCache(os.path.join(default_cache_dir(), 'c'), suffix='.so')
 
+def compile_shared(code, cache=None, flags=SHARED_FLAGS):
+    '''
+    Compile C code into a shared library with the system C compiler
+    ($CC or cc) and return its path.  Libraries are kept in cache (an
+    ObjectCache, by default one under default_cache_dir()) keyed by the
+    code, the compiler and flags, so the same code is only compiled once.
+    '''
+    if cache is None:
+        cache = default_cache()
+    compiler = os.environ.get('CC', 'cc')
+    key = cache.key(code, compiler, *flags)
+    path = cache.lookup(key)
+    if path is not None:
+        return path
 
-def main(filename):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source = os.path.join(tmpdir, 'out.c')
+        library = os.path.join(tmpdir, 'out.so')
+        with open(source, 'w') as file:
+            file.write(code)
+        subprocess.run([compiler, *flags, '-o', library, source], check=True)
+        with open(library, 'rb') as file:
+            return cache.put(key, file.read())
+
+def run_c(model, cache=None):
+    '''
+    Compile a type checked model to C, build it as a shared library (see
+    compile_shared()) and run it in this process.  The program prints
+    with C's stdio, straight to file descriptor 1.
+    '''
+    library = ctypes.CDLL(compile_shared(compile_program(model), cache))
+    library.main_block.restype = None
+    # Keep the output in order with anything Python printed before
+    sys.stdout.flush()
+    library.main_block()
+    _libc.fflush(None)
+
+def main(argv):
+    import argparse
     from .parse import parse_file
     from .typecheck import check_program
+    from .transform import transform
 
-    model = parse_file(filename)
-    check_program(model)  # !!! TODO Type checking needs to be implemented
+    parser = argparse.ArgumentParser(prog='wabbit.c')
+    parser.add_argument('filename')
+    parser.add_argument('--run', action='store_true',
+                        help='compile with cc and run the program instead of writing out.c')
+    args = parser.parse_args(argv)
+
+    model = parse_file(args.filename)
+    check_program(model).exit_on_errors()
+    model = transform(model)
+    if args.run:
+        run_c(model)
+        return
     code = compile_program(model)
     with open('out.c', 'w') as file:
         file.write(code)
     print('Wrote: out.c')
 
 if __name__ == '__main__':
-    import sys
-    main(sys.argv[1])
-
+    main(sys.argv[1:])
@@ -0,0 +1,125 @@
+# cache.py
+#
+# On-disk cache for compiled code.  Entries are files named by a hash
+# of everything that went into making them (the code, the target and
+# the options), so an entry never has to be invalidated.  It just stops
+# being used and is eventually evicted.
+#
+# The cache is shared by concurrent processes.  Entries are written to
+# a temporary file and renamed into place, so a reader never sees a
+# partially written entry.  Reading an entry updates its modification
+# time, and the total size of the cache is kept under a limit by
+# removing the least recently used entries.
+
+import hashlib
+import os
+import tempfile
+
+DEFAULT_MAX_BYTES = 256 * 2**20
+
+def default_cache_dir():
+    return os.environ.get('WABBIT_CACHE_DIR',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'wabbit'))
+
+class ObjectCache:
+    '''
+    A directory of cached binary blobs (object files, shared libraries)
+    with least recently used eviction and hit/miss counters.
+    '''
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES, suffix=''):
+        self.directory = directory or os.path.join(default_cache_dir(), 'objects')
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __repr__(self):
+        return f'ObjectCache({self.directory!r}, hits={self.hits}, misses={self.misses})'
+
+    @staticmethod
+    def key(*parts):
+        # Hash of the parts.  Each part is length prefixed so that
+        # different splits of the same text give different keys.
+        h = hashlib.sha256()
+        for part in parts:
+            if not isinstance(part, bytes):
+                part = str(part).encode('utf-8')
+            h.update(len(part).to_bytes(8, 'little'))
+            h.update(part)
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def lookup(self, key):
+        # Path of the entry for key, or None.  Counts as a use.
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def get(self, key):
+        path = self.lookup(key)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as file:
+                return file.read()
+        except FileNotFoundError:
+            # Evicted by another process since the lookup
+            self.hits -= 1
+            self.misses += 1
+            return None
+
+    def put(self, key, data):
+        fd, tmppath = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(data)
+            os.replace(tmppath, self.path(key))
+        except BaseException:
+            os.unlink(tmppath)
+            raise
+        self.evict()
+        return self.path(key)
+
+    def entries(self):
+        # (mtime, size, path) of each entry, oldest first
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.startswith('.'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        entries.sort()
+        return entries
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def stats(self):
+        entries = self.entries()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+        }
@@ -48,8 +48,17 @@ def interpret_program(model):
     # Make the initial environment (a dict)
     env = ChainMap()
     out = interp(model, env)
+
+    # Like a compiled program, run main() after the top-level statements
+    if isinstance(env.get('main'), FunctionDefinition):
+        out = interp(FunctionCall('main', []), env)
     return out
 
+# Raised by a return statement to unwind to the function call
+class ReturnException(Exception):
+    def __init__(self, value):
+        self.value = value
+
 # Internal function to interpret a node in the environment
 def interp(node, env):
     if isinstance(node, list):
@@ -131,7 +140,7 @@ def interp(node, env):
     elif isinstance(node, IfStatement):
         if interp(node.condition, env):
             return interp(node.consequence, env.new_child())
-        else:
+        elif node.alternative:
             return interp(node.alternative, env.new_child())
 
     elif isinstance(node, WhileLoop):
@@ -145,6 +154,23 @@ def interp(node, env):
     elif isinstance(node, ExprAsStatement):
        return interp(node.expression, env)
 
+    elif isinstance(node, FunctionDefinition):
+        env[node.name] = node
+
+    elif isinstance(node, FunctionCall):
+        func = env[node.name]
+        args = [interp(arg, env) for arg in node.arguments]
+        # Functions see the global scope and their own parameters
+        func_env = ChainMap({p.name: arg for p, arg in zip(func.params, args)},
+                            env.maps[-1])
+        try:
+            interp(func.body, func_env)
+        except ReturnException as ret:
+            return ret.value
+
+    elif isinstance(node, Return):
+        raise ReturnException(interp(node.value, env))
+
     elif isinstance(node, Statements):
         value = None
         for s in node.statements:
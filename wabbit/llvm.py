@@ -37,34 +37,65 @@
 # LLVM types. You'll probably want to make some type objects to help.
 # (see below)
 
+import ctypes
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
 from collections import ChainMap
+from concurrent.futures import ProcessPoolExecutor
 
 from llvmlite import ir
+import llvmlite.binding as llvm
 
+from .cache import ObjectCache
 from .model import *
 
 # Define LLVM types corresponding to Wabbit types
 int_type = ir.IntType(32)
 float_type = ir.DoubleType()
+bool_type = ir.IntType(1)
 void_type = ir.VoidType()
+count_type = ir.IntType(64)    # Profile counters
 
 # Maps python types to LLVM types
 _typemap = {
     'int': int_type,
-    'float': float_type
+    'float': float_type,
+    'bool': bool_type,
 }
 
+# Builder methods (and their leading arguments) implementing each
+# operator, indexed by the type id of the operands (see TYPE_IDS in
+# wabbit/model.py).  && and || are not here: they only evaluate their
+# right operand when the left one doesn't decide the result (see g()).
+_binop_instructions = [{} for _ in TYPE_NAMES]
+_binop_instructions[INT] = {
+    '+': ('add',), '-': ('sub',), '*': ('mul',), '/': ('sdiv',),
+    **{op: ('icmp_signed', op) for op in ('<', '>', '<=', '>=', '==', '!=')},
+}
+_binop_instructions[FLOAT] = {
+    '+': ('fadd',), '-': ('fsub',), '*': ('fmul',), '/': ('fdiv',),
+    **{op: ('fcmp_ordered', op) for op in ('<', '>', '<=', '>=', '==', '!=')},
+}
+_binop_instructions[BOOL] = {
+    '==': ('icmp_unsigned', '=='), '!=': ('icmp_unsigned', '!='),
+}
+
+_unaryop_instructions = [{} for _ in TYPE_NAMES]
+_unaryop_instructions[INT] = {'-': 'neg'}
+_unaryop_instructions[FLOAT] = {'-': 'fneg'}
+
 # The LLVM world that Wabbit is populating
 class WabbitLLVMModule:
-    def __init__(self):
+    def __init__(self, fast_math=False, instrument=False, profile=None,
+                 lazy_compiler=None):
 
         # Boilerplate code to setup llvlite to write LLVM code
         self.module = ir.Module("wabbit")
-        self.function = ir.Function(self.module,
-                                    ir.FunctionType(void_type, []),
-                                    name='main_block')
-        self.block = self.function.append_basic_block('entry')
-        self.builder = ir.IRBuilder(self.block)
+        self.function = self.block = self.builder = None
 
         # Runtime functions for printing. See wabbit/runtime.c.
         self._printi = ir.Function(
@@ -77,20 +108,404 @@ class WabbitLLVMModule:
             ir.FunctionType(void_type, [float_type]),
             name='_printf')
 
-        # Environment
+        self._printb = ir.Function(
+            self.module,
+            ir.FunctionType(void_type, [int_type]),
+            name='_printb')
+
+        # Profiling.  Every basic block and every edge of a conditional
+        # branch has a counter, numbered in the order the code is
+        # generated.  An instrumented module (instrument=True) counts
+        # into them and writes them out with _write_profile() at exit.
+        # With profile, a list of counts read back from such a run, the
+        # branches and functions are annotated for the optimizer instead.
+        self.instrument = instrument
+        self.profile = profile
+        self.counters = []           # counter -> description
+        self.block_counters = []
+        self.entry_counters = {}     # function -> counter of its entry
+        if instrument:
+            # Sized once the number of counters is known in finish()
+            self.counter_array = ir.GlobalVariable(
+                self.module, ir.ArrayType(count_type, 0), 'wabbit.counters')
+            self.counter_base = self.counter_array.bitcast(count_type.as_pointer())
+            self._write_profile = ir.Function(
+                self.module,
+                ir.FunctionType(void_type, [self.counter_array.type, int_type]),
+                name='_write_profile')
+
+        # Environment. Maps names to the declarations in scope.
         self.env = ChainMap()
 
-    def gettype(self, node):
-        return node.type
+        # Wabbit functions by name, and top-level variables that live in
+        # memory (ir.GlobalVariable) because functions use them
+        self.functions = {}
+        self.globals = {}            # declaration -> ir.GlobalVariable
+
+        # For LazyJIT, functions are called through pointers.  While a
+        # pointer is null, callers first call lazy_compiler (an address)
+        # with the pointer, which compiles the function and returns it.
+        self.lazy_compiler = lazy_compiler
+        self.function_pointers = {}
+
+        # Fast-math flags put on floating point instructions
+        self.float_flags = ['fast'] if fast_math else []
+
+        # Variables are kept in SSA form as the code is generated, using
+        # the algorithm in Braun et al., "Simple and Efficient Construction
+        # of Static Single Assignment Form" (CC 2013).  A variable is
+        # identified by its declaration node.  A block is sealed once all
+        # of its predecessors are known.
+        self.current_def = {}        # var -> {block: value}
+        self.incomplete_phis = {}    # block -> {var: phi}
+        self.sealed = set()
+        self.preds = {}
+        self.phi_users = {}          # phi -> phis that use it
+        self.replaced = {}           # removed trivial phi -> its value
+
+    def start_function(self, function):
+        # Generate code into the entry block of function from now on
+        self.function = function
+        self.block = function.append_basic_block('entry')
+        self.entry_counters[function] = self.count_block(self.block)
+        self.builder = ir.IRBuilder(self.block)
+        self.sealed.add(self.block)
+        self.preds[self.block] = []
+
+    def declare_function(self, node, define_pointer=True):
+        functype = ir.FunctionType(self.getllvmtype(node.type),
+                                   [self.getllvmtype(p.type) for p in node.params])
+        function = ir.Function(self.module, functype, name=f'wabbit.{node.name}')
+        # bools are i1, which a caller can only read the low bit of.  C
+        # and ctypes (see WabbitLibrary) read a whole byte, as for _Bool.
+        if node.type == 'bool':
+            function.return_value.add_attribute('zeroext')
+        for arg, param in zip(function.args, node.params):
+            if param.type == 'bool':
+                arg.add_attribute('zeroext')
+        self.functions[node.name] = function
+        if self.lazy_compiler is not None:
+            pointer = ir.GlobalVariable(self.module, functype.as_pointer(),
+                                        f'wabbit.{node.name}.ptr')
+            if define_pointer:
+                pointer.initializer = ir.Constant(pointer.value_type, None)
+            self.function_pointers[node.name] = pointer
+
+    def callee(self, name):
+        if self.lazy_compiler is None:
+            return self.functions[name]
+
+        pointer = self.function_pointers[name]
+        compile_block = self.new_block('compile')
+        call_block = self.new_block('call')
+        compiled = self.builder.icmp_unsigned(
+            '!=', self.builder.load(pointer), ir.Constant(pointer.value_type, None))
+        self.cbranch(compiled, call_block, compile_block)
+        self.seal_block(compile_block)
+
+        self.builder.position_at_end(compile_block)
+        compiler = self.builder.inttoptr(
+            ir.Constant(count_type, self.lazy_compiler),
+            ir.FunctionType(count_type, [pointer.type]).as_pointer())
+        address = self.builder.call(compiler, [pointer])
+        self.builder.store(self.builder.inttoptr(address, pointer.value_type), pointer)
+        self.branch(call_block)
+        self.seal_block(call_block)
+
+        self.builder.position_at_end(call_block)
+        return self.builder.load(pointer)
+
+    def declare_global(self, node, define=True):
+        var = ir.GlobalVariable(self.module, self.getllvmtype(node.type),
+                                name=f'wabbit.{node.name}')
+        if define:
+            # Set to the declared value when the declaration runs
+            var.initializer = ir.Constant(var.value_type, 0)
+        self.globals[node] = var
 
     def getllvmtype(self, ptype):
         return _typemap[ptype]
 
+    # Control flow.  Branches go through these methods so that the
+    # predecessors of each block are known.
+    def new_block(self, name):
+        block = self.function.append_basic_block(name)
+        self.preds[block] = []
+        self.count_block(block)
+        return block
+
+    def branch(self, target):
+        self.preds[target].append(self.builder.block)
+        self.builder.branch(target)
+
+    def cbranch(self, cond, iftrue, iffalse):
+        self.preds[iftrue].append(self.builder.block)
+        self.preds[iffalse].append(self.builder.block)
+
+        # Counters for the true and false edges
+        true_counter = self.new_counter(f'{self.builder.block.name}->{iftrue.name}')
+        false_counter = self.new_counter(f'{self.builder.block.name}->{iffalse.name}')
+        if self.instrument:
+            self._increment(self.builder,
+                            self.builder.select(cond, ir.Constant(int_type, true_counter),
+                                                ir.Constant(int_type, false_counter)))
+        branch = self.builder.cbranch(cond, iftrue, iffalse)
+        if self.profile is not None:
+            branch.set_weights([_branch_weight(self.profile_count(true_counter)),
+                                _branch_weight(self.profile_count(false_counter))])
+
+    # Profile counters
+    def new_counter(self, description):
+        self.counters.append(f'{self.function.name}:{description}')
+        return len(self.counters) - 1
+
+    def count_block(self, block):
+        # Blocks are counted before any of their code runs
+        counter = self.new_counter(block.name)
+        self.block_counters.append(counter)
+        if self.instrument:
+            self._increment(ir.IRBuilder(block), ir.Constant(int_type, counter))
+        return counter
+
+    def _increment(self, builder, counter):
+        ptr = builder.gep(self.counter_base, [counter])
+        count = builder.load(ptr)
+        builder.store(builder.add(count, ir.Constant(count_type, 1)), ptr)
+
+    def profile_count(self, counter):
+        return self.profile[counter] if counter < len(self.profile) else 0
+
+    def seal_block(self, block):
+        for var, phi in self.incomplete_phis.pop(block, {}).items():
+            self._add_phi_operands(var, phi)
+        self.sealed.add(block)
+
+    # SSA variables
+    def write_variable(self, var, value, block=None):
+        self.current_def.setdefault(var, {})[block or self.builder.block] = value
+
+    def read_variable(self, var, block=None):
+        block = block or self.builder.block
+        value = self.current_def[var].get(block)
+        if value is None:
+            value = self._read_variable_recursive(var, block)
+        return self.resolve(value)
+
+    def resolve(self, value):
+        while value in self.replaced:
+            value = self.replaced[value]
+        return value
+
+    def _read_variable_recursive(self, var, block):
+        if block not in self.sealed:
+            # Operands are added when the block is sealed
+            value = self._new_phi(var, block)
+            self.incomplete_phis.setdefault(block, {})[var] = value
+        elif len(self.preds[block]) == 1:
+            value = self.read_variable(var, self.preds[block][0])
+        else:
+            # Write the phi first to break cycles through loops
+            value = self._new_phi(var, block)
+            self.write_variable(var, value, block)
+            value = self._add_phi_operands(var, value)
+        self.write_variable(var, value, block)
+        return value
+
+    def _new_phi(self, var, block):
+        # Code is always generated at the end of the current block, so
+        # that is where the builder goes back to
+        current = self.builder.block
+        self.builder.position_at_start(block)
+        phi = self.builder.phi(self.getllvmtype(var.type), var.name)
+        self.builder.position_at_end(current)
+        return phi
+
+    def _add_phi_operands(self, var, phi):
+        for pred in self.preds[phi.parent]:
+            value = self.read_variable(var, pred)
+            phi.add_incoming(value, pred)
+            if isinstance(value, ir.PhiInstr):
+                self.phi_users.setdefault(value, []).append(phi)
+        return self._try_remove_trivial_phi(phi)
+
+    def _try_remove_trivial_phi(self, phi):
+        same = None
+        for value, _ in phi.incomings:
+            value = self.resolve(value)
+            if value is same or value is phi:
+                continue
+            if same is not None:
+                return phi
+            same = value
+        if same is None:
+            # Unreachable, or read before any definition
+            same = ir.Constant(phi.type, ir.Undefined)
+        phi.parent.instructions.remove(phi)
+        self.replaced[phi] = same
+        # Phis using this one may have become trivial too
+        for user in self.phi_users.pop(phi, []):
+            if user is not phi and user not in self.replaced:
+                self._try_remove_trivial_phi(user)
+        return same
+
+    def finish(self):
+        if self.instrument:
+            self.counter_array.value_type = ir.ArrayType(count_type, len(self.counters))
+            self.counter_array.initializer = ir.Constant(self.counter_array.value_type, None)
+        if self.profile is not None:
+            if len(self.profile) != len(self.counters):
+                raise ValueError('Profile was not made by this program')
+            self.annotate_functions()
+
+        # Instructions generated before a phi was found to be trivial
+        # still refer to it.  Point them at its replacement.
+        if not self.replaced:
+            return
+        for block in (block for function in self.module.functions
+                            for block in function.blocks):
+            for instr in block.instructions:
+                if isinstance(instr, ir.PhiInstr):
+                    operands = [value for value, _ in instr.incomings]
+                else:
+                    operands = instr.operands
+                for value in operands:
+                    if value in self.replaced:
+                        instr.replace_usage(value, self.resolve(value))
+
+    def annotate_functions(self):
+        # Function entry counts, and a summary of the whole profile, let
+        # LLVM tell hot code from cold code.  The inliner then allows
+        # much bigger functions to be inlined at hot call sites.
+        summary = profile_summary(self.profile, self.block_counters,
+                                  self.entry_counters.values())
+        self.module.add_named_metadata('llvm.module.flags', [
+            ir.Constant(int_type, 1), 'ProfileSummary', self._summary_metadata(summary)])
+
+        hot = summary['DetailedSummary'][_HOT_CUTOFF][0]
+        for function, counter in self.entry_counters.items():
+            count = self.profile[counter]
+            function.set_metadata('prof', self.module.add_metadata(
+                ['function_entry_count', ir.Constant(count_type, count)]))
+            if count == 0:
+                # Never called.  Keep it out of the code that is.
+                function.attributes.add('cold')
+                function.attributes.add('noinline')
+            elif count >= hot:
+                function.attributes.add('inlinehint')
+
+    def _summary_metadata(self, summary):
+        fields = [self.module.add_metadata(['ProfileFormat', 'InstrProf'])]
+        for name in ('TotalCount', 'MaxCount', 'MaxInternalCount',
+                     'MaxFunctionCount', 'NumCounts', 'NumFunctions'):
+            fields.append(self.module.add_metadata(
+                [name, ir.Constant(count_type, summary[name])]))
+        detailed = [self.module.add_metadata([ir.Constant(int_type, cutoff),
+                                              ir.Constant(count_type, min_count),
+                                              ir.Constant(int_type, num_counts)])
+                    for cutoff, (min_count, num_counts) in summary['DetailedSummary'].items()]
+        fields.append(self.module.add_metadata(
+            ['DetailedSummary', self.module.add_metadata(detailed)]))
+        return self.module.add_metadata(fields)
+
+# Cutoffs (in millionths of all counts) of LLVM's profile summaries.
+# Code with counts in the top 99% is hot.
+_SUMMARY_CUTOFFS = (10000, 100000, 200000, 300000, 400000, 500000, 600000,
+                    700000, 800000, 900000, 950000, 990000, 999000, 999900,
+                    999990, 999999)
+_HOT_CUTOFF = 990000
+
+def profile_summary(profile, block_counters, entry_counters):
+    '''
+    Summary of the block counts of a profile in the form of LLVM's
+    ProfileSummary.  For each cutoff, DetailedSummary holds the smallest
+    count and the number of counts among the highest counts making up
+    that share of the total.
+    '''
+    entry_counters = set(entry_counters)
+    block_counts = [profile[c] for c in block_counters]
+    entry_counts = [profile[c] for c in entry_counters]
+    internal_counts = [profile[c] for c in block_counters if c not in entry_counters]
+    total = sum(block_counts)
+    detailed = {}
+    counts = sorted(block_counts, reverse=True)
+    running = num_counts = 0
+    for cutoff in _SUMMARY_CUTOFFS:
+        while num_counts < len(counts) and running * 1000000 < total * cutoff:
+            running += counts[num_counts]
+            num_counts += 1
+        detailed[cutoff] = (counts[num_counts - 1] if num_counts else 0, num_counts)
+    return {
+        'TotalCount': total,
+        'MaxCount': max(block_counts, default=0),
+        'MaxInternalCount': max(internal_counts, default=0),
+        'MaxFunctionCount': max(entry_counts, default=0),
+        'NumCounts': len(block_counts),
+        'NumFunctions': len(entry_counts),
+        'DetailedSummary': detailed,
+    }
+
+def _branch_weight(count):
+    # Weights are 32 bit.  As in clang, never zero.
+    return min(count, 2**32 - 2) + 1
+
+# Profiles are text: a header with the number of counters, then one
+# count per line
+PROFILE_FILE = 'wabbit.profdata'
+
+def profile_filename():
+    return os.environ.get('WABBIT_PROFILE', PROFILE_FILE)
+
+def read_profile(filename=None):
+    with open(filename or profile_filename()) as file:
+        magic, size = file.readline().split()
+        if magic != 'wabbit-profile':
+            raise ValueError(f'{file.name} is not a Wabbit profile')
+        counts = [int(line) for line in file]
+    if len(counts) != int(size):
+        raise ValueError(f'{file.name} is truncated')
+    return counts
+
+def write_profile(counts, filename=None):
+    with open(filename or profile_filename(), 'w') as file:
+        file.write(f'wabbit-profile {len(counts)}\n')
+        file.writelines(f'{count}\n' for count in counts)
+
 # Top-level function
-def generate_program(model, write_out=False):
-    mod = WabbitLLVMModule()
-    code = g(model, mod)
+def generate_program(model, write_out=False, fast_math=False, functions=True,
+                     instrument=False, profile=None, call_main=True,
+                     lazy_compiler=None):
+    '''
+    Generate the module for a type checked program.  Top-level statements
+    go in main_block(), which calls main() at the end if there is one
+    (and call_main is true).
+    With functions=False, Wabbit functions are only declared and their
+    code is left to generate_function() (see compile_split()).
+
+    With instrument, the program writes a profile when it finishes (see
+    read_profile()).  Giving that profile back as profile annotates the
+    code with how often each branch was taken and function was called.
+
+    With lazy_compiler, functions are called through pointers, which
+    start out null (see LazyJIT).
+    '''
+    mod = WabbitLLVMModule(fast_math, instrument, profile, lazy_compiler)
+    for node in global_variables(model):
+        mod.declare_global(node)
+    for node in function_definitions(model):
+        mod.declare_function(node)
+
+    mod.start_function(ir.Function(mod.module, ir.FunctionType(void_type, []),
+                                   name='main_block'))
+    for stmt in model:
+        if functions or not isinstance(stmt, FunctionDefinition):
+            g(stmt, mod)
+    if call_main and 'main' in mod.functions:
+        mod.builder.call(mod.callee('main'), [])
+    if instrument:
+        mod.builder.call(mod._write_profile, [mod.counter_array,
+                                              ir.Constant(int_type, len(mod.counters))])
     mod.builder.ret_void()  # closes the block in LLVM
+    mod.finish()
 
     if write_out:
         with open('out.ll', 'w') as file:
@@ -98,6 +513,70 @@ def generate_program(model, write_out=False):
         print('Wrote out.ll')
     return mod.module
 
+def generate_function(node, interface, fast_math=False, lazy_compiler=None):
+    '''
+    Generate a module holding only the code for the function node.  The
+    globals and other functions it uses are declared from interface (see
+    function_interfaces()) and resolved when the modules are linked.
+    '''
+    mod = WabbitLLVMModule(fast_math, lazy_compiler=lazy_compiler)
+    mod.declare_function(node, define_pointer=False)
+    for decl in interface:
+        if isinstance(decl, FunctionDefinition):
+            mod.declare_function(decl, define_pointer=False)
+        else:
+            mod.declare_global(decl, define=False)
+            mod.env[decl.name] = decl
+    g(node, mod)
+    mod.finish()
+    return mod.module
+
+def function_definitions(model):
+    return [stmt for stmt in model if isinstance(stmt, FunctionDefinition)]
+
+def global_variables(model):
+    '''
+    Top-level declarations that a function might use.  Those are kept in
+    memory instead of SSA values, since any call may read or change them.
+    '''
+    names = set()
+    for func in function_definitions(model):
+        _referenced_names(func.body, names)
+    return [stmt for stmt in model
+            if isinstance(stmt, (DeclareConst, DeclareVar)) and stmt.name in names]
+
+def function_interfaces(model):
+    '''
+    For each function, a picklable list of declarations of the globals
+    and other functions that it uses: everything generate_function()
+    needs besides the function itself.
+    '''
+    decls = {node.name: DeclareVar(node.name, node.type, None)
+             for node in global_variables(model)}
+    decls.update((node.name, FunctionDefinition(node.name, node.params, node.type, []))
+                 for node in function_definitions(model))
+    interfaces = []
+    for func in function_definitions(model):
+        names = set()
+        _referenced_names(func.body, names)
+        names.discard(func.name)
+        interfaces.append([decls[name] for name in sorted(names) if name in decls])
+    return interfaces
+
+def _referenced_names(node, names):
+    # Names of the variables and functions used by node.  Local names
+    # are included too, which at worst declares something unused.
+    if isinstance(node, list):
+        for stmt in node:
+            _referenced_names(stmt, names)
+    elif isinstance(node, (Statement, Expression)):
+        if isinstance(node, (Load, Assignment)):
+            names.add(node.location)
+        elif isinstance(node, FunctionCall):
+            names.add(node.name)
+        for value in vars(node).values():
+            _referenced_names(value, names)
+
 # Internal function to to generate code for each node type
 def g(node, mod):
     if isinstance(node, list):
@@ -112,88 +591,683 @@ def g(node, mod):
         return ir.Constant(float_type, float(node.value))
 
     elif isinstance(node, UnaryOp):
-        nodetype = node.type
-        llvmtype = mod.getllvmtype(nodetype)
         operand = g(node.operand, mod)
-        op = node.op
-
-        if nodetype == 'int':
-            if op == '-':
-                return mod.builder.sub(ir.Constant(llvmtype, 0), operand)
+        if node.op == '+':
+            return operand
 
-        elif nodetype == 'float':
-            if op == '-':
-                return mod.builder.fsub(ir.Constant(llvmtype, 0), operand)
+        typeid = node.typeid
+        instruction = _unaryop_instructions[typeid].get(node.op)
+        if instruction is None:
+            raise RuntimeError(f"Cannot evaluate UnaryOp operator {node}")
+        result = getattr(mod.builder, instruction)(operand)
+        if typeid == FLOAT:
+            result.flags.extend(mod.float_flags)
+        return result
 
     elif isinstance(node, Print):
-        node_type = mod.gettype(node.expression)
+        typeid = node.expression.typeid
         value = g(node.expression, mod)
-        if node_type == 'int':
+        if typeid == INT:
             return mod.builder.call(mod._printi, [value])
-        elif node_type == 'float':
+        elif typeid == FLOAT:
             return mod.builder.call(mod._printf, [value])
+        elif typeid == BOOL:
+            return mod.builder.call(mod._printb, [mod.builder.zext(value, int_type)])
         else:
             raise RuntimeError(f"Cannot print expression {node}")
 
+    elif isinstance(node, BinOp) and node.op in ('&&', '||'):
+        # Short-circuit evaluation.  The right operand gets a block of
+        # its own, and the result is a phi of the two ways to the end.
+        leftval = g(node.left, mod)
+        left_block = mod.builder.block
+        right_block = mod.new_block('and' if node.op == '&&' else 'or')
+        merge_block = mod.new_block('endand' if node.op == '&&' else 'endor')
+        if node.op == '&&':
+            mod.cbranch(leftval, right_block, merge_block)
+        else:
+            mod.cbranch(leftval, merge_block, right_block)
+        mod.seal_block(right_block)
+
+        mod.builder.position_at_end(right_block)
+        rightval = g(node.right, mod)
+        right_block = mod.builder.block
+        mod.branch(merge_block)
+        mod.seal_block(merge_block)
+
+        # Phis go first, before any profile counting in the block
+        mod.builder.position_at_start(merge_block)
+        result = mod.builder.phi(bool_type)
+        result.add_incoming(ir.Constant(bool_type, node.op == '||'), left_block)
+        result.add_incoming(rightval, right_block)
+        mod.builder.position_at_end(merge_block)
+        return result
+
     elif isinstance(node, BinOp):
         leftval = g(node.left, mod)
         rightval = g(node.right, mod)
-        lefttype = mod.gettype(node.left)
-
-        if lefttype in {'int'}:
-            if node.op == '+':
-                return mod.builder.add(leftval, rightval)
-            if node.op == '-':
-                return mod.builder.sub(leftval, rightval)
-            if node.op == '*':
-                return mod.builder.mul(leftval, rightval)
-            if node.op == '/':
-                return mod.builder.sdiv(leftval, rightval)
-
-        elif lefttype in {'float'}:
-            if node.op == '+':
-                return mod.builder.fadd(leftval, rightval)
-            if node.op == '-':
-                return mod.builder.fsub(leftval, rightval)
-            if node.op == '*':
-                return mod.builder.fmul(leftval, rightval)
-            if node.op == '/':
-                return mod.builder.fdiv(leftval, rightval)
-        else:
+
+        typeid = node.left.typeid
+        instruction = _binop_instructions[typeid].get(node.op)
+        if instruction is None:
             raise RuntimeError(f"Cannot evaluate BinOp operator {node}")
+        method, *args = instruction
+        result = getattr(mod.builder, method)(*args, leftval, rightval)
+        if typeid == FLOAT:
+            result.flags.extend(mod.float_flags)
+        return result
 
     elif isinstance(node, (DeclareConst, DeclareVar)):
-        # Get node type and llvm type
-        nodetype = mod.gettype(node)
-        llvmtype = mod.getllvmtype(nodetype)
-
-        # Declare variable with name, node.name
-        var = mod.builder.alloca(llvmtype, name=node.name)
-
         if node.value:
             value = g(node.value, mod)
-            mod.builder.store(value, var)
-        mod.env[node.name] = var  # Store variable in environment
+        else:
+            # Uninitialized variables start out as zero
+            value = ir.Constant(mod.getllvmtype(node.type), 0)
+        mod.env[node.name] = node  # Store variable in environment
+        if node in mod.globals:
+            mod.builder.store(value, mod.globals[node])
+        else:
+            mod.write_variable(node, value)
 
     elif isinstance(node, Load):
-        return mod.builder.load(mod.env[node.location])
+        var = mod.env[node.location]
+        if var in mod.globals:
+            return mod.builder.load(mod.globals[var], node.location)
+        return mod.read_variable(var)
+
+    elif isinstance(node, Assignment):
+        value = g(node.value, mod)
+        var = mod.env[node.location]
+        if var in mod.globals:
+            mod.builder.store(value, mod.globals[var])
+        else:
+            mod.write_variable(var, value)
+
+    elif isinstance(node, ExprAsStatement):
+        g(node.expression, mod)
+
+    elif isinstance(node, FunctionDefinition):
+        function, builder, env = mod.function, mod.builder, mod.env
+        mod.start_function(mod.functions[node.name])
+
+        # Functions see the top-level scope and their parameters
+        mod.env = ChainMap({}, env.maps[-1])
+        for param, arg in zip(node.params, mod.function.args):
+            arg.name = param.name
+            mod.env[param.name] = param
+            mod.write_variable(param, arg)
+        g(node.body, mod)
+        if not mod.builder.block.is_terminated:
+            # Falling off the end of a function returns zero
+            mod.builder.ret(ir.Constant(mod.function.function_type.return_type, 0))
+        mod.function, mod.builder, mod.env = function, builder, env
+
+    elif isinstance(node, Return):
+        mod.builder.ret(g(node.value, mod))
+        # Code after a return is unreachable, but still needs a block
+        block = mod.new_block('after_return')
+        mod.seal_block(block)
+        mod.builder.position_at_end(block)
+
+    elif isinstance(node, FunctionCall):
+        args = [g(arg, mod) for arg in node.arguments]
+        # Calls through LazyJIT's pointers don't see the callee's zeroext
+        zeroext = {i: ('zeroext',) for i, arg in enumerate(node.arguments)
+                   if arg.typeid == BOOL}
+        return mod.builder.call(mod.callee(node.name), args, arg_attrs=zeroext)
+
+    elif isinstance(node, IfStatement):
+        cond = g(node.condition, mod)
+        then_block = mod.new_block('then')
+        merge_block = mod.new_block('endif')
+        else_block = mod.new_block('else') if node.alternative else merge_block
+        mod.cbranch(cond, then_block, else_block)
+        mod.seal_block(then_block)
+
+        mod.builder.position_at_end(then_block)
+        mod.env = mod.env.new_child()
+        g(node.consequence, mod)
+        mod.env = mod.env.parents
+        mod.branch(merge_block)
+
+        if node.alternative:
+            mod.seal_block(else_block)
+            mod.builder.position_at_end(else_block)
+            mod.env = mod.env.new_child()
+            g(node.alternative, mod)
+            mod.env = mod.env.parents
+            mod.branch(merge_block)
+
+        mod.seal_block(merge_block)
+        mod.builder.position_at_end(merge_block)
+
+    elif isinstance(node, WhileLoop):
+        # The loop header is sealed after the body, when the back edge
+        # to it is known
+        header_block = mod.new_block('while')
+        body_block = mod.new_block('loop')
+        exit_block = mod.new_block('endwhile')
+        mod.branch(header_block)
+
+        mod.builder.position_at_end(header_block)
+        cond = g(node.condition, mod)
+        mod.cbranch(cond, body_block, exit_block)
+        mod.seal_block(body_block)
+
+        mod.builder.position_at_end(body_block)
+        mod.env = mod.env.new_child()
+        g(node.body, mod)
+        mod.env = mod.env.parents
+        mod.branch(header_block)
+        mod.seal_block(header_block)
+
+        mod.seal_block(exit_block)
+        mod.builder.position_at_end(exit_block)
 
     else:
         raise RuntimeError(f"Can't generate code for {node}")
 
+# In-process versions of the runtime functions in wabbit/runtime.c for
+# code run with run_jit().  They are registered with LLVM by name.
+@ctypes.CFUNCTYPE(None, ctypes.c_int32)
+def _jit_printi(x):
+    print(f'Out: {x}')
+
+@ctypes.CFUNCTYPE(None, ctypes.c_double)
+def _jit_printf(x):
+    print(f'Out: {x:f}')
+
+@ctypes.CFUNCTYPE(None, ctypes.c_int32)
+def _jit_printb(x):
+    print(f'Out: {"true" if x else "false"}')
+
+@ctypes.CFUNCTYPE(None, ctypes.POINTER(ctypes.c_int64), ctypes.c_int32)
+def _jit_write_profile(counters, n):
+    write_profile(counters[:n])
+
+_jit_runtime = {
+    '_printi': _jit_printi,
+    '_printf': _jit_printf,
+    '_printb': _jit_printb,
+    '_write_profile': _jit_write_profile,
+}
+
+def _init_jit():
+    llvm.initialize_native_target()
+    llvm.initialize_native_asmprinter()
+    for name, func in _jit_runtime.items():
+        llvm.add_symbol(name, ctypes.cast(func, ctypes.c_void_p).value)
+
+def host_target_machine(opt_level=0, host_cpu=False, reloc='default'):
+    '''
+    Target machine for the host triple.  With host_cpu, code is tuned
+    for and may use all the features of the CPU of this machine.
+    '''
+    llvm.initialize_native_target()
+    llvm.initialize_native_asmprinter()
+    cpu = features = ''
+    if host_cpu:
+        cpu = llvm.get_host_cpu_name()
+        features = llvm.get_host_cpu_features().flatten()
+    return llvm.Target.from_default_triple().create_target_machine(
+        cpu=cpu, features=features, opt=opt_level, reloc=reloc)
+
+def optimize(llmod, opt_level=2, target_machine=None):
+    '''
+    Run LLVM's standard optimization pipeline for opt_level over llmod.
+    Level 1 and up includes SROA (mem2reg), instcombine, GVN and LICM.
+    Levels 2 and 3 also run the loop and SLP vectorizers.  Level 0 leaves
+    the module unchanged.
+    '''
+    if not opt_level:
+        return llmod
+    if target_machine is None:
+        target_machine = host_target_machine(opt_level)
+    tuning = llvm.create_pipeline_tuning_options(speed_level=opt_level)
+    tuning.loop_vectorization = opt_level >= 2
+    tuning.slp_vectorization = opt_level >= 2
+    passes = llvm.create_pass_builder(target_machine, tuning)
+    passes.getModulePassManager().run(llmod, passes)
+    return llmod
+
+def parse_module(text, target_machine):
+    llmod = llvm.parse_assembly(text)
+    llmod.triple = target_machine.triple
+    llmod.data_layout = str(target_machine.target_data)
+    llmod.verify()
+    return llmod
+
+def _cache_key(cache, text, target_machine, opt_level, host_cpu, kind):
+    # Compiled code depends on the IR, the target and how it is compiled
+    cpu = ''
+    if host_cpu:
+        cpu = (llvm.get_host_cpu_name(), llvm.get_host_cpu_features().flatten())
+    return cache.key(text, target_machine.triple, opt_level, cpu, kind)
+
+# The runtime in LLVM IR.  See wabbit/runtime.ll.
+RUNTIME_IR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'runtime.ll')
+
+def link_runtime(llmod):
+    '''
+    Link the runtime in wabbit/runtime.ll into llmod.  Its definitions
+    become internal to llmod, so the optimizer can inline them and drop
+    what is unused, and they don't clash with wabbit/runtime.c.
+    '''
+    with open(RUNTIME_IR) as file:
+        runtime = llvm.parse_assembly(file.read())
+    runtime.triple = llmod.triple
+    runtime.data_layout = llmod.data_layout
+    functions = [func.name for func in runtime.functions if not func.is_declaration]
+    variables = [var.name for var in runtime.global_variables
+                 if var.linkage == llvm.Linkage.external]
+    llmod.link_in(runtime)
+    for name in functions:
+        llmod.get_function(name).linkage = 'internal'
+    for name in variables:
+        llmod.get_global_variable(name).linkage = 'internal'
+    llmod.verify()
+    return llmod
+
+def compile_module(model, opt_level=0, dump=None, target_machine=None,
+                   fast_math=False, instrument=False, profile=None, runtime='c',
+                   call_main=True):
+    '''
+    Generate code for a type checked model and return it as a verified
+    (and optionally optimized) llvmlite.binding module.  If dump is a
+    file, the IR is written to it before and after optimization.  See
+    generate_program() for instrument, profile and call_main.  With runtime='ir',
+    the runtime is linked in from wabbit/runtime.ll before optimizing.
+    With runtime='c', it is left for wabbit/runtime.c, or the JIT.
+    '''
+    if target_machine is None:
+        target_machine = host_target_machine(opt_level)
+    llmod = parse_module(str(generate_program(model, fast_math=fast_math,
+                                              instrument=instrument,
+                                              profile=profile,
+                                              call_main=call_main)),
+                         target_machine)
+    if runtime == 'ir':
+        link_runtime(llmod)
+    if dump:
+        print(f'; ---- IR before optimization (-O{opt_level})', file=dump)
+        print(llmod, file=dump)
+    optimize(llmod, opt_level, target_machine)
+    if dump and opt_level:
+        print(f'; ---- IR after optimization (-O{opt_level})', file=dump)
+        print(llmod, file=dump)
+    return llmod
+
+def compile_split(model, opt_level=0, workers=None, host_cpu=False,
+                  fast_math=False):
+    '''
+    Like compile_module(), but each Wabbit function is generated and
+    optimized as a module of its own, using a pool of worker processes,
+    and the results are linked into the module for the top level.  The
+    functions are linked in source order, so the result does not depend
+    on the number of workers.  The linked module is optimized once more,
+    which inlines calls across functions as compile_module() would.
+    That pass is serial, but works on functions that are already
+    optimized.
+    '''
+    if workers is None:
+        workers = os.cpu_count() or 1
+    target_machine = host_target_machine(opt_level, host_cpu)
+    jobs = list(zip(function_definitions(model), function_interfaces(model)))
+    options = (opt_level, host_cpu, fast_math)
+    if workers > 1 and len(jobs) > 1:
+        chunksize = -(-len(jobs) // (workers * 4))
+        with ProcessPoolExecutor(workers, initializer=_init_codegen_worker,
+                                 initargs=options) as pool:
+            bitcodes = list(pool.map(_compile_function, jobs, chunksize=chunksize))
+    else:
+        _init_codegen_worker(*options)
+        bitcodes = [_compile_function(job) for job in jobs]
+
+    llmod = parse_module(str(generate_program(model, fast_math=fast_math,
+                                              functions=False)),
+                         target_machine)
+    for bitcode in bitcodes:
+        llmod.link_in(llvm.parse_bitcode(bitcode))
+    llmod.verify()
+    optimize(llmod, opt_level, target_machine)
+    return llmod
+
+# Settings of the process running _compile_function()
+_codegen_options = None
+
+def _init_codegen_worker(opt_level, host_cpu, fast_math):
+    global _codegen_options
+    target_machine = host_target_machine(opt_level, host_cpu)
+    _codegen_options = (opt_level, target_machine, fast_math)
+
+def _compile_function(job):
+    node, interface = job
+    opt_level, target_machine, fast_math = _codegen_options
+    llmod = parse_module(str(generate_function(node, interface, fast_math)),
+                         target_machine)
+    optimize(llmod, opt_level, target_machine)
+    # Modules can't be pickled, but bitcode can
+    return llmod.as_bitcode()
+
+def write_bitcode(llmod, filename):
+    # Bitcode is much quicker to write and to read back than textual IR
+    with open(filename, 'wb') as file:
+        file.write(llmod.as_bitcode())
+
+def read_bitcode(filename, target_machine=None):
+    '''
+    Load a module written by write_bitcode() (or --emit=bc) as a
+    verified llvmlite.binding module, ready for create_engine().
+    '''
+    with open(filename, 'rb') as file:
+        llmod = llvm.parse_bitcode(file.read())
+    if target_machine is not None:
+        llmod.triple = target_machine.triple
+        llmod.data_layout = str(target_machine.target_data)
+    llmod.verify()
+    return llmod
+
+def count_instructions(llmod):
+    return sum(1 for func in llmod.functions
+                 for block in func.blocks
+                 for _ in block.instructions)
+
+def build_executable(model, output='a.out', opt_level=2, host_cpu=False,
+                     fast_math=False, cache=None, workers=None,
+                     instrument=False, profile=None, runtime='ir'):
+    '''
+    Compile a type checked model to a native object in memory and link
+    it with the runtime into the executable output.  If cache (an
+    ObjectCache) is given, the object code is reused from it when the
+    same IR was compiled before with the same options.  If workers is
+    given, code is generated with compile_split() instead, which always
+    uses wabbit/runtime.c.  See generate_program() for instrument and
+    profile, and compile_module() for runtime.
+    '''
+    target_machine = host_target_machine(opt_level, host_cpu, reloc='pic')
+    if workers is not None:
+        llmod = compile_split(model, opt_level, workers, host_cpu, fast_math)
+        objcode = target_machine.emit_object(llmod)
+    elif cache is None:
+        llmod = compile_module(model, opt_level, target_machine=target_machine,
+                               fast_math=fast_math, instrument=instrument,
+                               profile=profile, runtime=runtime)
+        objcode = target_machine.emit_object(llmod)
+    else:
+        text = str(generate_program(model, fast_math=fast_math,
+                                    instrument=instrument, profile=profile))
+        key = _cache_key(cache, text, target_machine, opt_level, host_cpu,
+                         f'obj-{runtime}')
+        objcode = cache.get(key)
+        if objcode is None:
+            llmod = parse_module(text, target_machine)
+            if runtime == 'ir':
+                link_runtime(llmod)
+            optimize(llmod, opt_level, target_machine)
+            objcode = target_machine.emit_object(llmod)
+            cache.put(key, objcode)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        objfile = os.path.join(tmpdir, 'out.o')
+        with open(objfile, 'wb') as file:
+            file.write(objcode)
+        link_executable([objfile], output)
+    return output
+
+def link_executable(objfiles, output):
+    # Link object files with wabbit/main.c and wabbit/runtime.c
+    runtime_dir = os.path.dirname(os.path.abspath(__file__))
+    subprocess.run([os.environ.get('CC', 'cc'), '-o', output, *objfiles,
+                    os.path.join(runtime_dir, 'main.c'),
+                    os.path.join(runtime_dir, 'runtime.c')],
+                   check=True)
+
+def create_engine(llmod, target_machine=None, object_cache=None):
+    '''
+    Make an MCJIT execution engine for the host that owns llmod.
+    object_cache is an optional (notify_func, getbuffer_func) pair, as
+    taken by ExecutionEngine.set_object_cache().
+    '''
+    _init_jit()
+    if target_machine is None:
+        target_machine = host_target_machine()
+    engine = llvm.create_mcjit_compiler(llmod, target_machine)
+    if object_cache:
+        engine.set_object_cache(*object_cache)
+    engine.finalize_object()
+    return engine
+
+def create_cached_engine(model, cache, opt_level=0):
+    '''
+    Like create_engine(compile_module(model, opt_level)), but object code
+    is loaded from cache (an ObjectCache) when the same IR was compiled
+    before.  On a hit, neither the optimizer nor code generation runs.
+    '''
+    target_machine = host_target_machine(opt_level)
+    text = str(generate_program(model))
+    key = _cache_key(cache, text, target_machine, opt_level, False, 'jit')
+    objcode = cache.get(key)
+    llmod = parse_module(text, target_machine)
+    if objcode is None:
+        optimize(llmod, opt_level, target_machine)
+    return create_engine(llmod, target_machine,
+                         (lambda module, buffer: cache.put(key, buffer),
+                          lambda module: objcode))
+
+# Signature of LazyJIT._compile()
+_lazy_compiler_type = ctypes.CFUNCTYPE(ctypes.c_uint64, ctypes.c_void_p)
+
+class LazyJIT:
+    '''
+    Runs a type checked program, compiling each function only when it
+    is first called.  Functions are called through pointers that start
+    out null.  A caller finding a null pointer calls back into Python,
+    which compiles and optimizes the function in a module of its own;
+    the caller then stores the result in the pointer.  Start-up only
+    compiles the top-level code.  Calls are never inlined, since they
+    all go through pointers.
+
+    compile_times maps each compiled function to the seconds spent
+    compiling it.
+
+    An exception while compiling a function can't be raised through the
+    generated code waiting for it, and returning to that code would
+    call a null pointer.  Instead the traceback is printed and the
+    process exits with status 1.
+    '''
+    def __init__(self, model, opt_level=0, fast_math=False):
+        self.opt_level = opt_level
+        self.fast_math = fast_math
+        self.compile_times = {}
+        self.target_machine = host_target_machine(opt_level)
+
+        # Called from generated code.  Must live as long as the engine.
+        self._compiler = _lazy_compiler_type(self._compile)
+        self.compiler_address = ctypes.cast(self._compiler, ctypes.c_void_p).value
+        text = str(generate_program(model, fast_math=fast_math, functions=False,
+                                    lazy_compiler=self.compiler_address))
+        llmod = optimize(parse_module(text, self.target_machine), opt_level,
+                         self.target_machine)
+        self.engine = create_engine(llmod, self.target_machine)
+
+        # The function to compile is known by the address of its pointer
+        self.functions = {}
+        for node, interface in zip(function_definitions(model),
+                                   function_interfaces(model)):
+            pointer = self.engine.get_global_value_address(f'wabbit.{node.name}.ptr')
+            self.functions[pointer] = (node, interface)
+
+    def _compile(self, pointer):
+        try:
+            start = time.perf_counter()
+            node, interface = self.functions[pointer]
+            text = str(generate_function(node, interface, self.fast_math,
+                                         self.compiler_address))
+            llmod = optimize(parse_module(text, self.target_machine), self.opt_level,
+                             self.target_machine)
+            self.engine.add_module(llmod)
+            self.engine.finalize_object()
+            address = self.engine.get_function_address(f'wabbit.{node.name}')
+            if not address:
+                raise RuntimeError(f'No code for function {node.name}')
+            self.compile_times[node.name] = time.perf_counter() - start
+            return address
+        except BaseException:
+            traceback.print_exc()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(1)
+
+    def run(self):
+        run_main_block(self.engine)
+
+def run_jit(model, opt_level=0, cache=None):
+    '''
+    Compile a type checked model in memory and run it in this process.
+    '''
+    if cache is None:
+        engine = create_engine(compile_module(model, opt_level))
+    else:
+        engine = create_cached_engine(model, cache, opt_level)
+    run_main_block(engine)
+
+def run_main_block(engine):
+    main_block = ctypes.CFUNCTYPE(None)(engine.get_function_address('main_block'))
+    main_block()
+    # Flushes the output of wabbit/runtime.ll
+    engine.run_static_destructors()
+
+# ctypes types of Wabbit values, for calling compiled functions
+_ctypes_types = {
+    'int': ctypes.c_int32,
+    'float': ctypes.c_double,
+    'bool': ctypes.c_bool,
+}
+
+class WabbitLibrary:
+    '''
+    The functions of a type checked program compiled in this process.
+    Each func is an attribute taking and returning Python values:
+
+        lib = WabbitLibrary(parse_file('tests/Func/fib.wb'))
+        lib.fib(20)
+
+    The top-level statements run once, when the library is made, to set
+    up global variables.  main() is not called.
+    '''
+    def __init__(self, model, opt_level=2, fast_math=False):
+        llmod = compile_module(model, opt_level, fast_math=fast_math, call_main=False)
+        self.engine = create_engine(llmod)
+        run_main_block(self.engine)
+        self.functions = {}
+        for node in function_definitions(model):
+            functype = ctypes.CFUNCTYPE(_ctypes_types[node.type],
+                                        *(_ctypes_types[p.type] for p in node.params))
+            address = self.engine.get_function_address(f'wabbit.{node.name}')
+            self.functions[node.name] = functype(address)
+
+    def __getattr__(self, name):
+        try:
+            return self.functions[name]
+        except KeyError:
+            raise AttributeError(f'No function {name}') from None
+
+    def __dir__(self):
+        return [*super().__dir__(), *self.functions]
+
 # Sample main program that runs the compiler
-def main(filename):
+def main(argv):
+    import argparse
     from .parse import parse_file
     from .typecheck import check_program
+    from .transform import transform
 
-    model = parse_file(filename)
-    check_program(model)
-    mod = generate_program(model)
-    with open('out.ll', 'w') as file:
-        file.write(str(mod))
-    print('Wrote out.ll')
+    parser = argparse.ArgumentParser(prog='wabbit.llvm')
+    parser.add_argument('filename')
+    parser.add_argument('-O', dest='opt_level', type=int, default=0,
+                        choices=range(4), help='optimization level')
+    parser.add_argument('--dump-ir', action='store_true',
+                        help='print the IR before and after optimization')
+    parser.add_argument('--jit', action='store_true',
+                        help='run the program instead of writing a file')
+    parser.add_argument('--emit', choices=('ll', 'bc', 'obj', 'exe'), default='ll',
+                        help='write LLVM IR (out.ll), LLVM bitcode (out.bc), '
+                             'an object (out.o) or an executable (a.out)')
+    parser.add_argument('-o', dest='output', help='output file name')
+    parser.add_argument('--host-cpu', action='store_true',
+                        help='generate code for the CPU of this machine')
+    parser.add_argument('--fast-math', action='store_true',
+                        help='allow fast-math floating point optimizations')
+    parser.add_argument('--cache', action='store_true',
+                        help='reuse compiled code from the cache in '
+                             '$WABBIT_CACHE_DIR (default ~/.cache/wabbit)')
+    parser.add_argument('--lazy', action='store_true',
+                        help='with --jit, compile each function when it is '
+                             'first called')
+    parser.add_argument('--runtime', choices=('c', 'ir'),
+                        help='use the runtime in wabbit/runtime.c, or link the '
+                             'one in wabbit/runtime.ll into the program '
+                             '(default for executables)')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='generate and optimize functions in parallel '
+                             'with this many processes')
+    parser.add_argument('--profile-generate', action='store_true',
+                        help='count how often each block and branch runs and '
+                             'write the counts to $WABBIT_PROFILE '
+                             f'(default {PROFILE_FILE}) at exit')
+    parser.add_argument('--profile-use', metavar='PROFILE',
+                        help='optimize using a profile written by a program '
+                             'built with --profile-generate')
+    args = parser.parse_args(argv)
+    cache = ObjectCache() if args.cache else None
+    profile = read_profile(args.profile_use) if args.profile_use else None
+    pgo = dict(instrument=args.profile_generate, profile=profile)
+    if args.jobs and (args.profile_generate or profile):
+        parser.error('profiles are not supported with --jobs')
+    if args.jobs and args.runtime == 'ir':
+        parser.error('--runtime=ir is not supported with --jobs')
+    runtime = args.runtime or ('ir' if args.emit == 'exe' and not args.jit else 'c')
 
-if __name__ == '__main__':
-    import sys
-    main(sys.argv[1])
+    model = parse_file(args.filename)
+    check_program(model).exit_on_errors()
+    model = transform(model)
+    dump = sys.stderr if args.dump_ir else None
+    if args.jit and args.lazy:
+        LazyJIT(model, args.opt_level, args.fast_math).run()
+    elif args.jit and cache and not any(pgo.values()) and runtime == 'c':
+        run_main_block(create_cached_engine(model, cache, args.opt_level))
+    elif args.jit:
+        if args.jobs:
+            llmod = compile_split(model, args.opt_level, args.jobs,
+                                  fast_math=args.fast_math)
+        else:
+            llmod = compile_module(model, args.opt_level, dump,
+                                   fast_math=args.fast_math, runtime=runtime, **pgo)
+        run_main_block(create_engine(llmod))
+    elif args.emit == 'exe':
+        output = build_executable(model, args.output or 'a.out', args.opt_level,
+                                  args.host_cpu, args.fast_math, cache, args.jobs,
+                                  runtime=runtime, **pgo)
+        print(f'Wrote {output}')
+    else:
+        reloc = 'pic' if args.emit == 'obj' else 'default'
+        target_machine = host_target_machine(args.opt_level, args.host_cpu, reloc)
+        if args.jobs:
+            llmod = compile_split(model, args.opt_level, args.jobs,
+                                  args.host_cpu, args.fast_math)
+        else:
+            llmod = compile_module(model, args.opt_level, dump, target_machine,
+                                   args.fast_math, runtime=runtime, **pgo)
+        output = args.output or f'out.{"o" if args.emit == "obj" else args.emit}'
+        if args.emit == 'obj':
+            with open(output, 'wb') as file:
+                file.write(target_machine.emit_object(llmod))
+        elif args.emit == 'bc':
+            write_bitcode(llmod, output)
+        else:
+            with open(output, 'w') as file:
+                file.write(str(llmod))
+        print(f'Wrote {output}')
 
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -48,13 +48,15 @@
 
 from typing import List
 
-VALID_TYPES = {
-    'int',
-    'float',
-    'char',
-    'bool',
-    'unit'
-}
+# Type names are interned as small integer ids so that the type checker
+# and the code generators can index dense tables instead of hashing
+# strings.  Id 0 means "no type" and is given to expressions that fail
+# to type check.
+TYPE_NAMES = (None, 'int', 'float', 'char', 'bool', 'unit')
+TYPE_IDS = {name: typeid for typeid, name in enumerate(TYPE_NAMES)}
+INT, FLOAT, CHAR, BOOL, UNIT = range(1, len(TYPE_NAMES))
+
+VALID_TYPES = set(TYPE_NAMES[1:])
 
 class Statement:
     '''
@@ -104,6 +106,7 @@ class Integer(Expression):
         assert isinstance(value, str)
         self.value = value
         self.type = 'int'
+        self.typeid = INT
 
     def __repr__(self):
         return f'Integer({self.value})'
@@ -116,6 +119,7 @@ class Float(Expression):
         assert isinstance(value, str)
         self.value = value
         self.type = 'float'
+        self.typeid = FLOAT
 
     def __repr__(self):
         return f'Float({self.value})'
@@ -231,7 +235,7 @@ class WhileLoop(Statement):
     '''
     def __init__(self, condition, body):
         assert isinstance(condition, Expression)
-        assert isinstance(body, Statement) or isinstance(body, Statements)
+        assert isinstance(body, (Statement, Statements, List))
         self.condition = condition
         self.body = body
     def __repr__(self):
@@ -273,6 +277,61 @@ class Print(Statement):
     def __repr__(self):
         return f'Print({self.expression})'
 
+class Parameter(Declaration):
+    '''
+    A function parameter
+
+    Example: x int
+    '''
+    def __init__(self, name, type):
+        assert isinstance(name, str)
+        assert isinstance(type, str)
+        self.name = name
+        self.type = type
+    def __repr__(self):
+        return f'Parameter({self.name}, {self.type})'
+
+class FunctionDefinition(Declaration):
+    '''
+    Example:
+        func square(x int) int {
+            return x * x;
+        }
+    '''
+    def __init__(self, name, params, type, body):
+        assert isinstance(name, str)
+        assert all(isinstance(p, Parameter) for p in params)
+        assert isinstance(type, str)
+        assert isinstance(body, List)
+        self.name = name
+        self.params = params
+        self.type = type     # The return type
+        self.body = body
+    def __repr__(self):
+        return f'FunctionDefinition({self.name}, {self.params}, {self.type}, {self.body})'
+
+class Return(Statement):
+    '''
+    Example: return x * x;
+    '''
+    def __init__(self, value):
+        assert isinstance(value, Expression)
+        self.value = value
+    def __repr__(self):
+        return f'Return({self.value})'
+
+class FunctionCall(Expression):
+    '''
+    Example: square(4)
+    '''
+    def __init__(self, name, arguments):
+        assert isinstance(name, str)
+        assert all(isinstance(a, Expression) for a in arguments)
+        self.name = name
+        self.arguments = arguments
+    def __repr__(self):
+        return f'FunctionCall({self.name}, {self.arguments})'
+
 class Statements:
     '''
     Example:
@@ -286,78 +345,129 @@ class Statements:
         return f'Statements({self.statements})'
 
 
+def count_nodes(node):
+    # Number of model nodes in a program
+    if isinstance(node, list):
+        return sum(count_nodes(n) for n in node)
+    elif isinstance(node, (Statement, Expression, Statements)):
+        return 1 + sum(count_nodes(value) for value in vars(node).values())
+    else:
+        return 0
+
+
 # ------ Debugging function to convert a model into source code (for easier viewing)
 
 def to_source(node, num_indent=0, curr_indent=0):
+    # The pieces of the source are collected in a list and joined once.
+    # Joining the source of the children at every node would copy the
+    # text of a node once for every level above it, which is quadratic
+    # in the depth of a program.
+    out = []
+    _to_source(node, out, num_indent, curr_indent)
+    return ''.join(out)
+
+def _to_source(node, out, num_indent=0, curr_indent=0):
 
     # !!! BUG
     indent_sz = curr_indent*num_indent*'____'
+    write = out.append
 
     if isinstance(node, BinOp):
-        return indent_sz + \
-               f'{to_source(node.left)} {node.op} {to_source(node.right)}'
+        write(indent_sz)
+        _to_source(node.left, out)
+        write(f' {node.op} ')
+        _to_source(node.right, out)
 
-    elif isinstance(node, Integer):
-        return node.value
-
-    elif isinstance(node, Float):
-        return node.value
+    elif isinstance(node, (Integer, Float)):
+        write(node.value)
 
     elif isinstance(node, UnaryOp):
-        return f'{node.op}{to_source(node.operand)}'
+        write(node.op)
+        _to_source(node.operand, out)
 
     elif isinstance(node, DeclareConst):
-        return indent_sz + \
-               f'const {node.name} = {to_source(node.value)};\n'
+        write(f'{indent_sz}const {node.name} = ')
+        _to_source(node.value, out)
+        write(';\n')
 
     elif isinstance(node, DeclareVar):
-        return indent_sz + (f'var {node.name}' + \
-            (f' {node.type}' if node.type else '') + \
-            ((" = " + to_source(node.value)) if node.value else '') + \
-            ";\n")
+        write(f'{indent_sz}var {node.name}')
+        if node.type:
+            write(f' {node.type}')
+        if node.value:
+            write(' = ')
+            _to_source(node.value, out)
+        write(';\n')
 
     elif isinstance(node, Assignment):
-        return indent_sz + \
-               f'{node.location} = {to_source(node.value)};\n'
+        write(f'{indent_sz}{node.location} = ')
+        _to_source(node.value, out)
+        write(';\n')
 
     elif isinstance(node, Load):
-        return f'{node.location}'
+        write(f'{node.location}')
 
     elif isinstance(node, IfStatement):
-        return f'if {to_source(node.condition)}' + ' {\n' + \
-               f'    {to_source(node.consequence)}' + \
-               '} else {\n' + \
-               f'    {to_source(node.alternative)}' + \
-               '}'
-
-
+        write('if ')
+        _to_source(node.condition, out)
+        write(' {\n    ')
+        _to_source(node.consequence, out)
+        write('}')
+        if node.alternative is not None:
+            write(' else {\n    ')
+            _to_source(node.alternative, out)
+            write('}')
 
     elif isinstance(node, WhileLoop):
-        return indent_sz + \
-               f'while {to_source(node.condition)}' + ' {\n' + \
-               f'{to_source(node.body, num_indent=1, curr_indent=1)}' + \
-               '}'
-
-
+        write(f'{indent_sz}while ')
+        _to_source(node.condition, out)
+        write(' {\n')
+        _to_source(node.body, out, num_indent=1, curr_indent=1)
+        write('}')
 
     elif isinstance(node, Compound):
-        return '{ ' + \
-               ''.join([to_source(s).rstrip() for s in node.statements.statements])  + ' }'
+        write('{ ')
+        for s in node.statements.statements:
+            write(to_source(s).rstrip())
+        write(' }')
 
     elif isinstance(node, ExprAsStatement):
-        return f'{to_source(node.expression)};'
+        _to_source(node.expression, out)
+        write(';')
 
     elif isinstance(node, Print):
-        return indent_sz + \
-               f'print {to_source(node.expression)};\n'
+        write(f'{indent_sz}print ')
+        _to_source(node.expression, out)
+        write(';\n')
+
+    elif isinstance(node, FunctionDefinition):
+        params = ', '.join(f'{p.name} {p.type}' for p in node.params)
+        write(f'{indent_sz}func {node.name}({params}) {node.type}' + ' {\n')
+        _to_source(node.body, out, num_indent=1, curr_indent=1)
+        write('}\n')
+
+    elif isinstance(node, Return):
+        write(f'{indent_sz}return ')
+        _to_source(node.value, out)
+        write(';\n')
+
+    elif isinstance(node, FunctionCall):
+        write(f'{node.name}(')
+        for n, arg in enumerate(node.arguments):
+            if n:
+                write(', ')
+            _to_source(arg, out)
+        write(')')
 
     elif isinstance(node, Statements):
-        return ''.join([to_source(s, num_indent=num_indent, curr_indent=curr_indent) for s in node.statements])
+        for s in node.statements:
+            _to_source(s, out, num_indent=num_indent, curr_indent=curr_indent)
 
     elif isinstance(node, List):
         # This is for cases where the node is a list of statements
         # !!! FIX Super hacky bandaid solution
-        return ''.join([to_source(s, num_indent=num_indent, curr_indent=curr_indent) for s in node])
+        for s in node:
+            _to_source(s, out, num_indent=num_indent, curr_indent=curr_indent)
 
     else:
         raise RuntimeError(f"Can't convert {node} to source")
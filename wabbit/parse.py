@@ -44,6 +44,14 @@
 #
 # continue_statement : CONTINUE SEMI
 #
+# func_definition : FUNC NAME LPAREN [ parameters ] RPAREN type LBRACE statements RBRACE
+#
+# parameters : parameter { COMMA parameter }
+#
+# parameter : NAME type
+#
+# return_statement : RETURN expr SEMI
+#
 # expr : expr PLUS expr        (+)
 #      | expr MINUS expr       (-)
 #      | expr TIMES expr       (*)
@@ -63,6 +71,9 @@
 #      | location
 #      | literal
 #      | LBRACE statements RBRACE
+#      | NAME LPAREN [ arguments ] RPAREN
+#
+# arguments : expr { COMMA expr }
 #
 # literal : INTEGER
 #         | FLOAT
@@ -125,14 +136,25 @@ class WabbitParser(Parser):
     # Get list of tokens from tokenizer
     tokens = Tokenizer.tokens
 
+    def __init__(self):
+        # Where each function definition is in the text, as a
+        # (start, end) index pair (see parse_source_spans())
+        self.function_spans = {}
+
     precedence = (
+        ('left', LOR),
+        ('left', LAND),
+        ('nonassoc', LT, LE, GT, GE, EQ, NE),
         ('left', PLUS, MINUS),
         ('left', TIMES, DIVIDE),
     )
 
     @_('statements statement')
     def statements(self, p):
-        return p.statements + [p.statement]
+        # Append in place. Building a new list on every reduction is
+        # quadratic in the number of statements.
+        p.statements.append(p.statement)
+        return p.statements
 
     @_('statement')
     def statements(self, p):
@@ -143,6 +165,9 @@ class WabbitParser(Parser):
        'const_declare_statement',
        'var_declare_statement',
        'if_statement',
+       'while_statement',
+       'func_definition',
+       'return_statement',
        'expr_statement')
     def statement(self, p):
         return p[0]
@@ -188,6 +213,56 @@ class WabbitParser(Parser):
     def if_statement(self, p):
         return IfStatement(p[1], p[3], p[7])
 
+    @_('WHILE expr LBRACE statements RBRACE')
+    def while_statement(self, p):
+        return WhileLoop(p.expr, p.statements)
+
+    @_('FUNC NAME LPAREN parameters RPAREN typ LBRACE statements RBRACE')
+    def func_definition(self, p):
+        node = FunctionDefinition(p.NAME, p.parameters, p.typ.name, p.statements)
+        self.function_spans[node] = (p.index, p.end)
+        return node
+
+    @_('FUNC NAME LPAREN RPAREN typ LBRACE statements RBRACE')
+    def func_definition(self, p):
+        node = FunctionDefinition(p.NAME, [], p.typ.name, p.statements)
+        self.function_spans[node] = (p.index, p.end)
+        return node
+
+    @_('parameters COMMA parameter')
+    def parameters(self, p):
+        p.parameters.append(p.parameter)
+        return p.parameters
+
+    @_('parameter')
+    def parameters(self, p):
+        return [p.parameter]
+
+    @_('NAME typ')
+    def parameter(self, p):
+        return Parameter(p.NAME, p.typ.name)
+
+    @_('RETURN expr SEMI')
+    def return_statement(self, p):
+        return Return(p.expr)
+
+    @_('NAME LPAREN arguments RPAREN')
+    def expr(self, p):
+        return FunctionCall(p.NAME, p.arguments)
+
+    @_('NAME LPAREN RPAREN')
+    def expr(self, p):
+        return FunctionCall(p.NAME, [])
+
+    @_('arguments COMMA expr')
+    def arguments(self, p):
+        p.arguments.append(p.expr)
+        return p.arguments
+
+    @_('expr')
+    def arguments(self, p):
+        return [p.expr]
+
     @_('expr PLUS expr',
        'expr MINUS expr',
        'expr TIMES expr',
@@ -251,6 +326,14 @@ def parse_source(text):
     parser = WabbitParser()
     return parser.parse(tokens)
 
+def parse_source_spans(text):
+    '''
+    Like parse_source(), but also returns where each function definition
+    is in text, as a dict mapping its node to a (start, end) index pair.
+    '''
+    parser = WabbitParser()
+    return parser.parse(tokenize(text)), parser.function_spans
+
 def parse_file(filename):
     with open(filename) as file:
         text = file.read()
@@ -1,29 +1,141 @@
 /* For LLVM, you need some runtime functions to produce ouput.  Use
-   these and include them in final compilation with clang. */
+   these and include them in final compilation with clang.
 
+   Output is collected in a buffer of our own and written with a
+   single write() when the buffer fills up, when _flush() is called,
+   or at exit.  Numbers are formatted here rather than with printf. */
+
+#include <math.h>
 #include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+
+#define OUTBUF_SIZE 65536
+
+static char outbuf[OUTBUF_SIZE];
+static size_t outpos = 0;
+static int flush_at_exit = 0;
+
+void _flush(void) {
+  size_t done = 0;
+  while (done < outpos) {
+    ssize_t n = write(1, outbuf + done, outpos - done);
+    if (n <= 0) {
+      break;
+    }
+    done += n;
+  }
+  outpos = 0;
+}
+
+/* Make room for size bytes and return where they go */
+static char *reserve(size_t size) {
+  if (!flush_at_exit) {
+    atexit(_flush);
+    flush_at_exit = 1;
+  }
+  if (outpos + size > OUTBUF_SIZE) {
+    _flush();
+  }
+  return outbuf + outpos;
+}
+
+static void append(const char *s, size_t size) {
+  memcpy(reserve(size), s, size);
+  outpos += size;
+}
+
+/* Write the digits of x at the end of buf and return where they start */
+static char *format_unsigned(char *end, unsigned long long x) {
+  do {
+    *--end = '0' + x % 10;
+    x /= 10;
+  } while (x);
+  return end;
+}
 
 void _printi(int x) {
-  printf("Out: %i\n", x);
+  char digits[16];
+  char *end = digits + sizeof(digits);
+  char *start = format_unsigned(end, x < 0 ? -(long long) x : x);
+  if (x < 0) {
+    *--start = '-';
+  }
+  char *out = reserve(24);
+  memcpy(out, "Out: ", 5);
+  memcpy(out + 5, start, end - start);
+  out[5 + (end - start)] = '\n';
+  outpos += 6 + (end - start);
 }
 
+/* Same output as printf("Out: %lf\n", x).  The integer part and the
+   six decimals are formatted as integers.  Rounding the decimals can
+   only go the wrong way when they are within the error of x * 1e6 of
+   a half, and those cases (and very large numbers, infinity and NaN)
+   are left to printf. */
 void _printf(double x) {
-  printf("Out: %lf\n", x);
+  double ax = fabs(x);
+  if (ax < 1e15) {
+    unsigned long long ipart = (unsigned long long) ax;
+    double scaled = (ax - ipart) * 1e6;
+    unsigned long long decimals = (unsigned long long) scaled;
+    double rest = scaled - decimals;
+    if (fabs(rest - 0.5) > 1e-6) {
+      if (rest > 0.5 && ++decimals == 1000000) {
+        decimals = 0;
+        ipart++;
+      }
+      char digits[32];
+      char *end = digits + sizeof(digits);
+      /* The leading 1 of decimals + 1000000 makes room for the point */
+      char *start = format_unsigned(end, decimals + 1000000);
+      *start = '.';
+      start = format_unsigned(start, ipart);
+      if (signbit(x)) {
+        *--start = '-';
+      }
+      char *out = reserve(48);
+      memcpy(out, "Out: ", 5);
+      memcpy(out + 5, start, end - start);
+      out[5 + (end - start)] = '\n';
+      outpos += 6 + (end - start);
+      return;
+    }
+  }
+  /* %lf of the largest double is 316 characters */
+  int n = snprintf(reserve(330), 330, "Out: %lf\n", x);
+  outpos += n;
 }
 
 void _printb(int x) {
   if (x) {
-    printf("Out: true\n");
+    append("Out: true\n", 10);
   } else {
-    printf("Out: false\n");
+    append("Out: false\n", 11);
   }
 }
 
 void _printc(char c) {
-  printf("%c", c);
-  fflush(stdout);
+  *reserve(1) = c;
+  outpos += 1;
 }
 
 void _printu() {
-  printf("Out: ()\n");
+  append("Out: ()\n", 8);
+}
+
+void _write_profile(const long long *counters, int n) {
+  const char *filename = getenv("WABBIT_PROFILE");
+  FILE *f = fopen(filename ? filename : "wabbit.profdata", "w");
+  int i;
+  if (!f) {
+    perror("wabbit.profdata");
+    return;
+  }
+  fprintf(f, "wabbit-profile %d\n", n);
+  for (i = 0; i < n; i++) {
+    fprintf(f, "%lld\n", counters[i]);
+  }
+  fclose(f);
 }
@@ -0,0 +1,179 @@
+; wabbit/runtime.ll
+;
+; The runtime functions of wabbit/runtime.c written in LLVM IR.  This
+; module is linked into the program before it is optimized (see
+; link_runtime() in wabbit/llvm.py), so the optimizer can inline the
+; print functions into the code calling them.
+;
+; Output goes to a static buffer that is written to standard output
+; when it fills up and when the program exits (through llvm.global_dtors).
+; Assumes a 64-bit Unix target.
+
+@.out_prefix = private unnamed_addr constant [5 x i8] c"Out: "
+@.fmt_f = private unnamed_addr constant [10 x i8] c"Out: %lf\0A\00"
+@.out_true = private unnamed_addr constant [10 x i8] c"Out: true\0A"
+@.out_false = private unnamed_addr constant [11 x i8] c"Out: false\0A"
+@.out_unit = private unnamed_addr constant [8 x i8] c"Out: ()\0A"
+
+@_outbuf = global [65536 x i8] zeroinitializer
+@_outpos = global i64 0
+
+@llvm.global_dtors = appending global [1 x { i32, ptr, ptr }] [{ i32, ptr, ptr } { i32 65535, ptr @_flush, ptr null }]
+
+declare i64 @write(i32, ptr, i64)
+declare i32 @snprintf(ptr, i64, ptr, ...)
+declare void @llvm.memcpy.p0.p0.i64(ptr, ptr, i64, i1)
+
+; Write out everything in the buffer
+define void @_flush() {
+entry:
+  %pos = load i64, ptr @_outpos
+  br label %loop
+
+loop:
+  %done = phi i64 [ 0, %entry ], [ %next, %wrote ]
+  %more = icmp slt i64 %done, %pos
+  br i1 %more, label %write, label %exit
+
+write:
+  %p = getelementptr inbounds i8, ptr @_outbuf, i64 %done
+  %left = sub i64 %pos, %done
+  %n = call i64 @write(i32 1, ptr %p, i64 %left)
+  %ok = icmp sgt i64 %n, 0
+  br i1 %ok, label %wrote, label %exit
+
+wrote:
+  %next = add i64 %done, %n
+  br label %loop
+
+exit:
+  store i64 0, ptr @_outpos
+  ret void
+}
+
+; Make room for size bytes and return where they go
+define ptr @_reserve(i64 %size) alwaysinline {
+entry:
+  %pos = load i64, ptr @_outpos
+  %end = add i64 %pos, %size
+  %full = icmp ugt i64 %end, 65536
+  br i1 %full, label %flush, label %done
+
+flush:
+  call void @_flush()
+  br label %done
+
+done:
+  %start = phi i64 [ %pos, %entry ], [ 0, %flush ]
+  %p = getelementptr inbounds i8, ptr @_outbuf, i64 %start
+  ret ptr %p
+}
+
+; Append size bytes at p to the buffer
+define void @_append(ptr %p, i64 %size) alwaysinline {
+entry:
+  %dst = call ptr @_reserve(i64 %size)
+  call void @llvm.memcpy.p0.p0.i64(ptr %dst, ptr %p, i64 %size, i1 false)
+  %pos = load i64, ptr @_outpos
+  %end = add i64 %pos, %size
+  store i64 %end, ptr @_outpos
+  ret void
+}
+
+; Format into the buffer with snprintf.  size must be enough for any
+; output of fmt.
+define void @_format_f(ptr %fmt, i64 %size, double %x) alwaysinline {
+entry:
+  %dst = call ptr @_reserve(i64 %size)
+  %n = call i32 (ptr, i64, ptr, ...) @snprintf(ptr %dst, i64 %size, ptr %fmt, double %x)
+  %written = sext i32 %n to i64
+  call void @_advance(i64 %written)
+  ret void
+}
+
+define void @_advance(i64 %size) alwaysinline {
+entry:
+  %pos = load i64, ptr @_outpos
+  %end = add i64 %pos, %size
+  store i64 %end, ptr @_outpos
+  ret void
+}
+
+; Integers are formatted here rather than with snprintf, which costs
+; more than the rest of a print put together
+define void @_printi(i32 %x) {
+entry:
+  %digits = alloca [16 x i8]
+  %dst = call ptr @_reserve(i64 24)
+  call void @llvm.memcpy.p0.p0.i64(ptr %dst, ptr @.out_prefix, i64 5, i1 false)
+  %neg = icmp slt i32 %x, 0
+  %wide = sext i32 %x to i64
+  %negated = sub i64 0, %wide
+  %abs = select i1 %neg, i64 %negated, i64 %wide
+  br label %digit
+
+; Digits are written backwards from the end of digits
+digit:
+  %value = phi i64 [ %abs, %entry ], [ %quotient, %digit ]
+  %end = phi i64 [ 16, %entry ], [ %start, %digit ]
+  %quotient = udiv i64 %value, 10
+  %remainder = urem i64 %value, 10
+  %low = trunc i64 %remainder to i8
+  %char = add i8 %low, 48
+  %start = sub i64 %end, 1
+  %p = getelementptr inbounds i8, ptr %digits, i64 %start
+  store i8 %char, ptr %p
+  %more = icmp ne i64 %quotient, 0
+  br i1 %more, label %digit, label %sign
+
+; At most 10 digits, so there is always room for the sign
+sign:
+  %minus_at = sub i64 %start, 1
+  %minus = getelementptr inbounds i8, ptr %digits, i64 %minus_at
+  store i8 45, ptr %minus
+  %first = select i1 %neg, i64 %minus_at, i64 %start
+  %length = sub i64 16, %first
+  %src = getelementptr inbounds i8, ptr %digits, i64 %first
+  %out = getelementptr inbounds i8, ptr %dst, i64 5
+  call void @llvm.memcpy.p0.p0.i64(ptr %out, ptr %src, i64 %length, i1 false)
+  %newline = getelementptr inbounds i8, ptr %out, i64 %length
+  store i8 10, ptr %newline
+  %written = add i64 %length, 6
+  call void @_advance(i64 %written)
+  ret void
+}
+
+; %lf of the largest double is 316 characters
+define void @_printf(double %x) {
+entry:
+  call void @_format_f(ptr @.fmt_f, i64 330, double %x)
+  ret void
+}
+
+define void @_printb(i32 %x) {
+entry:
+  %true = icmp ne i32 %x, 0
+  br i1 %true, label %if_true, label %if_false
+
+if_true:
+  call void @_append(ptr @.out_true, i64 10)
+  ret void
+
+if_false:
+  call void @_append(ptr @.out_false, i64 11)
+  ret void
+}
+
+define void @_printc(i8 %c) {
+entry:
+  %dst = call ptr @_reserve(i64 1)
+  store i8 %c, ptr %dst
+  call void @_advance(i64 1)
+  ret void
+}
+
+define void @_printu() {
+entry:
+  call void @_append(ptr @.out_unit, i64 8)
+  ret void
+}
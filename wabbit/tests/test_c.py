@@ -0,0 +1,181 @@
+import os
+import re
+import subprocess
+import tempfile
+
+from wabbit.model import *
+from wabbit.parse import *
+from wabbit.typecheck import *
+from wabbit.cache import ObjectCache
+from wabbit.c import *
+from wabbit.llvm import run_jit
+from wabbit.wasm import encode_module, generate_program
+from wabbit.wasmrun import run_wasm
+from wabbit.transform import transform
+
+SCRIPT_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'tests', 'Script')
+
+def run_program(code):
+    # Compile C source with the system compiler and return its output
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source = os.path.join(tmpdir, 'out.c')
+        exe = os.path.join(tmpdir, 'a.out')
+        with open(source, 'w') as file:
+            file.write(code)
+        subprocess.run([os.environ.get('CC', 'cc'), '-Wall', '-Werror', '-fwrapv',
+                        '-o', exe, source], check=True)
+        return subprocess.run([exe], capture_output=True, text=True, check=True).stdout
+
+def compile_source(source, **kwargs):
+    model = parse_source(source)
+    check_program(model)
+    return compile_program(model, **kwargs)
+
+def test_scripts():
+    # The scripts that the parser handles completely
+    for name in ('cond', 'fact', 'fib', 'floattest', 'inttest'):
+        model = parse_file(os.path.join(SCRIPT_DIR, f'{name}.wb'))
+        check_program(model)
+        with open(os.path.join(SCRIPT_DIR, f'{name}.out')) as file:
+            expected = file.read()
+        assert run_program(compile_program(model)) == expected, name
+        assert run_program(compile_program(model, structured=True)) == expected, name
+
+def test_functions():
+    code = compile_source("""
+        var count int = 0;
+        func bump(by int) int {
+            count = count + by;
+            return count;
+        }
+        func half(x float) float { return x / 2.0; }
+        func main() int {
+            var x int = 1;
+            if count == 0 {
+                var x int = 7;
+                print x;
+            }
+            print x;
+            print count + bump(5);
+            print bump(1) < count;
+            print half(5.0);
+            return 0;
+        }
+    """)
+    assert 'int w_main(void)' in code
+    assert run_program(code) == "7\n1\n5\nfalse\n2.500000\n"
+
+def test_negative_literals():
+    # Constant folding makes negative literals, which C mustn't read as --
+    model = parse_source("""
+        var x int = 0 - 3;
+        print -x;
+        print 0 - 2147483647 - 1;
+        print -x * -2;
+        print 0.0 - 1.5;
+    """)
+    check_program(model)
+    code = compile_program(transform(model))
+    assert run_program(code) == "3\n-2147483648\n-6\n-1.500000\n"
+    # A leading zero doesn't make an octal number
+    assert run_program(compile_source("var x int = 010; print x;")) == "10\n"
+
+def test_short_circuit():
+    # The right side of && and || only runs when it decides the result
+    source = """
+        var x int = 0;
+        print x != 0 && 10 / x > 1;
+        print x == 0 || 10 / x > 1;
+        var calls int = 0;
+        func bump() bool { calls = calls + 1; return 1 == 1; }
+        print x > 0 && bump() || bump() && x < 1;
+        print calls;
+    """
+    assert run_program(compile_source(source)) == "false\ntrue\ntrue\n1\n"
+    assert run_program(compile_source(source, structured=True)) == "false\ntrue\ntrue\n1\n"
+
+def test_names():
+    # Names that C or <stdio.h> already use
+    code = compile_source("""
+        var puts int = 3;
+        var printf int = 4;
+        func int_(x int) int { var while_ int = x; return while_; }
+        print puts + printf + int_(5);
+    """)
+    assert run_program(code) == "12\n"
+
+def test_structured():
+    source = """
+        var n int = 0;
+        var total int = 0;
+        while n <= 9 {
+            var square int = n * n;
+            if square >= 21 {
+                var big int = square - 20;
+                total = total + big;
+            } else {
+                total = total - 1;
+            }
+            n = n + 1;
+        }
+        print total;
+    """
+    code = compile_source(source, structured=True)
+    assert 'goto' not in code
+    assert 'while (1) {' in code
+    assert '        int w_big;' in code
+    assert run_program(code) == run_program(compile_source(source)) == "150\n"
+
+def test_temporary_reuse():
+    # Every statement needs a few temporaries, but never at the same time
+    source = 'var a int = 1;\nvar b float = 2.0;\n' + ''.join(
+        f'a = a + {i} * 3 - a / 3;\nb = b * 0.5 + {i}.0 * b;\nprint a < {i};\n'
+        for i in range(200))
+    code = compile_source(source)
+    fresh = compile_source(source, reuse_temporaries=False)
+    assert len(re.findall(r'int _i\d+;', code)) == 2
+    assert len(re.findall(r'double _f\d+;', code)) == 2
+    assert len(re.findall(r'int _i\d+;', fresh)) == 1000
+    assert run_program(code) == run_program(fresh)
+
+def test_run_c(capfd):
+    model = parse_source("""
+        var total int;
+        var i int = 0;
+        while i < 5 {
+            total = total + i;
+            i = i + 1;
+        }
+        print total;
+        print 1.5;
+    """)
+    check_program(model)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = ObjectCache(tmpdir, suffix='.so')
+        for _ in range(2):
+            run_c(model, cache)
+            assert capfd.readouterr().out == "10\n1.500000\n"
+        # The second run used the library from the first one
+        assert (cache.hits, cache.misses) == (1, 1)
+        assert cache.stats()['entries'] == 1
+
+def test_wraparound(capfd):
+    # Int overflow wraps around the same way with every backend
+    model = parse_source("""
+        var i int = 2147483600;
+        var n int = 0;
+        while i > 0 {
+            i = i + 1;
+            n = n + 1;
+        }
+        print n;
+        print 2147483647 * 3;
+    """)
+    check_program(model)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        run_c(model, ObjectCache(tmpdir, suffix='.so'))
+    assert capfd.readouterr().out == "48\n2147483645\n"
+    run_jit(model, 2)
+    assert capfd.readouterr().out == "Out: 48\nOut: 2147483645\n"
+    run_wasm(encode_module(generate_program(model).module), engine='python')
+    assert capfd.readouterr().out == "48\n2147483645\n"
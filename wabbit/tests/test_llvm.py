@@ -1,4 +1,7 @@
+import ctypes
+import io
 import warnings
+from contextlib import redirect_stdout
 
 from wabbit.interp import *
 from wabbit.model import *
@@ -16,12 +19,23 @@ def run(source):
     # Run data model through type checker
     check_program(model)
 
-    # Generate LLVM code
-    llvm_code = generate_program(model, write_out=True)
+    # Run the generated LLVM code in-process
+    jit_out = io.StringIO()
+    with redirect_stdout(jit_out):
+        run_jit(model)
+    print(">>> Output of LLVM:")
+    print(jit_out.getvalue())
 
     # Run data model through interpreter to compare with LLVM output
-    print(">>> Output of interpreter:")
-    print(interpret_program(model))
+    interp_out = io.StringIO()
+    with redirect_stdout(interp_out):
+        interpret_program(model)
+
+    jit_values = [float(line[len('Out: '):]) for line in jit_out.getvalue().splitlines()]
+    interp_values = [float(line) for line in interp_out.getvalue().splitlines()]
+    assert len(jit_values) == len(interp_values)
+    for jit_value, interp_value in zip(jit_values, interp_values):
+        assert abs(jit_value - interp_value) < 1e-6
 
 def test_simple_print():
     source = """
@@ -65,3 +79,411 @@ def test_vardeclaration3():
         print x + y;
     """
     run(source)
+
+def test_opt_levels():
+    source = """
+        var x int = 4;
+        var y float = 2.5;
+        x = x * 3 + 1;
+        print x;
+        print y * 2.0;
+    """
+    model = parse_source(source)
+    check_program(model)
+    counts = []
+    for opt_level in range(4):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            run_jit(model, opt_level)
+        assert out.getvalue() == "Out: 13\nOut: 5.000000\n"
+        counts.append(count_instructions(compile_module(model, opt_level)))
+    assert counts[2] < counts[0]
+
+def test_build_executable():
+    import os
+    import subprocess
+    import tempfile
+
+    model = parse_source("var x = 6; print x * 7; print 1.5 * 3.0;")
+    check_program(model)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        exe = build_executable(model, os.path.join(tmpdir, 'prog'),
+                               host_cpu=True, fast_math=True)
+        result = subprocess.run([exe], capture_output=True, text=True, check=True)
+    assert result.stdout == "Out: 42\nOut: 4.500000\n"
+
+    fast = str(generate_program(model, fast_math=True))
+    assert 'fmul fast double' in fast
+
+def test_object_cache():
+    import os
+    import tempfile
+
+    model = parse_source("var x = 6; print x * 7;")
+    check_program(model)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = ObjectCache(tmpdir)
+        for _ in range(2):
+            out = io.StringIO()
+            with redirect_stdout(out):
+                run_jit(model, 2, cache=cache)
+            assert out.getvalue() == "Out: 42\n"
+        assert (cache.hits, cache.misses) == (1, 1)
+        assert cache.stats()['entries'] == 1
+
+        exe = os.path.join(tmpdir, 'prog')
+        for _ in range(2):
+            build_executable(model, exe, cache=cache)
+        assert (cache.hits, cache.misses) == (2, 2)
+
+        # Least recently used entries are evicted to stay under the limit
+        cache.max_bytes = 0
+        cache.evict()
+        assert cache.stats()['entries'] == 0
+
+def test_ifstatement():
+    source = """
+        var x int = 3;
+        var y float = 1.5;
+        if x < 5 {
+            x = x + 10;
+        } else {
+            y = 2.0;
+        }
+        if y == 1.5 {
+            var x int = 100;
+            print x;
+        }
+        print x;
+        print y;
+    """
+    run(source)
+
+def test_whileloop():
+    source = """
+        var n int = 1;
+        var value int = 1;
+        while n < 10 {
+            value = value * n;
+            print value;
+            n = n + 1;
+        }
+        var x float = 0.0;
+        while x < 1.0 {
+            var k int = 0;
+            while k < 3 {
+                k = k + 1;
+            }
+            x = x + 0.25;
+            print x + 0.0 * 1.0;
+        }
+        print n;
+    """
+    run(source)
+
+def test_ssa_construction():
+    # Variables live in registers. Loops and branches join values with phis.
+    model = parse_source("""
+        var n int = 0;
+        var total int;
+        while n < 5 {
+            if n > 2 { total = total + n; }
+            n = n + 1;
+        }
+        print total;
+        print total == 7;
+    """)
+    check_program(model)
+    code = str(generate_program(model))
+    assert 'alloca' not in code
+    assert 'load' not in code and 'store' not in code
+    assert code.count(' = phi ') == 3
+
+    out = io.StringIO()
+    with redirect_stdout(out):
+        run_jit(model)
+    assert out.getvalue() == "Out: 7\nOut: true\n"
+
+def test_functions():
+    source = """
+        var calls int = 0;
+        func fact(n int) int {
+            calls = calls + 1;
+            if n < 2 {
+                return 1;
+            }
+            return n * fact(n - 1);
+        }
+        func scale(x float, n int) float {
+            while n > 0 {
+                x = x * 2.0;
+                n = n - 1;
+            }
+            return x;
+        }
+        func main() int {
+            print fact(5);
+            print scale(1.5, 3);
+            print calls;
+            return 0;
+        }
+        print calls;
+    """
+    run(source)
+
+def test_short_circuit():
+    # The right side of && and || only runs when it decides the result
+    model = parse_source("""
+        var x int = 0;
+        print x != 0 && 10 / x > 1;
+        print x == 0 || 10 / x > 1;
+        var calls int = 0;
+        func bump() bool { calls = calls + 1; return 1 == 1; }
+        print x > 0 && bump() || bump() && x < 1;
+        print calls;
+    """)
+    check_program(model)
+    for opt_level in (0, 2):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            run_jit(model, opt_level)
+        assert out.getvalue() == "Out: false\nOut: true\nOut: true\nOut: 1\n"
+
+def test_compile_split():
+    # Functions compiled in worker processes link into the same module
+    # as functions compiled one after the other, and after optimizing
+    # the linked module, into the same code as compile_module() makes
+    source = """
+        var base int = 10;
+        func f(x int) int { return x + base; }
+        func g(x int) int { return f(x) * 2; }
+        func h(x int) int { return g(x) - f(x); }
+        func main() int { print h(5); return 0; }
+    """
+    model = parse_source(source)
+    check_program(model)
+    serial = compile_split(model, opt_level=2, workers=1)
+    parallel = compile_split(model, opt_level=2, workers=2)
+    assert str(serial) == str(parallel)
+    # Only the order of the functions differs
+    whole = compile_module(model, opt_level=2)
+    assert ({func.name: str(func) for func in serial.functions} ==
+            {func.name: str(func) for func in whole.functions})
+    assert 'call i32 @wabbit.f' not in str(serial)
+
+    out = io.StringIO()
+    with redirect_stdout(out):
+        run_main_block(create_engine(parallel))
+    assert out.getvalue() == "Out: 15\n"
+
+def test_profile_guided():
+    import os
+    import subprocess
+    import tempfile
+
+    model = parse_source("""
+        func never(x int) int { return x; }
+        func main() int {
+            var n int = 0;
+            while n < 10 {
+                if n > 7 { print n; }
+                n = n + 1;
+            }
+            return 0;
+        }
+    """)
+    check_program(model)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # The executable and the JIT write the same profile
+        jit_profile = os.path.join(tmpdir, 'jit.profdata')
+        os.environ['WABBIT_PROFILE'] = jit_profile
+        try:
+            with redirect_stdout(io.StringIO()):
+                run_main_block(create_engine(compile_module(model, instrument=True)))
+        finally:
+            del os.environ['WABBIT_PROFILE']
+
+        exe_profile = os.path.join(tmpdir, 'exe.profdata')
+        exe = build_executable(model, os.path.join(tmpdir, 'prog'), instrument=True)
+        result = subprocess.run([exe], capture_output=True, text=True, check=True,
+                                env={**os.environ, 'WABBIT_PROFILE': exe_profile})
+        assert result.stdout == "Out: 8\nOut: 9\n"
+        profile = read_profile(exe_profile)
+        assert profile == read_profile(jit_profile)
+
+    # The loop runs 10 times and exits once.  The if is taken twice.
+    module = generate_program(model, profile=profile)
+    assert 'cold' in module.get_global('wabbit.never').attributes
+    code = str(module)
+    assert '!"branch_weights", i32 11, i32 2' in code
+    assert '!"branch_weights", i32 3, i32 9' in code
+    assert '"ProfileSummary"' in code
+
+    llmod = compile_module(model, 2, profile=profile)
+    out = io.StringIO()
+    with redirect_stdout(out):
+        run_main_block(create_engine(llmod))
+    assert out.getvalue() == "Out: 8\nOut: 9\n"
+
+def test_ir_runtime():
+    import os
+    import subprocess
+    import tempfile
+
+    # Enough output to fill the runtime's buffer more than once
+    model = parse_source("""
+        var n int = -2147483647 - 1;
+        print n;
+        var i int = 0;
+        while i < 20000 {
+            print i;
+            print i < 2;
+            i = i + 1;
+        }
+        print 2.5;
+    """)
+    check_program(model)
+    code = str(compile_module(model, 2, runtime='ir'))
+    assert 'call void @_print' not in code
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        outputs = []
+        for runtime in ('c', 'ir'):
+            exe = build_executable(model, os.path.join(tmpdir, runtime),
+                                   runtime=runtime)
+            result = subprocess.run([exe], capture_output=True, text=True, check=True)
+            outputs.append(result.stdout)
+    assert outputs[0] == outputs[1]
+    assert outputs[1].startswith("Out: -2147483648\nOut: 0\nOut: true\n")
+    assert outputs[1].endswith("Out: 19999\nOut: false\nOut: 2.500000\n")
+
+def test_c_runtime_formatting():
+    import os
+    import subprocess
+    import tempfile
+
+    # wabbit/runtime.c formats numbers itself and must agree with printf
+    model = parse_source("""
+        var x float = -2.0;
+        var big float = 1.0;
+        var i int = 0;
+        while i < 5000 {
+            print x;
+            print big;
+            print i * 429497 - 1073741824;
+            x = x + 0.0008125;
+            big = big * 1.02;
+            i = i + 1;
+        }
+    """)
+    check_program(model)
+    expected = []
+    x, big = -2.0, 1.0
+    for i in range(5000):
+        expected.append(f"Out: {x:f}\nOut: {big:f}\nOut: {i * 429497 - 1073741824}\n")
+        x = x + 0.0008125
+        big = big * 1.02
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        exe = build_executable(model, os.path.join(tmpdir, 'a.out'), runtime='c')
+        result = subprocess.run([exe], capture_output=True, text=True, check=True)
+    assert result.stdout == ''.join(expected)
+
+def test_wabbit_library():
+    model = parse_source("""
+        const scale float = 2.5;
+        func fib(n int) int {
+            if n < 2 { return 1; }
+            return fib(n - 1) + fib(n - 2);
+        }
+        func times(x float) float { return x * scale; }
+        func positive(x int) bool { return x > 0; }
+        func both(a bool, b bool) bool { return a && b; }
+        func main() int { print 99; return 0; }
+    """)
+    check_program(model)
+    out = io.StringIO()
+    with redirect_stdout(out):
+        lib = WabbitLibrary(model)
+    assert out.getvalue() == ""    # main() isn't run
+
+    assert lib.fib(20) == 10946
+    assert lib.times(4) == 10.0
+    assert lib.positive(3) is True and lib.positive(-3) is False
+    assert lib.both(True, True) is True and lib.both(True, False) is False
+    assert 'define zeroext i1 @"wabbit.positive"' in str(generate_program(model))
+    assert sorted(lib.functions) == ['both', 'fib', 'main', 'positive', 'times']
+    try:
+        lib.fib(1.5)
+    except ctypes.ArgumentError:
+        pass
+    else:
+        assert False, "expected an ArgumentError"
+
+def test_lazy_jit():
+    model = parse_source("""
+        var calls int = 0;
+        func unused(x int) int { return x; }
+        func fib(n int) int {
+            calls = calls + 1;
+            if n < 2 { return 1; }
+            return fib(n - 1) + fib(n - 2);
+        }
+        func main() int {
+            print fib(10);
+            print fib(5);
+            print calls;
+            return 0;
+        }
+    """)
+    check_program(model)
+    jit = LazyJIT(model, opt_level=2)
+    assert jit.compile_times == {}
+
+    out = io.StringIO()
+    with redirect_stdout(out):
+        jit.run()
+    assert out.getvalue() == "Out: 89\nOut: 8\nOut: 192\n"
+    assert sorted(jit.compile_times) == ['fib', 'main']
+
+def test_lazy_jit_error():
+    import os
+    import subprocess
+    import sys
+
+    # A function that fails to compile ends the process instead of
+    # leaving a null pointer to be called
+    script = """
+from wabbit.llvm import LazyJIT
+from wabbit.parse import parse_source
+from wabbit.typecheck import check_program
+model = parse_source('func f() int { return 1; } print 2; print f();')
+check_program(model)
+jit = LazyJIT(model)
+jit.functions.clear()
+jit.run()
+"""
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    result = subprocess.run([sys.executable, '-c', script], cwd=root,
+                            capture_output=True, text=True)
+    assert result.returncode == 1
+    assert result.stdout == "Out: 2\n"
+    assert 'KeyError' in result.stderr
+
+def test_bitcode():
+    import os
+    import tempfile
+
+    model = parse_source("func sq(x int) int { return x * x; } print sq(9);")
+    check_program(model)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, 'out.bc')
+        write_bitcode(compile_module(model, 2), filename)
+        with open(filename, 'rb') as file:
+            assert file.read(4) == b'BC\xc0\xde'
+        llmod = read_bitcode(filename)
+
+    out = io.StringIO()
+    with redirect_stdout(out):
+        run_main_block(create_engine(llmod))
+    assert out.getvalue() == "Out: 81\n"
@@ -0,0 +1,179 @@
+import io
+import os
+
+from wabbit.model import *
+from wabbit.parse import *
+from wabbit.typecheck import *
+from wabbit.transform import *
+from wabbit.wasm import encode_module, generate_program
+from wabbit.wasmrun import run_wasm
+
+SCRIPT_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'tests', 'Script')
+
+def checked(source):
+    model = parse_source(source)
+    check_program(model)
+    return model
+
+def run(model):
+    # Output of the program through the Wasm backend
+    out = io.StringIO()
+    run_wasm(encode_module(generate_program(model).module), engine='python', file=out)
+    return out.getvalue()
+
+def test_fold_constants():
+    model = fold_constants(checked("""
+        const xmin = -2.0;
+        const xmax = 1.0;
+        const width = 80.0;
+        var dx float = xmax - xmin;
+        var n int = 7 / -2;
+        var big int = 2147483647 + 1;
+        var changed int = 2;
+        changed = changed + n;
+        print dx / width;
+        print 1 / 0;
+        print n < 3;
+        print 0.1 + 0.2;
+    """))
+    assert repr(model[3]) == 'DeclareVar(dx, float, Float(3.0))'
+    # Integer division truncates and overflow wraps
+    assert repr(model[4]) == 'DeclareVar(n, int, Integer(-3))'
+    assert repr(model[5]) == 'DeclareVar(big, int, Integer(-2147483648))'
+    # changed is assigned, so only its use of n is replaced
+    assert repr(model[7]) == 'Assignment(changed,BinOp(+, Load(changed), Integer(-3)))'
+    assert repr(model[8]) == 'Print(Float(0.0375))'
+    # Division by zero is left to happen at run time
+    assert repr(model[9]) == 'Print(BinOp(/, Integer(1), Integer(0)))'
+    assert repr(model[10]) == 'Print(BinOp(<, Integer(-3), Integer(3)))'
+    assert float(model[11].expression.value) == 0.1 + 0.2
+
+def test_fold_scopes():
+    model = fold_constants(checked("""
+        var x int = 1;
+        func f(x int) int {
+            return x + 1;
+        }
+        func g() int {
+            return x + 1;
+        }
+        while x < 0 {
+            var x int = 5;
+            x = x + 1;
+        }
+        print x;
+    """))
+    # The parameter x isn't the global x
+    assert repr(model[1].body[0]) == 'Return(BinOp(+, Load(x), Integer(1)))'
+    assert repr(model[2].body[0]) == 'Return(Integer(2))'
+    # The assignment in the loop is to the inner x
+    assert repr(model[3].condition) == 'BinOp(<, Integer(1), Integer(0))'
+    assert repr(model[3].body[1]) == 'Assignment(x,BinOp(+, Load(x), Integer(1)))'
+    assert repr(model[4]) == 'Print(Integer(1))'
+
+def test_eliminate_dead_code():
+    source = """
+        var unused int = 5;
+        var side int = 0;
+        const DEBUG = 1 == 0;
+        func bump() int { side = side + 1; return side; }
+        func f(x int) int {
+            if x > 0 { return 1; } else { return 2; }
+            print 99;
+            return 3;
+        }
+        func main() int {
+            var a int = bump();
+            var d int = 10 / 2;
+            var z int = d / 0;
+            if 1 == 1 { var shadow int = 1; print shadow; } else { print 0; }
+            if 1 == 0 { print 1; } else { var k int = 4; k = k + d; print k; }
+            if DEBUG && side > 0 { print 77; }
+            while 2 < 1 { print 3; }
+            print side;
+            3 + 4;
+            print f(1);
+            return 0;
+        }
+    """
+    model, removed = eliminate_dead_code(fold_constants(checked(source)))
+    assert removed == 40
+    assert [repr(node) for node in model] == [
+        'DeclareVar(side, int, Integer(0))',
+        'FunctionDefinition(bump, [], int, [Assignment(side,BinOp(+, Load(side), Integer(1))), '
+        'Return(Load(side))])',
+        # Nothing after an if that returns either way
+        'FunctionDefinition(f, [Parameter(x, int)], int, [IfStatement(BinOp(>, Load(x), Integer(0)),'
+        '[Return(Integer(1))],[Return(Integer(2))])])',
+        # The call and the division by zero are kept for their effects.
+        # The else branch declares k, so it keeps the if as its scope.
+        'FunctionDefinition(main, [], int, [ExprAsStatement(FunctionCall(bump, [])), '
+        'ExprAsStatement(BinOp(/, Integer(5), Integer(0))), Print(Integer(1)), '
+        'IfStatement(BinOp(==, Integer(1), Integer(0)),[],[DeclareVar(k, int, Integer(4)), '
+        'Assignment(k,BinOp(+, Load(k), Integer(5))), Print(Load(k))]), '
+        'Print(Load(side)), Print(FunctionCall(f, [Integer(1)])), Return(Integer(0))])',
+    ]
+    # Without the division by zero, the program prints the same either way
+    source = source.replace('var z int = d / 0;', '')
+    model, removed = eliminate_dead_code(fold_constants(checked(source)))
+    assert run(model) == run(checked(source)) == '1\n9\n1\n1\n'
+
+def test_hoist_invariants():
+    source = """
+        var scale float = 0.5;
+        var x float = 0.0;
+        var total float = 0.0;
+        var count int = 0;
+        func bump() int { count = count + 1; return count; }
+        var i int = 0;
+        while i < 4 {
+            var j int = 0;
+            x = x + 0.25;
+            while j < 3 {
+                total = total + 2.0*x*scale + scale*scale;
+                j = j + 1;
+            }
+            i = i + 1;
+        }
+        print total;
+        func f(a int, b int) int {
+            var s int = 0;
+            var k int = 0;
+            while k < a * b {
+                s = s + a * b + k / b + count * 2 + bump();
+                k = k + 1;
+            }
+            return s;
+        }
+        print f(3, 4);
+    """
+    model, hoisted = hoist_invariants(checked(source))
+    assert hoisted == 3
+    # scale*scale is invariant in both loops, 2.0*x*scale only in the inner one
+    assert repr(model[6:8]) == (
+        '[DeclareConst(_licm2, float, BinOp(*, Load(scale), Load(scale))), '
+        'WhileLoop(BinOp(<, Load(i), Integer(4)),[DeclareVar(j, int, Integer(0)), '
+        'Assignment(x,BinOp(+, Load(x), Float(0.25))), '
+        'DeclareConst(_licm1, float, BinOp(*, BinOp(*, Float(2.0), Load(x)), Load(scale))), '
+        'WhileLoop(BinOp(<, Load(j), Integer(3)),[Assignment(total,BinOp(+, BinOp(+, '
+        'Load(total), Load(_licm1)), Load(_licm2))), Assignment(j,BinOp(+, Load(j), Integer(1)))]), '
+        'Assignment(i,BinOp(+, Load(i), Integer(1)))])]')
+    # a * b is computed once for both uses.  k / b could trap, and bump()
+    # assigns count.
+    assert repr(model[9].body[2:4]) == (
+        '[DeclareConst(_licm3, int, BinOp(*, Load(a), Load(b))), '
+        'WhileLoop(BinOp(<, Load(k), Load(_licm3)),[Assignment(s,BinOp(+, BinOp(+, BinOp(+, '
+        'BinOp(+, Load(s), Load(_licm3)), BinOp(/, Load(k), Load(b))), '
+        'BinOp(*, Load(count), Integer(2))), FunctionCall(bump, []))), '
+        'Assignment(k,BinOp(+, Load(k), Integer(1)))])]')
+    assert run(model) == run(checked(source))
+
+def test_transform_scripts():
+    # Programs print the same after the transforms
+    for name in ('cond', 'fact', 'fib', 'floattest', 'inttest'):
+        model = parse_file(os.path.join(SCRIPT_DIR, f'{name}.wb'))
+        check_program(model)
+        expected = run(model)
+        model = parse_file(os.path.join(SCRIPT_DIR, f'{name}.wb'))
+        check_program(model)
+        assert run(transform(model)) == expected, name
@@ -89,3 +89,91 @@ def test_ifstatement():
     assert not has_error("if 1 < 2 { print 3; } else { print 4; }" )
     assert not has_error("if 1 < 2 { var x int = 3; print x; } else { print 4; }")
     assert not has_error("var a int =1; var b int = 2; if a < b { print a; } else { print b; }")
+    assert not has_error("if 1 < 2 { var x int = 3; } else { var x float = 4.0; }")
+    assert has_error("if 1 < 2 { var x int = 3; } else { print x; }", "Bad assignment (undefined name)")
+    assert has_error("if 1 < 2 { var x int = 3; } print x;", "Bad assignment (undefined name)")
+    assert not has_error("if 1 < 2 { print 3; }")
+
+def test_check_cache():
+    cache = CheckCache()
+    source = """
+        const x = 1;
+        func f(a int) int { return a * x; }
+        func g(a int) float { return 1.5 + a; }
+        func h() int { return f(2); }
+        print h();
+    """
+    model, ctx = check_source(source, cache)
+    assert (cache.hits, cache.misses) == (0, 3)
+    assert ctx._errors == ["Type error (float + int)", "Type error in return from g"]
+
+    # Errors and annotations are kept on a hit
+    model, ctx = check_source(source, cache)
+    assert (cache.hits, cache.misses) == (3, 3)
+    assert ctx._errors == ["Type error (float + int)", "Type error in return from g"]
+    assert model[1].body[0].value.typeid == INT
+    assert ctx.env['f'] is model[1]
+
+    # Editing g re-checks only g
+    model, ctx = check_source(source.replace('1.5 + a', '1.5'), cache)
+    assert (cache.hits, cache.misses) == (5, 4)
+    assert not ctx.have_errors()
+
+    # Changing x re-checks f, which uses it, but not h, which uses f
+    edited = source.replace('1.5 + a', '1.5').replace('x = 1', 'x = 1.0')
+    model, ctx = check_source(edited, cache)
+    assert (cache.hits, cache.misses) == (7, 5)
+    assert ctx._errors == check_program(parse_source(edited))._errors
+    assert ctx._errors == ["Type error (int * float)", "Type error in return from f"]
+
+    # Changing the signature of f re-checks h
+    model, ctx = check_source(edited.replace('f(a int)', 'f(a float)'), cache)
+    assert (cache.hits, cache.misses) == (8, 7)
+    assert "Type error in arguments to f" in ctx._errors
+
+    # A duplicate definition is reported on a hit too
+    source = "func f() int { return 1; } func f() int { return 1; }"
+    check_source(source, cache)
+    model, ctx = check_source(source, cache)
+    assert ctx._errors == ["Duplicate definition of f"]
+
+def test_type_ids():
+    from wabbit.typecheck import _binops, _binop_ids, _binop_table
+
+    for (left, op, right), result in _binops.items():
+        assert TYPE_NAMES[_binop_table[_binop_ids[op]][TYPE_IDS[left]][TYPE_IDS[right]]] == result
+
+    model = parse_source("var x = 1.5 * 2.0; print x < 3.0;")
+    check_program(model)
+    assert model[0].type == 'float'
+    assert model[1].expression.type == 'bool'
+    assert has_error("print 1 && 2;", "Type error (int && int)")
+
+    # Expressions also carry the id, so the backends don't look it up
+    model = parse_source("func f() int { return 2; } var x = 1.5; print -x < 3.0; print f();")
+    check_program(model)
+    assert model[1].typeid == FLOAT
+    assert model[2].expression.typeid == BOOL
+    assert model[2].expression.left.typeid == FLOAT
+    assert model[2].expression.left.operand.typeid == FLOAT
+    assert model[3].expression.typeid == INT
+
+def test_whileloop():
+    assert not has_error("var n int = 0; while n < 10 { n = n + 1; }")
+    assert not has_error("while 1 < 2 { var x int = 1; } var x float;")
+    assert has_error("var n int = 0; while n < 10 { n = n + 1.0; }", "Bad assignment (type error)")
+
+def test_functions():
+    assert not has_error("func add(x int, y int) int { return x + y; } print add(1, 2);")
+    assert not has_error("func fact(n int) int { if n < 2 { return 1; } return n * fact(n - 1); }")
+    assert has_error("func f(x int) int { return 1.0; }", "Type error in return from f")
+    assert has_error("func f(x int) int { return x; } print f(1.0);", "Type error in arguments to f")
+    assert has_error("func f(x int) int { return x; } print f(1, 2);", "Wrong number of arguments to f")
+    assert has_error("func f(x int, x int) int { return x; }", "Duplicate definition of x")
+    assert has_error("return 1;", "Return outside of a function")
+    assert has_error("var f int = 1; print f(1);", "f is not a function")
+    assert has_error("func f() int { return 1; } print f + 1;", "f is a function")
+    assert has_error("func f() int { func g() int { return 1; } return g(); }",
+                     "Function g is not at the top level")
+    assert has_error("if 1 < 2 { func g() int { return 1; } }", "Function g is not at the top level")
+    assert has_error("while 1 > 2 { func g() int { return 1; } }", "Function g is not at the top level")
@@ -0,0 +1,120 @@
+from wabbit.model import *
+from wabbit.parse import *
+from wabbit.typecheck import *
+from wabbit.wasm import *
+
+def read_unsigned(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return result, pos
+
+def compile_source(source):
+    model = parse_source(source)
+    check_program(model)
+    return generate_program(model)
+
+def test_leb128():
+    assert encode_unsigned(624485) == bytes([0xe5, 0x8e, 0x26])
+    assert encode_unsigned(127) == bytes([0x7f])
+    assert encode_unsigned(128) == bytes([0x80, 0x01])
+    assert encode_signed(-624485) == bytes([0x9b, 0xf1, 0x59])
+    assert encode_signed(127) == bytes([0xff, 0x00])
+    assert encode_signed(-64) == bytes([0x40])
+    assert encode_signed(-65) == bytes([0xbf, 0x7f])
+    assert encode_signed(-2**31) == bytes([0x80, 0x80, 0x80, 0x80, 0x78])
+    for value in (0, 1, 63, 64, 300, 2**31 - 1, 2**32 - 1):
+        assert read_unsigned(encode_unsigned(value), 0) == (value, len(encode_unsigned(value)))
+
+def test_encode_module():
+    mod = compile_source("""
+        var total int = 0;
+        func add(x int, y int) int {
+            var z int = x + y;
+            return z;
+        }
+        func main() int {
+            total = add(2, 3);
+            print total;
+            return 0;
+        }
+    """)
+    add = mod.functions['add']
+    assert add.idx == 5       # After the five runtime imports
+    assert add.local_types == [i32]
+    assert add.code == [('local.get', 0), ('local.get', 1), ('i32.add',),
+                        ('local.set', 2), ('local.get', 2), ('return',),
+                        ('i32.const', 0)]
+
+    data = encode_module(mod.module)
+    assert data[:8] == b'\x00asm\x01\x00\x00\x00'
+    # The back-patched sizes cover each section exactly
+    pos, sections = 8, []
+    while pos < len(data):
+        size, start = read_unsigned(data, pos + 1)
+        sections.append(data[pos])
+        pos = start + size
+    assert pos == len(data)
+    assert sections == [1, 2, 3, 6, 7, 10]
+    assert b'runtime' in data and b'_printu' in data
+
+    # The exported main runs the top-level statements and then main()
+    exports = [func.name for func in mod.module.functions if func.export]
+    assert exports == ['add', 'main']
+    assert mod.module.functions[-1].code[-2:] == [('call', mod.functions['main'].idx), ('drop',)]
+
+def test_optimize():
+    mod = compile_source("""
+        func f(n int) int {
+            var a int = n * 2;
+            var b float = 1.5;
+            var c int = a + 1;
+            var d float = b * 2.0;
+            print d;
+            if 1 < 2 {
+                print c;
+            } else {
+                print 0;
+            }
+            while 1 == 0 {
+                print 1;
+            }
+            var e int = 2 + 3 * 4;
+            print e;
+            return c;
+        }
+    """)
+    func = mod.functions['f']
+    optimize_module(mod.module)
+    # a and c reuse the parameter's index, e is folded away along with
+    # the constant if and while, and the dead code at the end is gone
+    assert func.local_types == [f64]
+    assert func.code == [('local.get', 0), ('i32.const', 2), ('i32.mul',), ('local.set', 0),
+                         ('f64.const', 1.5), ('local.set', 1),
+                         ('local.get', 0), ('i32.const', 1), ('i32.add',), ('local.set', 0),
+                         ('local.get', 1), ('f64.const', 2.0), ('f64.mul',),
+                         ('call', mod._printf.idx),
+                         ('local.get', 0), ('call', mod._printi.idx),
+                         ('i32.const', 14), ('call', mod._printi.idx),
+                         ('local.get', 0), ('return',)]
+
+def test_fold_constants():
+    mod = compile_source("""
+        print 7 / -2;
+        print 0 - 2147483647 - 2;
+        print 1 / 0;
+        print 1.0 / 4.0 < 0.5;
+    """)
+    optimize_module(mod.module)
+    # Division truncates, overflow wraps and division by zero is left
+    # to trap at run time
+    printi, printb = mod._printi.idx, mod._printb.idx
+    assert mod.module.functions[-1].code == [
+        ('i32.const', -3), ('call', printi),
+        ('i32.const', 2147483647), ('call', printi),
+        ('i32.const', 1), ('i32.const', 0), ('i32.div_s',), ('call', printi),
+        ('i32.const', 1), ('call', printb)]
@@ -0,0 +1,98 @@
+import io
+import os
+
+from wabbit.parse import *
+from wabbit.typecheck import *
+from wabbit.wasm import *
+from wabbit.wasmrun import *
+
+SCRIPT_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'tests', 'Script')
+
+def compile_model(model, optimize=False):
+    check_program(model)
+    mod = generate_program(model)
+    if optimize:
+        optimize_module(mod.module)
+    return encode_module(mod.module)
+
+def run_program(data):
+    out = io.StringIO()
+    run_wasm(data, engine='python', file=out)
+    return out.getvalue()
+
+def test_scripts():
+    # The scripts that the parser handles completely
+    for name in ('cond', 'fact', 'fib', 'floattest', 'inttest'):
+        model = parse_file(os.path.join(SCRIPT_DIR, f'{name}.wb'))
+        with open(os.path.join(SCRIPT_DIR, f'{name}.out')) as file:
+            expected = file.read()
+        assert run_program(compile_model(model)) == expected, name
+        assert run_program(compile_model(model, optimize=True)) == expected, name
+
+def test_functions():
+    source = """
+        var calls int = 0;
+        func fact(n int) int {
+            calls = calls + 1;
+            if n < 2 {
+                return 1;
+            }
+            return n * fact(n - 1);
+        }
+        func half(x float) float {
+            return x / 2.0;
+        }
+        func main() int {
+            var i int = 1;
+            while i <= 13 {
+                print fact(i);
+                i = i + 1;
+            }
+            print half(5.0);
+            print calls;
+            print 7 / -2;
+            print fact(3) == 6;
+            return 0;
+        }
+    """
+    # 13! overflows and wraps like an i32
+    expected = ('1\n2\n6\n24\n120\n720\n5040\n40320\n362880\n3628800\n39916800\n'
+                '479001600\n1932053504\n2.500000\n91\n-3\ntrue\n')
+    assert run_program(compile_model(parse_source(source))) == expected
+    assert run_program(compile_model(parse_source(source), optimize=True)) == expected
+
+def test_short_circuit():
+    # The right side of && and || only runs when it decides the result
+    source = """
+        var x int = 0;
+        print x != 0 && 10 / x > 1;
+        print x == 0 || 10 / x > 1;
+        var calls int = 0;
+        func bump() bool { calls = calls + 1; return 1 == 1; }
+        print x > 0 && bump() || bump() && x < 1;
+        print calls;
+    """
+    expected = 'false\ntrue\ntrue\n1\n'
+    assert run_program(compile_model(parse_source(source))) == expected
+    assert run_program(compile_model(parse_source(source), optimize=True)) == expected
+
+def test_decode_module():
+    model = parse_file(os.path.join(SCRIPT_DIR, 'fib.wb'))
+    data = compile_model(model)
+    assert encode_module(decode_module(data)) == data
+
+def test_trap():
+    data = compile_model(parse_source("""
+        var zero int = 0;
+        print 1;
+        print 1 / zero;
+    """))
+    out = io.StringIO()
+    try:
+        run_wasm(data, engine='python', file=out)
+    except WasmTrap:
+        pass
+    else:
+        assert False, "expected a WasmTrap"
+    # Output from before the trap is still written
+    assert out.getvalue() == '1\n'
@@ -18,6 +18,8 @@
 #     WHILE   : 'while'
 #     TRUE    : 'true'
 #     FALSE   : 'false'
+#     FUNC    : 'func'
+#     RETURN  : 'return'
 #
 # Identifiers/Names
 #     NAME    : Text starting with a letter or '_', followed by any number
@@ -58,6 +60,7 @@
 #     RPAREN   : ')'
 #     LBRACE   : '{'
 #     RBRACE   : '}'
+#     COMMA    : ','
 #
 # Comments:  To be ignored
 #      //             Skips the rest of the line
@@ -83,7 +86,7 @@ class Tokenizer(Lexer):
         PLUS, MINUS, TIMES, DIVIDE, LT, LE, GT, GE, EQ, NE,
         LAND, LOR, LNOT, ASSIGN, SEMI, LPAREN, RPAREN, LBRACE, RBRACE,
         CHAR, NAME, CONST, VAR, PRINT, BREAK, CONTINUE, TRUE, FALSE, IF,
-        ELSE, WHILE, FLOAT, INTEGER, TYP
+        ELSE, WHILE, FLOAT, INTEGER, TYP, FUNC, RETURN, COMMA
     }
     ignore = ' \t'
     ignore_inline_comment = r'//[\s\S]*?\n'
@@ -95,10 +98,10 @@ class Tokenizer(Lexer):
     MINUS = r'-'
     TIMES = r'\*'
     DIVIDE = r'/'
-    LT = r'<'
     LE = r'<='
-    GT = r'>'
+    LT = r'<'
     GE = r'>='
+    GT = r'>'
     EQ = r'=='
     NE = r'!='
     LAND = r'&&'
@@ -110,9 +113,14 @@ class Tokenizer(Lexer):
     RPAREN = r'\)'
     LBRACE = r'{'
     RBRACE = r'}'
-    TYP = r'int|float|char|bool|unit'
+    COMMA = r','
     CHAR = r"'.'|'\\x[A-Fa-f]{2}'|'\\n'|'\\'"  # Match single char, byte val, newline, and literal single quote
-    NAME = r'[a-zA-Z_][a-zA-Z0-9]*'
+    NAME = r'[a-zA-Z_][a-zA-Z0-9_]*'
+    NAME['int'] = TYP
+    NAME['float'] = TYP
+    NAME['char'] = TYP
+    NAME['bool'] = TYP
+    NAME['unit'] = TYP
     NAME['const'] = CONST
     NAME['var'] = VAR
     NAME['print'] = PRINT
@@ -123,6 +131,8 @@ class Tokenizer(Lexer):
     NAME['if'] = IF
     NAME['else'] = ELSE
     NAME['while'] = WHILE
+    NAME['func'] = FUNC
+    NAME['return'] = RETURN
     FLOAT = r'\d+\.\d*'
     INTEGER = r'\d+'
 
@@ -30,18 +30,506 @@
 #       return newnode
 #
 
+import math
+from collections import ChainMap
+from decimal import Decimal
+
 from .model import *
 
+# The passes below work on a type checked model (see check_program() in
+# typecheck.py) and keep its type annotations up to date.
+
 def transform(node):
     # Return the node back (unmodified) or a new node in its place
+    node = fold_constants(node)
+    node, removed = eliminate_dead_code(node)
+    node, hoisted = hoist_invariants(node)
+    return node
+
+# ---- Names
+#
+# Every Load and Assignment refers to the declaration its name resolves
+# to, following the scoping rules of the type checker: blocks start a
+# new scope, functions see the top-level scope and their parameters.
+
+def resolve_names(node, env=None, names=None):
+    '''
+    Return a dict mapping each Load and Assignment in node to the
+    declaration of its name.
+    '''
+    if env is None:
+        env = ChainMap()
+    if names is None:
+        names = {}
+
+    if isinstance(node, list):
+        for stmt in node:
+            resolve_names(stmt, env, names)
+
+    elif isinstance(node, (DeclareConst, DeclareVar)):
+        if node.value:
+            resolve_names(node.value, env, names)
+        env[node.name] = node
+
+    elif isinstance(node, Load):
+        names[node] = env.get(node.location)
+
+    elif isinstance(node, Assignment):
+        resolve_names(node.value, env, names)
+        names[node] = env.get(node.location)
+
+    elif isinstance(node, BinOp):
+        resolve_names(node.left, env, names)
+        resolve_names(node.right, env, names)
+
+    elif isinstance(node, UnaryOp):
+        resolve_names(node.operand, env, names)
+
+    elif isinstance(node, (Print, ExprAsStatement)):
+        resolve_names(node.expression, env, names)
+
+    elif isinstance(node, Return):
+        resolve_names(node.value, env, names)
+
+    elif isinstance(node, FunctionCall):
+        for arg in node.arguments:
+            resolve_names(arg, env, names)
+
+    elif isinstance(node, IfStatement):
+        resolve_names(node.condition, env, names)
+        resolve_names(node.consequence, env.new_child(), names)
+        if node.alternative:
+            resolve_names(node.alternative, env.new_child(), names)
+
+    elif isinstance(node, WhileLoop):
+        resolve_names(node.condition, env, names)
+        resolve_names(node.body, env.new_child(), names)
+
+    elif isinstance(node, FunctionDefinition):
+        env[node.name] = node
+        body_env = env.new_child()
+        for param in node.params:
+            body_env[param.name] = param
+        resolve_names(node.body, body_env, names)
+
+    elif isinstance(node, Compound):
+        resolve_names(node.statements, env.new_child(), names)
+
+    elif isinstance(node, Statements):
+        resolve_names(node.statements, env, names)
+
+    return names
+
+# ---- Constant folding and propagation
+#
+# Operators on constants are evaluated the way the compiled code does
+# it: int is a 32-bit two's complement integer, so results wrap and /
+# truncates toward zero, and float is an IEEE double.  Anything that
+# would fail at run time (division by zero, int overflow in /) or give
+# an infinity or NaN is left alone.  evaluate() also gives the value of
+# comparisons, but there are no bool literals to replace them with, so
+# they stay in the model.  Loads of bool constants become 1 == 1 or
+# 1 == 0, which later passes can evaluate.
+
+def _wrap(value):
+    return (value + 0x80000000) % 0x100000000 - 0x80000000
+
+def _div(a, b):
+    if isinstance(a, float):
+        return a / b if b != 0 else None
+    if b == 0 or (a == -0x80000000 and b == -1):
+        return None
+    quotient = abs(a) // abs(b)
+    return quotient if (a < 0) == (b < 0) else -quotient
+
+_operators = {
+    '+': lambda a, b: a + b,
+    '-': lambda a, b: a - b,
+    '*': lambda a, b: a * b,
+    '/': _div,
+    '<': lambda a, b: a < b,
+    '>': lambda a, b: a > b,
+    '<=': lambda a, b: a <= b,
+    '>=': lambda a, b: a >= b,
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '&&': lambda a, b: a and b,
+    '||': lambda a, b: a or b,
+}
+
+def evaluate(node):
+    '''
+    The value of an expression made of literals and operators, or None
+    if it isn't one or can't be computed ahead of time.
+    '''
+    if isinstance(node, Integer):
+        return int(node.value)
+    elif isinstance(node, Float):
+        return float(node.value)
+    elif isinstance(node, UnaryOp):
+        value = evaluate(node.operand)
+        if value is None or node.op == '+':
+            return value
+        value = -value
+    elif isinstance(node, BinOp):
+        left = evaluate(node.left)
+        if left is not None and node.op in ('&&', '||') and left == (node.op == '||'):
+            # The right side doesn't matter if it has no effects
+            return left if is_pure(node.right) else None
+        right = evaluate(node.right) if left is not None else None
+        if right is None or node.op not in _operators:
+            return None
+        value = _operators[node.op](left, right)
+        if value is None:
+            return None
+    else:
+        return None
+
+    if node.type == 'int':
+        return _wrap(value)
+    elif node.type == 'float':
+        return value if math.isfinite(value) else None
+    return value
+
+def make_literal(value, type):
+    '''
+    An Integer or Float node for a value, written so that it can be read
+    back by the tokenizer and by float() without losing precision.
+    There are no bool literals, so bools are written as 1 == 1 and
+    1 == 0.
+    '''
+    if type == 'bool':
+        node = BinOp('==', Integer('1'), Integer('1' if value else '0'))
+        node.type = 'bool'
+        node.typeid = BOOL
+        return node
+    elif type == 'int':
+        return Integer(str(value))
+    text = repr(value)
+    if 'e' in text:
+        text = format(Decimal(text), 'f')
+    if '.' not in text:
+        text += '.0'
+    return Float(text)
+
+def fold_constants(model):
+    '''
+    Replace expressions on constants by their value.  Loads of a const,
+    or of a var that is never assigned after its declaration, whose
+    value is a constant are replaced by the constant.
+    '''
+    names = resolve_names(model)
+    assigned = {decl for node, decl in names.items() if isinstance(node, Assignment)}
+    return _fold(model, names, assigned, {})
+
+def _fold(node, names, assigned, constants):
+    if isinstance(node, list):
+        node[:] = [_fold(stmt, names, assigned, constants) for stmt in node]
+
+    elif isinstance(node, (BinOp, UnaryOp)):
+        if isinstance(node, BinOp):
+            node.left = _fold(node.left, names, assigned, constants)
+            node.right = _fold(node.right, names, assigned, constants)
+        else:
+            node.operand = _fold(node.operand, names, assigned, constants)
+        if node.type in ('int', 'float'):
+            value = evaluate(node)
+            if value is not None:
+                return make_literal(value, node.type)
+
+    elif isinstance(node, Load):
+        decl = names.get(node)
+        if decl in constants:
+            return make_literal(constants[decl], decl.type)
+
+    elif isinstance(node, (DeclareConst, DeclareVar)):
+        if node.value:
+            node.value = _fold(node.value, names, assigned, constants)
+            value = evaluate(node.value)
+            if value is not None and (isinstance(node, DeclareConst) or node not in assigned):
+                constants[node] = value
+
+    elif isinstance(node, (Assignment, Return)):
+        node.value = _fold(node.value, names, assigned, constants)
+
+    elif isinstance(node, (Print, ExprAsStatement)):
+        node.expression = _fold(node.expression, names, assigned, constants)
+
+    elif isinstance(node, FunctionCall):
+        node.arguments = [_fold(arg, names, assigned, constants) for arg in node.arguments]
+
+    elif isinstance(node, IfStatement):
+        node.condition = _fold(node.condition, names, assigned, constants)
+        _fold(node.consequence, names, assigned, constants)
+        if node.alternative:
+            _fold(node.alternative, names, assigned, constants)
+
+    elif isinstance(node, WhileLoop):
+        node.condition = _fold(node.condition, names, assigned, constants)
+        _fold(node.body, names, assigned, constants)
+
+    elif isinstance(node, FunctionDefinition):
+        _fold(node.body, names, assigned, constants)
+
+    elif isinstance(node, Compound):
+        _fold(node.statements, names, assigned, constants)
+
+    elif isinstance(node, Statements):
+        _fold(node.statements, names, assigned, constants)
+
+    return node
+
+# ---- Dead code elimination
+
+def is_pure(node):
+    '''
+    Can the expression be skipped, or evaluated at another time, without
+    changing what the program does?  Function calls may print or assign,
+    and int division can trap (or raise in the interpreter) unless the
+    divisor is a constant other than 0 and -1.
+    '''
+    if isinstance(node, (Integer, Float, Load)):
+        return True
+    elif isinstance(node, UnaryOp):
+        return is_pure(node.operand)
+    elif isinstance(node, BinOp):
+        if node.op == '/' and node.type == 'int' and evaluate(node.right) in (None, 0, -1):
+            return False
+        return is_pure(node.left) and is_pure(node.right)
+    return False
+
+def eliminate_dead_code(model):
+    '''
+    Remove code that can't run or whose result is never used: the
+    branch of an if whose condition is a constant, loops whose condition
+    is false from the start, statements after a return, and
+    declarations (and assignments) of names that are never loaded.
+    Side effects of the values removed are kept.  Returns the model and
+    the number of nodes removed.
+    '''
+    before = count_nodes(model)
+    while True:
+        names = resolve_names(model)
+        loaded = {decl for node, decl in names.items() if isinstance(node, Load)}
+        changes = []
+        model = _eliminate_block(model, names, loaded, changes)
+        if not changes:
+            break
+    return model, before - count_nodes(model)
+
+def _always_returns(statements):
+    if not statements:
+        return False
+    last = statements[-1]
+    return isinstance(last, Return) or (
+        isinstance(last, IfStatement) and last.alternative is not None
+        and _always_returns(last.consequence) and _always_returns(last.alternative))
+
+def _declares(statements):
+    return any(isinstance(stmt, Declaration) for stmt in statements)
+
+def _side_effects(value):
+    # What to keep of a value that isn't needed
+    return [] if value is None or is_pure(value) else [ExprAsStatement(value)]
+
+def _eliminate_block(statements, names, loaded, changes):
+    out = []
+    for n, stmt in enumerate(statements):
+        out.extend(_eliminate(stmt, names, loaded, changes))
+        if _always_returns(out) and n + 1 < len(statements):
+            changes.append(statements[n + 1:])
+            break
+    statements[:] = out
+    return statements
+
+def _eliminate(node, names, loaded, changes):
+    # The statements to put in place of node
+    if isinstance(node, (DeclareConst, DeclareVar)):
+        if node not in loaded:
+            changes.append(node)
+            return _side_effects(node.value)
+
+    elif isinstance(node, Assignment):
+        if names.get(node) not in loaded:
+            changes.append(node)
+            return _side_effects(node.value)
+
+    elif isinstance(node, ExprAsStatement):
+        if is_pure(node.expression):
+            changes.append(node)
+            return []
+
+    elif isinstance(node, IfStatement):
+        _eliminate_block(node.consequence, names, loaded, changes)
+        if node.alternative is not None:
+            _eliminate_block(node.alternative, names, loaded, changes)
+        condition = evaluate(node.condition)
+        if condition is not None:
+            arm = node.consequence if condition else node.alternative or []
+            if not _declares(arm):
+                # Without declarations, the arm can go in the enclosing block
+                changes.append(node)
+                return arm
+            # Otherwise keep the if for its scope, without the other arm
+            elif condition and node.alternative is not None:
+                changes.append(node)
+                node.alternative = None
+            elif not condition and node.consequence:
+                changes.append(node)
+                node.consequence = []
+        if not node.consequence and not node.alternative:
+            changes.append(node)
+            return _side_effects(node.condition)
+        if node.alternative == []:
+            node.alternative = None
+
+    elif isinstance(node, WhileLoop):
+        if evaluate(node.condition) is False:
+            changes.append(node)
+            return []
+        _eliminate_block(node.body, names, loaded, changes)
+
+    elif isinstance(node, FunctionDefinition):
+        _eliminate_block(node.body, names, loaded, changes)
+
+    return [node]
+
+# ---- Loop-invariant code motion
+#
+# An expression in a while loop that gives the same value on every
+# iteration is computed once, into a const declared just before the
+# loop.  Its names must not be declared or assigned in the loop, and
+# when the loop calls a function, which may assign any top-level var,
+# they must not be top-level vars either.  Only pure expressions move,
+# since the value is computed even if the loop doesn't run.
+
+def _walk(node):
+    # node and all the model nodes in it
+    if isinstance(node, list):
+        for n in node:
+            yield from _walk(n)
+    elif isinstance(node, (Statement, Expression, Statements)):
+        yield node
+        for value in vars(node).values():
+            yield from _walk(value)
+
+def hoist_invariants(model):
+    '''
+    Move loop-invariant expressions out of while loops, into consts
+    named _licm1, _licm2, ... (or the next free names).  Inner loops
+    are done first, and their consts move further out if they are
+    invariant in the enclosing loop too.  Returns the model and the
+    number of expressions hoisted.
+    '''
+    names = resolve_names(model)
+    taken = {node.name for node in _walk(model) if isinstance(node, Declaration)}
+    top_level = {stmt for stmt in model if isinstance(stmt, DeclareVar)}
+    hoisted = set()
+    _hoist_block(model, names, top_level, taken, hoisted)
+    return model, len(hoisted)
+
+def _hoist_block(statements, names, top_level, taken, hoisted):
+    out = []
+    for stmt in statements:
+        if isinstance(stmt, IfStatement):
+            _hoist_block(stmt.consequence, names, top_level, taken, hoisted)
+            if stmt.alternative is not None:
+                _hoist_block(stmt.alternative, names, top_level, taken, hoisted)
+        elif isinstance(stmt, WhileLoop):
+            _hoist_block(stmt.body, names, top_level, taken, hoisted)
+            out.extend(_hoist_loop(stmt, names, top_level, taken, hoisted))
+        elif isinstance(stmt, FunctionDefinition):
+            _hoist_block(stmt.body, names, top_level, taken, hoisted)
+        out.append(stmt)
+    statements[:] = out
+    return statements
+
+def _invariant(node, names, changed):
+    if isinstance(node, (Integer, Float)):
+        return True
+    elif isinstance(node, Load):
+        return names.get(node) not in changed
+    elif isinstance(node, UnaryOp):
+        return _invariant(node.operand, names, changed)
+    elif isinstance(node, BinOp):
+        return _invariant(node.left, names, changed) and _invariant(node.right, names, changed)
+    return False
+
+def _hoist_loop(loop, names, top_level, taken, hoisted):
+    # The declarations to put before the loop
+    nodes = list(_walk([loop.condition, loop.body]))
+    changed = {names.get(node) for node in nodes if isinstance(node, Assignment)}
+    changed.update(node for node in nodes if isinstance(node, Declaration))
+    if any(isinstance(node, FunctionCall) for node in nodes):
+        changed.update(top_level)
+
+    # Consts made for inner loops
+    moved = []
+    for stmt in loop.body:
+        if stmt in hoisted and _invariant(stmt.value, names, changed):
+            changed.discard(stmt)
+            moved.append(stmt)
+    loop.body[:] = [stmt for stmt in loop.body if stmt not in moved]
+
+    temps = {}
+    loop.condition = _hoist_expr(loop.condition, names, changed, temps, taken)
+    _hoist_statements(loop.body, names, changed, temps, taken)
+    hoisted.update(temps.values())
+    return moved + list(temps.values())
+
+def _hoist_statements(statements, names, changed, temps, taken):
+    # Inner loops have been done already
+    for stmt in statements:
+        if isinstance(stmt, (DeclareConst, DeclareVar, Assignment, Return)):
+            if stmt.value:
+                stmt.value = _hoist_expr(stmt.value, names, changed, temps, taken)
+        elif isinstance(stmt, (Print, ExprAsStatement)):
+            stmt.expression = _hoist_expr(stmt.expression, names, changed, temps, taken)
+        elif isinstance(stmt, IfStatement):
+            stmt.condition = _hoist_expr(stmt.condition, names, changed, temps, taken)
+            _hoist_statements(stmt.consequence, names, changed, temps, taken)
+            if stmt.alternative is not None:
+                _hoist_statements(stmt.alternative, names, changed, temps, taken)
+
+def _hoist_expr(node, names, changed, temps, taken):
+    if isinstance(node, (BinOp, UnaryOp)):
+        if (_invariant(node, names, changed) and is_pure(node)
+            and evaluate(node) is None):
+            # The same expression twice in a loop uses the same const
+            key = repr(node)
+            if key not in temps:
+                n = 1
+                while f'_licm{n}' in taken:
+                    n += 1
+                decl = DeclareConst(f'_licm{n}', node.type, node)
+                taken.add(decl.name)
+                temps[key] = decl
+            load = Load(temps[key].name)
+            load.type = node.type
+            load.typeid = node.typeid
+            names[load] = temps[key]
+            return load
+        elif isinstance(node, BinOp):
+            node.left = _hoist_expr(node.left, names, changed, temps, taken)
+            node.right = _hoist_expr(node.right, names, changed, temps, taken)
+        else:
+            node.operand = _hoist_expr(node.operand, names, changed, temps, taken)
+    elif isinstance(node, FunctionCall):
+        node.arguments = [_hoist_expr(arg, names, changed, temps, taken)
+                          for arg in node.arguments]
     return node
 
 # Main function (for testing)
 def main(filename):
     from .parse import parse_file
+    from .typecheck import check_program
     model = parse_file(filename)
-    model = transform(model)
+    check_program(model).exit_on_errors()
+    model = fold_constants(model)
+    model, removed = eliminate_dead_code(model)
+    model, hoisted = hoist_invariants(model)
     print(model)
+    print(f'Removed {removed} nodes, hoisted {hoisted} expressions')
 
 if __name__ == '__main__':
     import sys
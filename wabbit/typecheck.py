@@ -27,22 +27,63 @@
 #
 # The directory tests/Errors has Wabbit programs with various errors.
 
-from collections import ChainMap
+import sys
 from .model import *
 
 
+class Scope:
+    '''
+    Names declared in a scope, linked to the enclosing scope.  Works
+    like a ChainMap, but new_child() doesn't copy the list of all the
+    enclosing scopes, so checking deeply nested blocks stays linear.
+    '''
+
+    def __init__(self, parent=None):
+        self.names = {}
+        self.parent = parent
+
+    def new_child(self):
+        return Scope(self)
+
+    def scopes(self):
+        # The dicts of names, innermost first
+        scope = self
+        while scope is not None:
+            yield scope.names
+            scope = scope.parent
+
+    def get(self, name, default=None):
+        for names in self.scopes():
+            if name in names:
+                return names[name]
+        return default
+
+    def __getitem__(self, name):
+        for names in self.scopes():
+            if name in names:
+                return names[name]
+        raise KeyError(name)
+
+    def __setitem__(self, name, node):
+        self.names[name] = node
+
+    def __contains__(self, name):
+        return any(name in names for names in self.scopes())
+
+
 class CheckContext:
     '''
     Context tracker that managers environment variables
     and errors captured by the type checker
     '''
 
-    def __init__(self, env=None):
-        self.env = ChainMap() if env is None else env
+    def __init__(self, env=None, function=None):
+        self.env = Scope() if env is None else env
+        self.function = function   # FunctionDefinition being checked
         self._errors = []
 
-    def new_child(self):
-        ctx = CheckContext(self.env.new_child())
+    def new_child(self, function=None):
+        ctx = CheckContext(self.env.new_child(), function or self.function)
         ctx._errors = self._errors
         return ctx
 
@@ -52,6 +93,31 @@ class CheckContext:
     def have_errors(self):
         return bool(self._errors)
 
+    def exit_on_errors(self):
+        # For the command line tools: report the errors and stop
+        if self._errors:
+            for msg in self._errors:
+                print(msg, file=sys.stderr)
+            raise SystemExit(1)
+
+
+class CheckCache:
+    '''
+    Cache of type checking results for the top-level functions of a
+    program, for check_source().  An entry is keyed by the text of the
+    function and holds the checked function together with the
+    signatures of the global names it uses, so editing a declaration
+    invalidates the functions that depend on it.
+    '''
+
+    def __init__(self):
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return f'CheckCache(hits={self.hits}, misses={self.misses})'
+
 
 # Top-level function used to check programs
 def check_program(model):
@@ -61,6 +127,83 @@ def check_program(model):
     return ctx
     # Maybe return True/False if there are errors
 
+def check_source(text, cache):
+    '''
+    Parse and check text, reusing the functions in cache (a CheckCache)
+    that haven't changed since the last check.  Returns the model and
+    the context.  A function taken from the cache is the same node as
+    in the model it was first checked in, so models from check_source()
+    must be copied before they are changed, e.g. by transform().
+    '''
+    from .parse import parse_source_spans
+    model, spans = parse_source_spans(text)
+    ctx = CheckContext()
+    check_cached(model, ctx, cache, text, spans)
+    return model, ctx
+
+def check_cached(statements, ctx, cache, text, spans):
+    # Only the entries used by this run are kept, so the cache holds
+    # the results for the most recent version of the program.  Other
+    # statements are cheap to check compared to functions and are
+    # always checked.
+    entries = {}
+    declared = ctx.env.names
+    for n, stmt in enumerate(statements):
+        if not isinstance(stmt, FunctionDefinition):
+            check(stmt, ctx)
+            continue
+        start, end = spans[stmt]
+        key = text[start:end]
+        duplicate = stmt.name in declared
+        if not duplicate:
+            declared[stmt.name] = stmt
+        entry = cache.entries.get(key)
+        if entry is not None and all(_signature(declared.get(name)) == signature
+                                     for name, signature in entry[0]):
+            cache.hits += 1
+            used, errors, checked = entry
+            statements[n] = checked
+            if duplicate:
+                ctx.error(f"Duplicate definition of {stmt.name}")
+            else:
+                declared[stmt.name] = checked
+            ctx._errors.extend(errors)
+        else:
+            cache.misses += 1
+            if not duplicate:
+                del declared[stmt.name]
+            nerrors = len(ctx._errors)
+            check(stmt, ctx)
+            # The duplicate definition error depends on what came before
+            errors = ctx._errors[nerrors + duplicate:]
+            names = set()
+            _global_names(stmt.body, names)
+            used = tuple((name, _signature(declared.get(name))) for name in sorted(names))
+            entry = (used, errors, stmt)
+        entries[key] = entry
+    cache.entries = entries
+
+def _signature(node):
+    # What a statement can observe about a name declared elsewhere
+    if node is None:
+        return None
+    if isinstance(node, FunctionDefinition):
+        return (type(node).__name__, node.type, tuple(p.type for p in node.params))
+    return (type(node).__name__, node.type)
+
+def _global_names(node, names):
+    # Names that node may use from the global scope
+    if isinstance(node, list):
+        for n in node:
+            _global_names(n, names)
+    elif isinstance(node, (Statement, Expression)):
+        if isinstance(node, (Load, Assignment)):
+            names.add(node.location)
+        elif isinstance(node, FunctionCall):
+            names.add(node.name)
+        for value in vars(node).values():
+            _global_names(value, names)
+
 # In the dict below,
 # key: types of input operation
 # value: type of output
@@ -100,7 +243,24 @@ _unaryops = {
     ('+', 'float'): 'float',
 }
 
+# Dense versions of the tables above, indexed by type id.  Operators
+# are numbered from 1; row 0 is left empty for operators that have no
+# entries, so every lookup in it gives the "no type" id.
+_binop_ids = {op: i for i, op in enumerate(dict.fromkeys(op for _, op, _ in _binops), 1)}
+_unaryop_ids = {op: i for i, op in enumerate(dict.fromkeys(op for op, _ in _unaryops), 1)}
+
+_binop_table = [[[0] * len(TYPE_NAMES) for _ in TYPE_NAMES]
+                for _ in range(len(_binop_ids) + 1)]
+for (left, op, right), result in _binops.items():
+    _binop_table[_binop_ids[op]][TYPE_IDS[left]][TYPE_IDS[right]] = TYPE_IDS[result]
+
+_unaryop_table = [[0] * len(TYPE_NAMES) for _ in range(len(_unaryop_ids) + 1)]
+for (op, operand), result in _unaryops.items():
+    _unaryop_table[_unaryop_ids[op]][TYPE_IDS[operand]] = TYPE_IDS[result]
+
 # Borrowing from @dabeaze's implementation here
+# Expressions return the id of their type and are annotated with its name
+# (node.type) and the id itself (node.typeid), which the backends use
 def check(node, ctx):
 
     # TODO !!! Need to create a data model for Programs! (which is a list of statements)
@@ -118,24 +278,25 @@ def check(node, ctx):
         # ??? Why do we want to attach the expression type to the node ???
         # ANS: To fill in missing type information
         # e.g. var x = 42 where the type of x shold be an int
-        typ = 'int'
-        node.type = typ
-        return typ
+        node.type = 'int'
+        node.typeid = INT
+        return INT
 
     # Expression must return a type
     elif isinstance(node, Float):
-        typ = 'float'
-        node.type = typ
-        return typ
+        node.type = 'float'
+        node.typeid = FLOAT
+        return FLOAT
 
     # Expression must return a type
     elif isinstance(node, UnaryOp):
         operand_type = check(node.operand, ctx)
-        result_type = _unaryops.get((node.op, operand_type))
-        node.type = result_type
+        result_type = _unaryop_table[_unaryop_ids.get(node.op, 0)][operand_type]
+        node.type = TYPE_NAMES[result_type]
+        node.typeid = result_type
 
         if not result_type:
-            ctx.error(f'Type error {node.op}{operand_type}')
+            ctx.error(f'Type error {node.op}{TYPE_NAMES[operand_type]}')
         return result_type
 
     # Expression must return a type
@@ -143,14 +304,16 @@ def check(node, ctx):
         left_type = check(node.left, ctx)
         right_type = check(node.right, ctx)
 
-        # Use `get` method to return None if key is not in table
-        result_type = _binops.get((left_type, node.op, right_type))
+        # Operators and type combinations not in the table give 0
+        result_type = _binop_table[_binop_ids.get(node.op, 0)][left_type][right_type]
 
         # Attach the resulting type to the BinOp object
-        node.type = result_type
+        node.type = TYPE_NAMES[result_type]
+        node.typeid = result_type
 
         if not result_type:
-            ctx.error(f"Type error ({left_type} {node.op} {right_type})")
+            ctx.error(f"Type error ({TYPE_NAMES[left_type]} {node.op} "
+                      f"{TYPE_NAMES[right_type]})")
         return result_type
 
     # Statements does not need to return anything...generally???
@@ -159,12 +322,13 @@ def check(node, ctx):
             value_type = check(node.value, ctx)
 
             if node.type is None:
-                node.type = value_type
-            if node.type != value_type:
+                node.type = TYPE_NAMES[value_type]
+            if TYPE_IDS.get(node.type, 0) != value_type:
                 # Type clash
                 ctx.error(f"Type mismatch in initialization")
+        node.typeid = TYPE_IDS.get(node.type, 0)
 
-        current_scope = ctx.env.maps[0]  # current scope is the 1st element
+        current_scope = ctx.env.names  # names declared in the current scope
         # print("DeclareVar current_scope",current_scope)
         if node.name in current_scope:
             ctx.error(f"Duplicate definition of {node.name}")
@@ -181,11 +345,15 @@ def check(node, ctx):
         # checks every scope in ctx.env
         if node.location not in ctx.env:
             ctx.error(f"Bad assignment (undefined name)")
+            return 0
 
-        if node.location in ctx.env:
-            declared_node = ctx.env[node.location]
-            node.type = declared_node.type  # For use later in assignment
-            return declared_node.type
+        declared_node = ctx.env[node.location]
+        if isinstance(declared_node, FunctionDefinition):
+            ctx.error(f"{node.location} is a function")
+            return 0
+        node.type = declared_node.type  # For use later in assignment
+        node.typeid = TYPE_IDS.get(declared_node.type, 0)
+        return node.typeid
 
     elif isinstance(node, Assignment):
 
@@ -195,22 +363,77 @@ def check(node, ctx):
         # We do a loop because we want to use the variables
         # in the most current scope first before using variables
         # from a higher scope
-        for scope in ctx.env.maps:
+        for scope in ctx.env.scopes():
             if node.location in scope:
                 declared_node = scope[node.location]  # get node from scope
                 value_type = check(node.value, ctx)  # get type of value being asgn
 
-                if declared_node.type != value_type:
+                if TYPE_IDS.get(declared_node.type, 0) != value_type:
                     ctx.error("Bad assignment (type error)")
 
                 if isinstance(declared_node, DeclareConst):
                     ctx.error("Can't assign to const")
+                elif isinstance(declared_node, FunctionDefinition):
+                    ctx.error("Can't assign to function")
 
     elif isinstance(node, IfStatement):
         cond_val_type = check(node.condition, ctx)  # type (bec. expression)
         # TODO Need to implement Bools to check cond_val_type is a bool
-        check(node.consequence, ctx)
-        check(node.alternative, ctx)
+        # Each branch is a block with its own scope, like a while body
+        # and like the interpreter runs it.  A name declared in one branch
+        # isn't visible in the other or after the if.
+        check(node.consequence, ctx.new_child())
+        if node.alternative:
+            check(node.alternative, ctx.new_child())
+
+    elif isinstance(node, WhileLoop):
+        check(node.condition, ctx)
+        check(node.body, ctx.new_child())
+
+    elif isinstance(node, FunctionDefinition):
+        if ctx.env.parent is not None:
+            # The code generators only look for functions at the top level
+            ctx.error(f"Function {node.name} is not at the top level")
+        if node.name in ctx.env.names:
+            ctx.error(f"Duplicate definition of {node.name}")
+        else:
+            # Defined before checking the body so that it can be recursive
+            ctx.env[node.name] = node
+
+        # Parameters and the body share a scope
+        func_ctx = ctx.new_child(node)
+        for param in node.params:
+            check(param, func_ctx)
+        check(node.body, func_ctx)
+
+    elif isinstance(node, Parameter):
+        if node.name in ctx.env.names:
+            ctx.error(f"Duplicate definition of {node.name}")
+        else:
+            ctx.env[node.name] = node
+
+    elif isinstance(node, Return):
+        value_type = check(node.value, ctx)
+        if ctx.function is None:
+            ctx.error("Return outside of a function")
+        elif TYPE_IDS.get(ctx.function.type, 0) != value_type:
+            ctx.error(f"Type error in return from {ctx.function.name}")
+
+    elif isinstance(node, FunctionCall):
+        arg_types = [check(arg, ctx) for arg in node.arguments]
+        func = ctx.env.get(node.name)
+        if not isinstance(func, FunctionDefinition):
+            ctx.error(f"{node.name} is not a function")
+            return 0
+
+        if len(arg_types) != len(func.params):
+            ctx.error(f"Wrong number of arguments to {node.name}")
+        elif any(arg_type != TYPE_IDS.get(param.type, 0)
+                 for arg_type, param in zip(arg_types, func.params)):
+            ctx.error(f"Type error in arguments to {node.name}")
+        node.type = func.type
+        node.typeid = TYPE_IDS.get(func.type, 0)
+        return node.typeid
 
     else:
         raise RuntimeError(f"Cannot type check node {node}")
@@ -220,10 +443,9 @@ def check(node, ctx):
 def main(filename):
     from .parse import parse_file
     model = parse_file(filename)
-    check_program(model)
+    check_program(model).exit_on_errors()
 
 if __name__ == '__main__':
-    import sys
     main(sys.argv[1])
 
 
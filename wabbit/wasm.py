@@ -32,39 +32,899 @@
 # Wasm module in various ways.
 #
 
+import struct
+from collections import ChainMap
+
 from .model import *
 
+# Value types
+i32 = 0x7f
+f64 = 0x7c
+
+_wasm_types = {'int': i32, 'float': f64, 'bool': i32, 'char': i32}
+
+# Instructions are kept as tuples of a name and an optional immediate,
+# e.g. ('i32.const', 42), ('local.get', 0) or ('i32.add',), so they are
+# easy to inspect and rewrite before being encoded.  The table gives the
+# opcode of each name and the kind of its immediate:
+#
+#     None  : no immediate
+#     'u'   : unsigned LEB128 (indices, branch depths)
+#     's'   : signed LEB128 (i32.const)
+#     'f'   : 64-bit float (f64.const)
+#     'bt'  : block type, a value type or None for no result
+
+_opcodes = {
+    'unreachable': (0x00, None),
+    'block': (0x02, 'bt'),
+    'loop': (0x03, 'bt'),
+    'if': (0x04, 'bt'),
+    'else': (0x05, None),
+    'end': (0x0b, None),
+    'br': (0x0c, 'u'),
+    'br_if': (0x0d, 'u'),
+    'return': (0x0f, None),
+    'call': (0x10, 'u'),
+    'drop': (0x1a, None),
+    'local.get': (0x20, 'u'),
+    'local.set': (0x21, 'u'),
+    'local.tee': (0x22, 'u'),
+    'global.get': (0x23, 'u'),
+    'global.set': (0x24, 'u'),
+    'i32.const': (0x41, 's'),
+    'f64.const': (0x44, 'f'),
+    'i32.eqz': (0x45, None),
+    'i32.eq': (0x46, None),
+    'i32.ne': (0x47, None),
+    'i32.lt_s': (0x48, None),
+    'i32.gt_s': (0x4a, None),
+    'i32.le_s': (0x4c, None),
+    'i32.ge_s': (0x4e, None),
+    'f64.eq': (0x61, None),
+    'f64.ne': (0x62, None),
+    'f64.lt': (0x63, None),
+    'f64.gt': (0x64, None),
+    'f64.le': (0x65, None),
+    'f64.ge': (0x66, None),
+    'i32.add': (0x6a, None),
+    'i32.sub': (0x6b, None),
+    'i32.mul': (0x6c, None),
+    'i32.div_s': (0x6d, None),
+    'i32.and': (0x71, None),
+    'i32.or': (0x72, None),
+    'f64.neg': (0x9a, None),
+    'f64.add': (0xa0, None),
+    'f64.sub': (0xa1, None),
+    'f64.mul': (0xa2, None),
+    'f64.div': (0xa3, None),
+}
+
+_binop_instructions = {
+    'int': {'+': 'i32.add', '-': 'i32.sub', '*': 'i32.mul', '/': 'i32.div_s',
+            '<': 'i32.lt_s', '>': 'i32.gt_s', '<=': 'i32.le_s', '>=': 'i32.ge_s',
+            '==': 'i32.eq', '!=': 'i32.ne'},
+    'float': {'+': 'f64.add', '-': 'f64.sub', '*': 'f64.mul', '/': 'f64.div',
+              '<': 'f64.lt', '>': 'f64.gt', '<=': 'f64.le', '>=': 'f64.ge',
+              '==': 'f64.eq', '!=': 'f64.ne'},
+    'bool': {'==': 'i32.eq', '!=': 'i32.ne'},
+}
+
+_zero = {i32: ('i32.const', 0), f64: ('f64.const', 0.0)}
+
+# ---- Module structure.  See docs/WebAssembly-Tutorial.md.
+
+class WasmModule:
+    def __init__(self, name):
+        self.name = name
+        self.imported_functions = []
+        self.functions = []
+        self.global_variables = []
+
+class WasmImportedFunction:
+    '''
+    A function defined outside of the Wasm environment
+    '''
+    def __init__(self, module, envname, name, argtypes, rettypes):
+        self.module = module
+        self.envname = envname
+        self.name = name
+        self.argtypes = argtypes
+        self.rettypes = rettypes
+        self.idx = len(module.imported_functions)
+        module.imported_functions.append(self)
+
+class WasmFunction:
+    '''
+    A natively defined Wasm function.  Functions must be made after all
+    the imported ones, since their indices come after the imports.
+    '''
+    def __init__(self, module, name, argtypes, rettypes, export=True):
+        self.module = module
+        self.name = name
+        self.argtypes = argtypes
+        self.rettypes = rettypes
+        self.export = export
+        self.idx = len(module.imported_functions) + len(module.functions)
+        module.functions.append(self)
+
+        self.local_types = []
+        self.code = []       # Instructions, without the final end
+
+    def alloca(self, type):
+        idx = len(self.argtypes) + len(self.local_types)
+        self.local_types.append(type)
+        return idx
+
+    def emit(self, *instruction):
+        self.code.append(instruction)
+
+class WasmGlobalVariable:
+    '''
+    A natively defined (mutable) Wasm global variable
+    '''
+    def __init__(self, module, name, type, initializer):
+        self.module = module
+        self.name = name
+        self.type = type
+        self.initializer = initializer
+        self.idx = len(module.global_variables)
+        module.global_variables.append(self)
+
+# ---- Binary encoding
+
+class WasmEncoder:
+    '''
+    Writes the binary format into one growing bytearray.  Sizes that
+    come before the thing they measure (sections, function bodies) are
+    written as a placeholder and patched afterwards.
+    '''
+    def __init__(self):
+        self.out = bytearray()
+
+    def unsigned(self, value):
+        out = self.out
+        while value >= 0x80:
+            out.append((value & 0x7f) | 0x80)
+            value >>= 7
+        out.append(value)
+
+    def signed(self, value):
+        out = self.out
+        if -64 <= value < 64:
+            out.append(value & 0x7f)
+            return
+        while True:
+            byte = value & 0x7f
+            value >>= 7
+            if (value == 0 and not byte & 0x40) or (value == -1 and byte & 0x40):
+                out.append(byte)
+                return
+            out.append(byte | 0x80)
+
+    def f64(self, value):
+        self.out += _f64.pack(value)
+
+    def name(self, text):
+        data = text.encode('utf-8')
+        self.unsigned(len(data))
+        self.out += data
+
+    def begin_size(self):
+        # Reserve room for a size and return where it goes
+        pos = len(self.out)
+        self.out += b'\x80\x80\x80\x80\x00'
+        return pos
+
+    def end_size(self, pos):
+        # Fill in the size of everything after the placeholder at pos.
+        # It is written as a padded 5-byte LEB128 to fill the space.
+        size = len(self.out) - pos - 5
+        self.out[pos:pos + 5] = bytes(((size >> shift) & 0x7f) | 0x80
+                                      for shift in (0, 7, 14, 21)) + bytes([size >> 28])
+
+    def section(self, number):
+        self.out.append(number)
+        return self.begin_size()
+
+    def code(self, instructions):
+        out = self.out
+        for ins in instructions:
+            opcode, kind = _opcodes[ins[0]]
+            out.append(opcode)
+            if kind is None:
+                continue
+            elif kind == 'u':
+                value = ins[1]
+                if value < 0x80:
+                    out.append(value)
+                else:
+                    self.unsigned(value)
+            elif kind == 's':
+                self.signed(ins[1])
+            elif kind == 'f':
+                out += _f64.pack(ins[1])
+            else:
+                out.append(0x40 if ins[1] is None else ins[1])
+
+_f64 = struct.Struct('<d')
+
+def encode_unsigned(value):
+    '''
+    Produce an LEB128 encoded unsigned integer.
+    '''
+    encoder = WasmEncoder()
+    encoder.unsigned(value)
+    return bytes(encoder.out)
+
+def encode_signed(value):
+    '''
+    Produce a LEB128 encoded signed integer.
+    '''
+    encoder = WasmEncoder()
+    encoder.signed(value)
+    return bytes(encoder.out)
+
+def encode_module(module):
+    '''
+    Encode a WasmModule in the binary format.  Sections are type (1),
+    import (2), function (3), global (6), export (7) and code (10).
+    '''
+    enc = WasmEncoder()
+    enc.out += b'\x00asm\x01\x00\x00\x00'
+
+    # Function types, each distinct signature once
+    all_funcs = module.imported_functions + module.functions
+    signatures = {}
+    for func in all_funcs:
+        signatures.setdefault((tuple(func.argtypes), tuple(func.rettypes)), len(signatures))
+    pos = enc.section(1)
+    enc.unsigned(len(signatures))
+    for argtypes, rettypes in signatures:
+        enc.out.append(0x60)
+        enc.unsigned(len(argtypes))
+        enc.out += bytes(argtypes)
+        enc.unsigned(len(rettypes))
+        enc.out += bytes(rettypes)
+    enc.end_size(pos)
+
+    pos = enc.section(2)
+    enc.unsigned(len(module.imported_functions))
+    for func in module.imported_functions:
+        enc.name(func.envname)
+        enc.name(func.name)
+        enc.out.append(0x00)
+        enc.unsigned(signatures[tuple(func.argtypes), tuple(func.rettypes)])
+    enc.end_size(pos)
+
+    pos = enc.section(3)
+    enc.unsigned(len(module.functions))
+    for func in module.functions:
+        enc.unsigned(signatures[tuple(func.argtypes), tuple(func.rettypes)])
+    enc.end_size(pos)
+
+    pos = enc.section(6)
+    enc.unsigned(len(module.global_variables))
+    for gvar in module.global_variables:
+        enc.out += bytes([gvar.type, 0x01])
+        enc.code([('i32.const' if gvar.type == i32 else 'f64.const', gvar.initializer),
+                  ('end',)])
+    enc.end_size(pos)
+
+    exports = [func for func in module.functions if func.export]
+    pos = enc.section(7)
+    enc.unsigned(len(exports))
+    for func in exports:
+        enc.name(func.name)
+        enc.out.append(0x00)
+        enc.unsigned(func.idx)
+    enc.end_size(pos)
+
+    pos = enc.section(10)
+    enc.unsigned(len(module.functions))
+    for func in module.functions:
+        body = enc.begin_size()
+        # Locals are declared in runs of the same type
+        runs = []
+        for ltype in func.local_types:
+            if runs and runs[-1][1] == ltype:
+                runs[-1][0] += 1
+            else:
+                runs.append([1, ltype])
+        enc.unsigned(len(runs))
+        for count, ltype in runs:
+            enc.unsigned(count)
+            enc.out.append(ltype)
+        enc.code(func.code)
+        enc.out.append(0x0b)
+        enc.end_size(body)
+    enc.end_size(pos)
+    return bytes(enc.out)
+
+# ---- Code generation
+
 # Class representing the world of Wasm
 class WabbitWasmModule:
-    pass
+    def __init__(self):
+        self.module = WasmModule('wabbit')
+
+        # Runtime functions for printing.  See html/test.html.
+        self._printi = WasmImportedFunction(self.module, 'runtime', '_printi', [i32], [])
+        self._printf = WasmImportedFunction(self.module, 'runtime', '_printf', [f64], [])
+        self._printb = WasmImportedFunction(self.module, 'runtime', '_printb', [i32], [])
+        self._printc = WasmImportedFunction(self.module, 'runtime', '_printc', [i32], [])
+        self._printu = WasmImportedFunction(self.module, 'runtime', '_printu', [], [])
+
+        self.functions = {}     # Wabbit name -> WasmFunction
+        self.globals = {}       # declaration -> WasmGlobalVariable
+        self.locals = {}        # declaration -> local index
+        self.env = ChainMap()   # Wabbit name -> declaration
+        self.function = None    # Function being generated
+
+    def declare_function(self, node):
+        # Wabbit's main() is called by the exported main, which runs the
+        # top-level statements first
+        func = WasmFunction(self.module, node.name,
+                            [_wasm_types[p.type] for p in node.params],
+                            [_wasm_types[node.type]], export=node.name != 'main')
+        self.functions[node.name] = func
+
+    def declare_global(self, node):
+        wtype = _wasm_types[node.type]
+        self.globals[node] = WasmGlobalVariable(self.module, node.name, wtype,
+                                                0 if wtype == i32 else 0.0)
+
+    def emit(self, *instruction):
+        self.function.code.append(instruction)
 
 # Top-level function for generating code from the model
 def generate_program(model):
+    '''
+    Generate a module for a type checked program.  The top-level
+    statements go in the exported function main(), which calls the
+    Wabbit function main() at the end if there is one.
+    '''
     mod = WabbitWasmModule()
+    for node in model:
+        if isinstance(node, FunctionDefinition):
+            mod.declare_function(node)
+        elif isinstance(node, (DeclareConst, DeclareVar)):
+            mod.declare_global(node)
+
+    mod.function = WasmFunction(mod.module, 'main', [], [])
     generate(model, mod)
+    if 'main' in mod.functions:
+        mod.emit('call', mod.functions['main'].idx)
+        mod.emit('drop')
     return mod
 
 # Internal function for generating code on each node
 def generate(node, mod):
-    raise RuntimeError(f"Can't generate {node}")
+    if isinstance(node, list):
+        for stmt in node:
+            generate(stmt, mod)
+
+    elif isinstance(node, Integer):
+        mod.emit('i32.const', int(node.value))
+
+    elif isinstance(node, Float):
+        mod.emit('f64.const', float(node.value))
+
+    elif isinstance(node, UnaryOp):
+        if node.op == '+':
+            generate(node.operand, mod)
+        elif node.type == 'float':
+            generate(node.operand, mod)
+            mod.emit('f64.neg')
+        elif node.op == '-':
+            mod.emit('i32.const', 0)
+            generate(node.operand, mod)
+            mod.emit('i32.sub')
+        else:
+            raise RuntimeError(f"Cannot generate UnaryOp operator {node}")
 
-def main(filename):
+    elif isinstance(node, BinOp) and node.op in ('&&', '||'):
+        # Short-circuit evaluation: the right operand runs in an if
+        generate(node.left, mod)
+        mod.emit('if', i32)
+        if node.op == '&&':
+            generate(node.right, mod)
+            mod.emit('else')
+            mod.emit('i32.const', 0)
+        else:
+            mod.emit('i32.const', 1)
+            mod.emit('else')
+            generate(node.right, mod)
+        mod.emit('end')
+
+    elif isinstance(node, BinOp):
+        generate(node.left, mod)
+        generate(node.right, mod)
+        instruction = _binop_instructions.get(node.left.type, {}).get(node.op)
+        if instruction is None:
+            raise RuntimeError(f"Cannot generate BinOp operator {node}")
+        mod.emit(instruction)
+
+    elif isinstance(node, Print):
+        generate(node.expression, mod)
+        node_type = node.expression.type
+        if node_type == 'int':
+            mod.emit('call', mod._printi.idx)
+        elif node_type == 'float':
+            mod.emit('call', mod._printf.idx)
+        elif node_type == 'bool':
+            mod.emit('call', mod._printb.idx)
+        elif node_type == 'char':
+            mod.emit('call', mod._printc.idx)
+        else:
+            raise RuntimeError(f"Cannot print expression {node}")
+
+    elif isinstance(node, (DeclareConst, DeclareVar)):
+        wtype = _wasm_types[node.type]
+        if node.value:
+            generate(node.value, mod)
+        else:
+            # Uninitialized variables start out as zero
+            mod.emit(*_zero[wtype])
+        if node in mod.globals:
+            mod.emit('global.set', mod.globals[node].idx)
+        else:
+            mod.locals[node] = mod.function.alloca(wtype)
+            mod.emit('local.set', mod.locals[node])
+        mod.env[node.name] = node
+
+    elif isinstance(node, Load):
+        var = mod.env[node.location]
+        if var in mod.globals:
+            mod.emit('global.get', mod.globals[var].idx)
+        else:
+            mod.emit('local.get', mod.locals[var])
+
+    elif isinstance(node, Assignment):
+        generate(node.value, mod)
+        var = mod.env[node.location]
+        if var in mod.globals:
+            mod.emit('global.set', mod.globals[var].idx)
+        else:
+            mod.emit('local.set', mod.locals[var])
+
+    elif isinstance(node, ExprAsStatement):
+        generate(node.expression, mod)
+        # Every expression leaves a value
+        mod.emit('drop')
+
+    elif isinstance(node, FunctionDefinition):
+        function, env = mod.function, mod.env
+        mod.function = mod.functions[node.name]
+
+        # Functions see the top-level scope and their parameters, which
+        # are the first locals
+        mod.env = ChainMap({}, env.maps[-1])
+        for n, param in enumerate(node.params):
+            mod.env[param.name] = param
+            mod.locals[param] = n
+        generate(node.body, mod)
+        # Falling off the end of a function returns zero
+        mod.emit(*_zero[mod.function.rettypes[0]])
+        mod.function, mod.env = function, env
+
+    elif isinstance(node, Return):
+        generate(node.value, mod)
+        mod.emit('return')
+
+    elif isinstance(node, FunctionCall):
+        for arg in node.arguments:
+            generate(arg, mod)
+        mod.emit('call', mod.functions[node.name].idx)
+
+    elif isinstance(node, IfStatement):
+        generate(node.condition, mod)
+        mod.emit('if', None)
+        mod.env = mod.env.new_child()
+        generate(node.consequence, mod)
+        mod.env = mod.env.parents
+        if node.alternative:
+            mod.emit('else')
+            mod.env = mod.env.new_child()
+            generate(node.alternative, mod)
+            mod.env = mod.env.parents
+        mod.emit('end')
+
+    elif isinstance(node, WhileLoop):
+        # block { loop { if !cond break; body; continue } }
+        mod.emit('block', None)
+        mod.emit('loop', None)
+        generate(node.condition, mod)
+        mod.emit('i32.eqz')
+        mod.emit('br_if', 1)
+        mod.env = mod.env.new_child()
+        generate(node.body, mod)
+        mod.env = mod.env.parents
+        mod.emit('br', 0)
+        mod.emit('end')
+        mod.emit('end')
+
+    else:
+        raise RuntimeError(f"Can't generate {node}")
+
+# ---- Optimization
+#
+# The generator above is deliberately simple: every variable gets a
+# local of its own, values are stored and immediately loaded again, and
+# constant expressions are computed at run time.  optimize_module()
+# cleans this up on the instruction lists before encoding:
+#
+#   - constant instruction sequences are folded, using the same
+#     wrapping and truncating semantics as the i32/f64 instructions
+#   - ifs and br_ifs with a constant condition are resolved, code after
+#     br/return is removed, and blocks that are empty or never branched
+#     to are unwrapped
+#   - local.set n; local.get n becomes local.tee n, and locals that are
+#     never read are dropped
+#   - locals of the same type whose live ranges don't overlap share one
+#     index
+
+def _wrap(value):
+    return (value + 0x80000000) % 0x100000000 - 0x80000000
+
+def _div_s(a, b):
+    # i32.div_s traps on these, so leave them for run time
+    if b == 0 or (a == -0x80000000 and b == -1):
+        return None
+    quotient = abs(a) // abs(b)
+    return quotient if (a < 0) == (b < 0) else -quotient
+
+def _fdiv(a, b):
+    return None if b == 0 else a / b
+
+# Instruction -> (type of the result, function of the two constants)
+_folders = {
+    'i32.add': ('i32.const', lambda a, b: _wrap(a + b)),
+    'i32.sub': ('i32.const', lambda a, b: _wrap(a - b)),
+    'i32.mul': ('i32.const', lambda a, b: _wrap(a * b)),
+    'i32.div_s': ('i32.const', _div_s),
+    'i32.and': ('i32.const', lambda a, b: a & b),
+    'i32.or': ('i32.const', lambda a, b: a | b),
+    'i32.eq': ('i32.const', lambda a, b: int(a == b)),
+    'i32.ne': ('i32.const', lambda a, b: int(a != b)),
+    'i32.lt_s': ('i32.const', lambda a, b: int(a < b)),
+    'i32.gt_s': ('i32.const', lambda a, b: int(a > b)),
+    'i32.le_s': ('i32.const', lambda a, b: int(a <= b)),
+    'i32.ge_s': ('i32.const', lambda a, b: int(a >= b)),
+    'f64.add': ('f64.const', lambda a, b: a + b),
+    'f64.sub': ('f64.const', lambda a, b: a - b),
+    'f64.mul': ('f64.const', lambda a, b: a * b),
+    'f64.div': ('f64.const', _fdiv),
+    'f64.eq': ('i32.const', lambda a, b: int(a == b)),
+    'f64.ne': ('i32.const', lambda a, b: int(a != b)),
+    'f64.lt': ('i32.const', lambda a, b: int(a < b)),
+    'f64.gt': ('i32.const', lambda a, b: int(a > b)),
+    'f64.le': ('i32.const', lambda a, b: int(a <= b)),
+    'f64.ge': ('i32.const', lambda a, b: int(a >= b)),
+}
+
+# Instructions that only push a value, so pushing and dropping it does nothing
+_pure_pushes = {'i32.const', 'f64.const', 'local.get', 'global.get'}
+
+def _peephole(code):
+    out = []
+    for ins in code:
+        name = ins[0]
+        if name in _folders and len(out) >= 2:
+            const = name[:3] + '.const'
+            if out[-1][0] == const and out[-2][0] == const:
+                result, func = _folders[name]
+                value = func(out[-2][1], out[-1][1])
+                if value is not None:
+                    out[-2:] = [(result, value)]
+                    continue
+        elif name == 'i32.eqz' and out and out[-1][0] == 'i32.const':
+            out[-1] = ('i32.const', int(out[-1][1] == 0))
+            continue
+        elif name == 'f64.neg' and out and out[-1][0] == 'f64.const':
+            out[-1] = ('f64.const', -out[-1][1])
+            continue
+        elif name == 'drop' and out:
+            if out[-1][0] in _pure_pushes:
+                out.pop()
+                continue
+            elif out[-1][0] == 'local.tee':
+                out[-1] = ('local.set', out[-1][1])
+                continue
+        elif name == 'local.get' and out and out[-1] == ('local.set', ins[1]):
+            out[-1] = ('local.tee', ins[1])
+            continue
+        out.append(ins)
+    return out
+
+def _parse_blocks(code, pos=0):
+    # Turn the flat instructions into a tree, where blocks and loops are
+    # (name, blocktype, body) and ifs are ('if', blocktype, then, else).
+    # Returns the body and the position of the else/end that closed it.
+    body = []
+    while pos < len(code):
+        ins = code[pos]
+        name = ins[0]
+        if name in ('else', 'end'):
+            return body, pos
+        elif name in ('block', 'loop'):
+            inner, pos = _parse_blocks(code, pos + 1)
+            body.append((name, ins[1], inner))
+        elif name == 'if':
+            then, pos = _parse_blocks(code, pos + 1)
+            orelse = None
+            if code[pos][0] == 'else':
+                orelse, pos = _parse_blocks(code, pos + 1)
+            body.append(('if', ins[1], then, orelse))
+        else:
+            body.append(ins)
+        pos += 1
+    return body, pos
+
+def _flatten(body, out):
+    for item in body:
+        name = item[0]
+        if name in ('block', 'loop'):
+            out.append((name, item[1]))
+            _flatten(item[2], out)
+            out.append(('end',))
+        elif name == 'if':
+            out.append(('if', item[1]))
+            _flatten(item[2], out)
+            if item[3] is not None:
+                out.append(('else',))
+                _flatten(item[3], out)
+            out.append(('end',))
+        else:
+            out.append(item)
+    return out
+
+def _targets(body, depth=0):
+    # Does anything in body branch to the label depth levels out?
+    for item in body:
+        name = item[0]
+        if name in ('br', 'br_if'):
+            if item[1] == depth:
+                return True
+        elif name in ('block', 'loop'):
+            if _targets(item[2], depth + 1):
+                return True
+        elif name == 'if':
+            if _targets(item[2], depth + 1) or (item[3] and _targets(item[3], depth + 1)):
+                return True
+    return False
+
+def _unwrap(body, depth=0):
+    # Remove one level of label around body, fixing up branches that
+    # go past it
+    out = []
+    for item in body:
+        name = item[0]
+        if name in ('br', 'br_if'):
+            out.append((name, item[1] - 1) if item[1] > depth else item)
+        elif name in ('block', 'loop'):
+            out.append((name, item[1], _unwrap(item[2], depth + 1)))
+        elif name == 'if':
+            out.append(('if', item[1], _unwrap(item[2], depth + 1),
+                        item[3] and _unwrap(item[3], depth + 1)))
+        else:
+            out.append(item)
+    return out
+
+def _drop_final_br(body):
+    # Branching to the end of a block from its end does nothing
+    while body and body[-1] == ('br', 0):
+        body.pop()
+    return body
+
+def _simplify(body):
+    out = []
+    for item in body:
+        name = item[0]
+        if name == 'if':
+            then = _drop_final_br(_simplify(item[2]))
+            orelse = _drop_final_br(_simplify(item[3])) if item[3] else None
+            if out and out[-1][0] == 'i32.const':
+                # Constant condition.  Keep the arm that runs as a block.
+                name, item = 'block', ('block', item[1], then if out.pop()[1] else orelse or [])
+            elif not then and not orelse:
+                out.append(('drop',))
+                continue
+            elif not then:
+                out.append(('i32.eqz',))
+                item = ('if', item[1], orelse, None)
+            else:
+                item = ('if', item[1], then, orelse or None)
+        if name in ('block', 'loop'):
+            inner = _simplify(item[2])
+            if name == 'block':
+                _drop_final_br(inner)
+            if not _targets(inner):
+                out.extend(_unwrap(inner))
+                if out and out[-1][0] in ('br', 'return', 'unreachable'):
+                    break
+                continue
+            item = (name, item[1], inner)
+        elif name == 'br_if' and out and out[-1][0] == 'i32.const':
+            if not out.pop()[1]:
+                continue
+            item = ('br', item[1])
+        out.append(item)
+        # The rest of the body can't be reached
+        if item[0] in ('br', 'return', 'unreachable'):
+            break
+    return out
+
+def _successors(code):
+    # Indices of the instructions that can run after each one
+    succs = []
+    stack, ends, elses = [], {}, {}
+    for n, ins in enumerate(code):
+        if ins[0] in ('block', 'loop', 'if'):
+            stack.append(n)
+        elif ins[0] == 'else':
+            elses[stack[-1]] = n
+        elif ins[0] == 'end':
+            ends[stack.pop()] = n
+
+    def target(start):
+        return start if code[start][0] == 'loop' else ends[start]
+
+    for n, ins in enumerate(code):
+        name = ins[0]
+        nxt = [n + 1] if n + 1 < len(code) else []
+        if name in ('block', 'loop', 'if'):
+            stack.append(n)
+            if name == 'if':
+                nxt.append(elses[n] + 1 if n in elses else ends[n])
+        elif name == 'else':
+            nxt = [ends[stack[-1]]]
+        elif name == 'end':
+            stack.pop()
+        elif name in ('br', 'br_if'):
+            # Branching out of the function body is a return
+            depth = ins[1]
+            labels = [target(stack[-1 - depth])] if depth < len(stack) else []
+            nxt = labels + nxt if name == 'br_if' else labels
+        elif name in ('return', 'unreachable'):
+            nxt = []
+        succs.append(nxt)
+    return succs
+
+def _coalesce_locals(func):
+    # Give locals of the same type that are never live at the same time
+    # the same index.  Liveness is kept as bitmasks of local indices.
+    code = func.code
+    nparams = len(func.argtypes)
+    types = func.argtypes + func.local_types
+    succs = _successors(code)
+    uses, defs = [0] * len(code), [0] * len(code)
+    for n, ins in enumerate(code):
+        if ins[0] == 'local.get':
+            uses[n] = 1 << ins[1]
+        elif ins[0] in ('local.set', 'local.tee'):
+            defs[n] = 1 << ins[1]
+
+    live_in = [0] * len(code)
+    live_out = [0] * len(code)
+    changed = True
+    while changed:
+        changed = False
+        for n in reversed(range(len(code))):
+            out = 0
+            for s in succs[n]:
+                out |= live_in[s]
+            live_out[n] = out
+            new_in = (out & ~defs[n]) | uses[n]
+            if new_in != live_in[n]:
+                live_in[n] = new_in
+                changed = True
+
+    # A local is set while another one is live.  Parameters are set on
+    # entry, and locals read before being set rely on starting at zero,
+    # so those keep an index of their own.
+    entry = live_in[0] if code else 0
+    interference = [0] * len(types)
+    for n in range(nparams):
+        interference[n] = entry
+    for n in range(len(code)):
+        if defs[n]:
+            interference[defs[n].bit_length() - 1] |= live_out[n]
+    used = 0
+    for n in range(len(code)):
+        used |= uses[n] | defs[n]
+
+    members = [1 << n for n in range(nparams)]
+    conflicts = [interference[n] for n in range(nparams)]
+    slot_types = list(func.argtypes)
+    mapping = {n: n for n in range(nparams)}
+    private = set()
+    for n in range(nparams, len(types)):
+        if not used >> n & 1:
+            continue
+        bit = 1 << n
+        slot = None
+        if not entry & bit:
+            for s in range(len(members)):
+                if (slot_types[s] == types[n] and s not in private
+                    and not interference[n] & members[s] and not conflicts[s] & bit):
+                    slot = s
+                    break
+        if slot is None:
+            slot = len(members)
+            if entry & bit:
+                private.add(slot)
+            members.append(0)
+            conflicts.append(0)
+            slot_types.append(types[n])
+        members[slot] |= bit
+        conflicts[slot] |= interference[n]
+        mapping[n] = slot
+
+    # Number the new locals by type, so they're declared in two runs
+    order = sorted(range(nparams, len(members)), key=lambda s: (slot_types[s] != i32, s))
+    renumber = {s: nparams + k for k, s in enumerate(order)}
+    renumber.update((s, s) for s in range(nparams))
+    func.local_types = [slot_types[s] for s in order]
+    func.code = [(ins[0], renumber[mapping[ins[1]]])
+                 if ins[0] in ('local.get', 'local.set', 'local.tee') else ins
+                 for ins in code]
+
+def _remove_dead_stores(code):
+    # Locals that are never read don't need to be written
+    read = {ins[1] for ins in code if ins[0] == 'local.get'}
+    out = []
+    for ins in code:
+        if ins[0] in ('local.set', 'local.tee') and ins[1] not in read:
+            if ins[0] == 'local.set':
+                out.append(('drop',))
+        else:
+            out.append(ins)
+    return out
+
+def optimize_function(func):
+    code = func.code
+    while True:
+        new_code = _peephole(_flatten(_simplify(_parse_blocks(_peephole(code))[0]), []))
+        new_code = _peephole(_remove_dead_stores(new_code))
+        if new_code == code:
+            break
+        code = new_code
+    func.code = code
+    _coalesce_locals(func)
+
+def optimize_module(module):
+    '''
+    Optimize the code of every function in a WasmModule in place.
+    '''
+    for func in module.functions:
+        optimize_function(func)
+
+def main(argv):
+    import argparse
     from .parse import parse_file
     from .typecheck import check_program
-    model = parse_file(filename)
-    check_program(model):
+    from .transform import transform
+
+    parser = argparse.ArgumentParser(prog='wabbit.wasm')
+    parser.add_argument('filename')
+    parser.add_argument('--run', action='store_true',
+                        help='run the module with wabbit.wasmrun instead of writing out.wasm')
+    args = parser.parse_args(argv)
+
+    model = parse_file(args.filename)
+    check_program(model).exit_on_errors()
+    model = transform(model)
     mod = generate_program(model)
+    optimize_module(mod.module)
+    data = encode_module(mod.module)
+    if args.run:
+        from .wasmrun import run_wasm
+        run_wasm(data)
+        return
     with open('out.wasm', 'wb') as file:
-        file.write(encode_module(mod.module))
+        file.write(data)
     print("Wrote out.wasm")
 
 if __name__ == '__main__':
     import sys
-    main(sys.argv[1])
-
-        
-        
-
-    
-
-                   
+    main(sys.argv[1:])
@@ -0,0 +1,485 @@
+# wasmrun.py
+#
+# Run the Wasm modules made by wabbit/wasm.py without a browser.
+# html/test.html needs a web server and fetch() to load out.wasm.  This
+# runs it from the command line instead:
+#
+#     python3 -m wabbit.wasmrun out.wasm
+#
+# If the wasmtime package is installed it is used to run the module.
+# Otherwise the module is decoded and run by a small interpreter in
+# this file, which handles the instructions that wasm.py emits (see
+# _opcodes in wasm.py) and nothing more.  Either way, the module gets
+# the same "runtime" imports as in html/test.html, except that output
+# is collected and written out in one go at the end.
+
+import math
+import struct
+import sys
+
+from .wasm import (_opcodes, WasmModule, WasmImportedFunction, WasmFunction,
+                   WasmGlobalVariable, i32, f64)
+
+try:
+    import wasmtime
+except ImportError:
+    wasmtime = None
+
+class WasmTrap(RuntimeError):
+    pass
+
+# ---- The runtime imports
+
+class WasmRuntime:
+    '''
+    The "runtime" functions imported by modules from wasm.py.  Output is
+    kept in a list of strings until flush() is called.  Numbers are
+    formatted like in the .out files in tests/.
+    '''
+    def __init__(self, file=None):
+        self.file = file
+        self.parts = []
+
+    def _printi(self, x):
+        self.parts.append(f'{x}\n')
+
+    def _printf(self, x):
+        self.parts.append(f'{x:f}\n')
+
+    def _printb(self, x):
+        self.parts.append('true\n' if x else 'false\n')
+
+    def _printc(self, x):
+        self.parts.append(chr(x))
+
+    def _printu(self):
+        self.parts.append('()\n')
+
+    def flush(self):
+        file = self.file or sys.stdout
+        file.write(''.join(self.parts))
+        file.flush()
+        self.parts = []
+
+# ---- Decoding
+
+_instructions = {opcode: (name, kind) for name, (opcode, kind) in _opcodes.items()}
+
+class _Reader:
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def byte(self):
+        self.pos += 1
+        return self.data[self.pos - 1]
+
+    def unsigned(self):
+        result = shift = 0
+        while True:
+            byte = self.byte()
+            result |= (byte & 0x7f) << shift
+            shift += 7
+            if not byte & 0x80:
+                return result
+
+    def signed(self):
+        result = shift = 0
+        while True:
+            byte = self.byte()
+            result |= (byte & 0x7f) << shift
+            shift += 7
+            if not byte & 0x80:
+                if byte & 0x40:
+                    result -= 1 << shift
+                return result
+
+    def f64(self):
+        self.pos += 8
+        return struct.unpack_from('<d', self.data, self.pos - 8)[0]
+
+    def name(self):
+        size = self.unsigned()
+        self.pos += size
+        return bytes(self.data[self.pos - size:self.pos]).decode('utf-8')
+
+    def code(self):
+        # Instructions up to the end of a function body or constant expression
+        code = []
+        depth = 0
+        while True:
+            opcode = self.byte()
+            if opcode not in _instructions:
+                raise WasmTrap(f'Unsupported instruction 0x{opcode:02x}')
+            name, kind = _instructions[opcode]
+            if name == 'end':
+                if depth == 0:
+                    return code
+                depth -= 1
+            elif name in ('block', 'loop', 'if'):
+                depth += 1
+            if kind is None:
+                code.append((name,))
+            elif kind == 'u':
+                code.append((name, self.unsigned()))
+            elif kind == 's':
+                code.append((name, self.signed()))
+            elif kind == 'f':
+                code.append((name, self.f64()))
+            else:
+                blocktype = self.byte()
+                code.append((name, None if blocktype == 0x40 else blocktype))
+
+def decode_module(data):
+    '''
+    Decode a binary module into the WasmModule classes of wasm.py.
+    Function names come from the exports.  Only the sections that wasm.py
+    writes are understood.
+    '''
+    reader = _Reader(data)
+    if bytes(data[:8]) != b'\x00asm\x01\x00\x00\x00':
+        raise WasmTrap('Not a Wasm module')
+    reader.pos = 8
+    module = WasmModule('wasm')
+    types = []
+    while reader.pos < len(data):
+        section = reader.byte()
+        size = reader.unsigned()
+        end = reader.pos + size
+        if section == 1:
+            for _ in range(reader.unsigned()):
+                reader.byte()   # 0x60
+                argtypes = [reader.byte() for _ in range(reader.unsigned())]
+                rettypes = [reader.byte() for _ in range(reader.unsigned())]
+                types.append((argtypes, rettypes))
+        elif section == 2:
+            for _ in range(reader.unsigned()):
+                envname, name = reader.name(), reader.name()
+                if reader.byte() != 0x00:
+                    raise WasmTrap(f'Unsupported import {envname}.{name}')
+                WasmImportedFunction(module, envname, name, *types[reader.unsigned()])
+        elif section == 3:
+            for _ in range(reader.unsigned()):
+                func = WasmFunction(module, None, *types[reader.unsigned()], export=False)
+                func.name = f'func{func.idx}'
+        elif section == 6:
+            for _ in range(reader.unsigned()):
+                gtype = reader.byte()
+                reader.byte()   # Mutability
+                (_, initializer), = reader.code()
+                WasmGlobalVariable(module, f'global{len(module.global_variables)}',
+                                   gtype, initializer)
+        elif section == 7:
+            for _ in range(reader.unsigned()):
+                name = reader.name()
+                kind, idx = reader.byte(), reader.unsigned()
+                if kind == 0x00:
+                    func = module.functions[idx - len(module.imported_functions)]
+                    func.name = name
+                    func.export = True
+        elif section == 10:
+            reader.unsigned()       # Number of bodies, one per function
+            for func in module.functions:
+                reader.unsigned()   # Size of the body
+                for _ in range(reader.unsigned()):
+                    count, ltype = reader.unsigned(), reader.byte()
+                    func.local_types.extend([ltype] * count)
+                func.code = reader.code()
+        reader.pos = end
+    return module
+
+# ---- The interpreter
+
+def _wrap(value):
+    return (value + 0x80000000) % 0x100000000 - 0x80000000
+
+def _fdiv(a, b):
+    if b != 0:
+        return a / b
+    elif a == 0 or a != a:
+        return math.nan
+    return math.copysign(math.inf, a) * math.copysign(1.0, b)
+
+# Stack effect (pops, pushes) of the instructions other than calls
+_effects = {
+    'unreachable': (0, 0), 'block': (0, 0), 'loop': (0, 0), 'if': (1, 0),
+    'else': (0, 0), 'end': (0, 0), 'br': (0, 0), 'br_if': (1, 0), 'return': (0, 0),
+    'drop': (1, 0), 'local.get': (0, 1), 'local.set': (1, 0), 'local.tee': (1, 1),
+    'global.get': (0, 1), 'global.set': (1, 0), 'i32.const': (0, 1), 'f64.const': (0, 1),
+    'i32.eqz': (1, 1), 'f64.neg': (1, 1),
+}
+
+class _Function:
+    '''
+    A function prepared for running.  The instructions become
+    (opcode, argument) pairs, with block, loop and end left out and
+    every branch turned into the position to continue at, the stack
+    height of its label and the number of values it carries.
+    '''
+    def __init__(self, func, functions):
+        self.nparams = len(func.argtypes)
+        self.nresults = len(func.rettypes)
+        self.zeros = [0.0 if ltype == f64 else 0 for ltype in func.local_types]
+
+        code = func.code
+        # Position of each instruction once the no-ops are removed
+        position = []
+        count = 0
+        for ins in code:
+            position.append(count)
+            if ins[0] not in ('block', 'loop', 'end'):
+                count += 1
+        position.append(count)
+
+        # Match up the structured instructions
+        stack, ends, elses = [], {}, {}
+        for n, ins in enumerate(code):
+            if ins[0] in ('block', 'loop', 'if'):
+                stack.append(n)
+            elif ins[0] == 'else':
+                elses[stack[-1]] = n
+            elif ins[0] == 'end':
+                ends[stack.pop()] = n
+
+        # Labels are (start, height, arity); the function body is the
+        # outermost one
+        labels = [(None, 0, self.nresults)]
+        height = 0
+        self.code = []
+        for n, ins in enumerate(code):
+            name = ins[0]
+            if name == 'call':
+                callee = functions[ins[1]]
+                pops, pushes = len(callee.argtypes), len(callee.rettypes)
+            else:
+                pops, pushes = _effects.get(name, (2, 1) if name in _binary else (0, 0))
+            height -= pops
+
+            if name in ('block', 'loop', 'if'):
+                labels.append((n, height, 0 if ins[1] is None else 1))
+            elif name == 'end':
+                start, height, arity = labels.pop()
+                height += arity
+                continue
+            if name in ('block', 'loop'):
+                continue
+
+            if name == 'if':
+                arg = position[elses[n]] + 1 if n in elses else position[ends[n]]
+            elif name == 'else':
+                arg = position[ends[labels[-1][0]]]
+                start, height, arity = labels[-1]
+            elif name in ('br', 'br_if'):
+                start, label_height, arity = labels[-1 - ins[1]]
+                if start is None:
+                    target = position[-1]
+                elif code[start][0] == 'loop':
+                    target, arity = position[start], 0
+                else:
+                    target = position[ends[start]]
+                arg = (target, label_height, arity)
+            else:
+                arg = ins[1] if len(ins) > 1 else None
+            self.code.append((_opcodes[name][0], arg))
+            height += pushes
+            if name in ('br', 'return', 'unreachable'):
+                # The stack is polymorphic until the end of the block
+                height = labels[-1][1]
+
+_binary = {name for name, (opcode, kind) in _opcodes.items()
+           if kind is None and (name.startswith('i32.') or name.startswith('f64.'))
+           and name not in ('i32.eqz', 'f64.neg')}
+
+class WasmInstance:
+    '''
+    A decoded module, ready to run with the given imports, a dict of
+    (module, name) -> Python function.
+    '''
+    def __init__(self, module, imports):
+        functions = module.imported_functions + module.functions
+        # Imported functions are (Python function, number of arguments)
+        self.functions = [(imports[func.envname, func.name], len(func.argtypes))
+                          for func in module.imported_functions]
+        self.functions += [_Function(func, functions) for func in module.functions]
+        self.exports = {func.name: self.functions[func.idx]
+                        for func in module.functions if func.export}
+        self.globals = [gvar.initializer for gvar in module.global_variables]
+
+    def call(self, name, *args):
+        result = self.execute(self.exports[name], list(args))
+        return result[0] if len(result) == 1 else None
+
+    def execute(self, func, args):
+        local = args + func.zeros
+        gvars = self.globals
+        functions = self.functions
+        code = func.code
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        pc = 0
+        end = len(code)
+        while pc < end:
+            op, arg = code[pc]
+            pc += 1
+            if op == 0x20:          # local.get
+                push(local[arg])
+            elif op == 0x21:        # local.set
+                local[arg] = pop()
+            elif op == 0x41 or op == 0x44:    # i32.const, f64.const
+                push(arg)
+            elif op == 0x22:        # local.tee
+                local[arg] = stack[-1]
+            elif op == 0x23:        # global.get
+                push(gvars[arg])
+            elif op == 0x24:        # global.set
+                gvars[arg] = pop()
+            elif op == 0x6a:        # i32.add
+                b = pop()
+                value = pop() + b
+                push(value if -0x80000000 <= value <= 0x7fffffff else _wrap(value))
+            elif op == 0x6b:        # i32.sub
+                b = pop()
+                value = pop() - b
+                push(value if -0x80000000 <= value <= 0x7fffffff else _wrap(value))
+            elif op == 0x6c:        # i32.mul
+                b = pop()
+                value = pop() * b
+                push(value if -0x80000000 <= value <= 0x7fffffff else _wrap(value))
+            elif op == 0xa0:        # f64.add
+                b = pop()
+                push(pop() + b)
+            elif op == 0xa1:        # f64.sub
+                b = pop()
+                push(pop() - b)
+            elif op == 0xa2:        # f64.mul
+                b = pop()
+                push(pop() * b)
+            elif op == 0x0d:        # br_if
+                if pop():
+                    target, height, arity = arg
+                    if len(stack) != height + arity:
+                        del stack[height:len(stack) - arity]
+                    pc = target
+            elif op == 0x0c:        # br
+                target, height, arity = arg
+                if len(stack) != height + arity:
+                    del stack[height:len(stack) - arity]
+                pc = target
+            elif op == 0x04:        # if
+                if not pop():
+                    pc = arg
+            elif op == 0x05:        # else, reached from the end of the then part
+                pc = arg
+            elif op == 0x45:        # i32.eqz
+                push(int(not pop()))
+            elif 0x46 <= op <= 0x4e or 0x61 <= op <= 0x66:    # comparisons
+                b = pop()
+                a = pop()
+                if op == 0x46 or op == 0x61:
+                    push(int(a == b))
+                elif op == 0x47 or op == 0x62:
+                    push(int(a != b))
+                elif op == 0x48 or op == 0x63:
+                    push(int(a < b))
+                elif op == 0x4a or op == 0x64:
+                    push(int(a > b))
+                elif op == 0x4c or op == 0x65:
+                    push(int(a <= b))
+                else:
+                    push(int(a >= b))
+            elif op == 0x10:        # call
+                callee = functions[arg]
+                if callee.__class__ is _Function:
+                    n = callee.nparams
+                    args = stack[len(stack) - n:] if n else []
+                    if n:
+                        del stack[-n:]
+                    stack.extend(self.execute(callee, args))
+                else:
+                    callee, nargs = callee
+                    args = stack[len(stack) - nargs:] if nargs else []
+                    if nargs:
+                        del stack[-nargs:]
+                    result = callee(*args)
+                    if result is not None:
+                        push(result)
+            elif op == 0x1a:        # drop
+                pop()
+            elif op == 0x0f:        # return
+                break
+            elif op == 0x6d:        # i32.div_s
+                b = pop()
+                a = pop()
+                if b == 0:
+                    raise WasmTrap('integer divide by zero')
+                if a == -0x80000000 and b == -1:
+                    raise WasmTrap('integer overflow')
+                quotient = abs(a) // abs(b)
+                push(quotient if (a < 0) == (b < 0) else -quotient)
+            elif op == 0xa3:        # f64.div
+                b = pop()
+                push(_fdiv(pop(), b))
+            elif op == 0x71:        # i32.and
+                b = pop()
+                push(pop() & b)
+            elif op == 0x72:        # i32.or
+                b = pop()
+                push(pop() | b)
+            elif op == 0x9a:        # f64.neg
+                push(-pop())
+            elif op == 0x00:        # unreachable
+                raise WasmTrap('unreachable')
+            else:
+                raise WasmTrap(f'Unsupported instruction 0x{op:02x}')
+        return stack[len(stack) - func.nresults:] if func.nresults else []
+
+# ---- Running
+
+def _run_python(data, runtime):
+    module = decode_module(data)
+    imports = {('runtime', name): getattr(runtime, name)
+               for name in ('_printi', '_printf', '_printb', '_printc', '_printu')}
+    WasmInstance(module, imports).call('main')
+
+def _run_wasmtime(data, runtime):
+    store = wasmtime.Store()
+    module = wasmtime.Module(store.engine, data)
+    imports = [wasmtime.Func(store, imp.type, getattr(runtime, imp.name))
+               for imp in module.imports]
+    instance = wasmtime.Instance(store, module, imports)
+    instance.exports(store)['main'](store)
+
+def run_wasm(data, engine=None, file=None):
+    '''
+    Run the exported main() of a binary module, writing its output to
+    file (sys.stdout by default).  engine is 'wasmtime' or 'python'; the
+    default is wasmtime when it is installed.
+    '''
+    if engine is None:
+        engine = 'python' if wasmtime is None else 'wasmtime'
+    runtime = WasmRuntime(file)
+    try:
+        if engine == 'wasmtime':
+            if wasmtime is None:
+                raise RuntimeError('The wasmtime package is not installed')
+            _run_wasmtime(data, runtime)
+        elif engine == 'python':
+            _run_python(data, runtime)
+        else:
+            raise ValueError(f'Unknown engine {engine!r}')
+    finally:
+        runtime.flush()
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(prog='wabbit.wasmrun')
+    parser.add_argument('filename', help='a .wasm file made by wabbit.wasm')
+    parser.add_argument('--engine', choices=('wasmtime', 'python'),
+                        help='default: wasmtime if installed, else python')
+    args = parser.parse_args(argv)
+    with open(args.filename, 'rb') as file:
+        run_wasm(file.read(), args.engine)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])